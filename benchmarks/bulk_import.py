@@ -0,0 +1,106 @@
+"""Benchmark: importing a long watch list through `POST /bulk`.
+
+The body is an NDJSON watch list, a tenth of its URLs repeat. The report contains
+how long the import took, its sites per second and how long a second worker,
+which follows the watch list through notifications, took to start all the sites.
+The schedulers of both workers are not started, so checks of the new sites
+don't compete with the import.
+
+Run from the repository root against a disposable database:
+    python benchmarks/bulk_import.py --sites 100000
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import logging
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from common import MIGRATIONS_DIR, quiet, sites_parser
+from monmon.db.db_connector import DbConnector
+from monmon.db.metrics_sink import MetricsSink
+from monmon.requester.client import HttpClient
+from monmon.watchdog.sync import WatchListSync
+from monmon.watchdog.watcher import Watcher
+from monmon.web_server.server import WebServer
+
+
+def body(sites: int) -> bytes:
+    """An NDJSON watch list where every tenth URL repeats"""
+    lines = (
+        json.dumps(
+            {
+                "url": f"http://127.0.0.1:9/{site - site % 10 if site % 10 == 9 else site}",
+                "regexp": "[0-9]{4}",
+                "check_interval_sec": 300,
+            }
+        )
+        for site in range(sites)
+    )
+    return "\n".join(lines).encode()
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Import the list through the API of one worker while another one follows it"""
+    cfg = configparser.ConfigParser()
+    cfg.read("src/monmon/config.ini")
+    dsn = cfg["database"].get("test_pg_dsn")
+    db_conn = DbConnector(dsn, MIGRATIONS_DIR)
+    await db_conn.apply_migrations()
+
+    metrics_sink = MetricsSink(db_conn)
+    metrics_sink.start()
+    http_client = HttpClient(timeout_sec=5)
+    watcher = Watcher(http_client, metrics_sink, conditional_requests=False)
+    follower = Watcher(http_client, metrics_sink, conditional_requests=False)
+    for idle in (watcher, follower):
+        idle.scheduler.start = lambda: None  # type: ignore[method-assign]
+    sync = WatchListSync(db_conn, follower, resync_sec=3600)
+    await sync.start()
+    server = WebServer("localhost", 0, watcher, db_conn, bulk_chunk_size=args.chunk)
+    client = TestClient(TestServer(server.make_app()))
+    await client.start_server()
+    data = body(args.sites)
+    try:
+        start = time.perf_counter()
+        resp = await client.post(
+            "/bulk", data=data, headers={"Content-Type": "application/x-ndjson"}
+        )
+        report = await resp.json()
+        import_sec = time.perf_counter() - start
+        while len(follower.sites) < report["imported"]:
+            await asyncio.sleep(0.01)
+        follow_sec = time.perf_counter() - start
+    finally:
+        await client.close()
+        await sync.close()
+        await watcher.scheduler.stop()
+        await follower.scheduler.stop()
+        await metrics_sink.close()
+        await http_client.close_session()
+        await db_conn.rollback_migrations()
+    print(
+        json.dumps(
+            {
+                "sites": args.sites,
+                "chunk": args.chunk,
+                "body_mb": round(len(data) / 2**20, 1),
+                "imported": report["imported"],
+                "duplicates": report["duplicates"],
+                "import_sec": round(import_sec, 2),
+                "sites_per_sec": round(args.sites / import_sec),
+                "follower_synced_sec": round(follow_sec, 2),
+                "follower_full_syncs": sync.full_syncs,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    quiet(logging.CRITICAL)
+    parser = sites_parser(__doc__, 100000)
+    parser.add_argument("--chunk", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
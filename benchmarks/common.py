@@ -0,0 +1,46 @@
+"""Setup shared by the benchmarks: logging, arguments and a seeded watch list"""
+import argparse
+import logging
+
+import structlog
+
+from monmon.db.db_connector import DbConnector
+
+MIGRATIONS_DIR = "src/monmon/db/migrations"
+
+
+def quiet(level: int = logging.WARNING) -> None:
+    """Keep the benchmark output clean"""
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(level),
+        cache_logger_on_first_use=True,
+    )
+
+
+def sites_parser(
+    description: str, sites: int | list[int], nargs: str | None = None
+) -> argparse.ArgumentParser:
+    """Arguments of a benchmark of `--sites` sites, `nargs="+"` for several runs"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--sites", type=int, nargs=nargs, default=sites)
+    return parser
+
+
+async def seed_watch_list(
+    dsn: str, sites: int, port: int, check_interval_sec: int = 5
+) -> DbConnector:
+    """Apply migrations and fill the watch list with the sites of a local farm"""
+    db_conn = DbConnector(dsn, MIGRATIONS_DIR)
+    await db_conn.apply_migrations()
+    for start in range(0, sites, 1000):
+        await db_conn.save_to_watch_list(
+            [
+                {
+                    "url": f"http://localhost:{port}/{site}",
+                    "regexp": "[0-9]{4}",
+                    "check_interval_sec": check_interval_sec,
+                }
+                for site in range(start, min(start + 1000, sites))
+            ]
+        )
+    return db_conn
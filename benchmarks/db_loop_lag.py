@@ -0,0 +1,106 @@
+"""Benchmark: event-loop lag caused by saving metrics while the number of sites grows.
+
+Every simulated site saves one metrics row at the same moment, which is the worst case
+for `Watcher` ticks. A probe task measures how late the event loop wakes it up.
+Two modes are compared:
+    blocking - the driver call runs directly on the event loop (the old behaviour)
+    executor - `PgConnector.query`, the driver call runs in an executor thread
+
+Run from the repository root against a disposable database:
+    python benchmarks/db_loop_lag.py --sites 100 1000 5000
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from lag_probe import LagProbe
+from monmon.custom_types.watch_list import WatchList
+from monmon.db.db_connector import DbConnector
+
+INSERT_QUERY = (
+    "insert into metrics (site_id, timestamp, response_time, status_code, content) values "
+    "(%(site_id)s, %(timestamp)s, %(response_time)s, %(status_code)s, %(content)s);"
+)
+
+
+async def save_blocking(db_conn: DbConnector, params: dict) -> None:
+    """Save a row the way the synchronous connector did: right on the event loop"""
+    db_conn._execute(  # pylint: disable=protected-access
+        lambda curr: curr.execute(INSERT_QUERY, params)
+    )
+
+
+async def save_executor(db_conn: DbConnector, params: dict) -> None:
+    """Save a row through the non-blocking query path"""
+    await db_conn.query(INSERT_QUERY, params)
+
+
+async def run_round(db_conn: DbConnector, site_ids: List[int], mode: str) -> dict:
+    """Save one row per site concurrently and report the loop lag percentiles"""
+    save = save_blocking if mode == "blocking" else save_executor
+    async with LagProbe() as probe:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *[
+                save(
+                    db_conn,
+                    {
+                        "site_id": site_id,
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "response_time": 1,
+                        "status_code": 200,
+                        "content": "benchmark",
+                    },
+                )
+                for site_id in site_ids
+            ]
+        )
+        elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "sites": len(site_ids),
+        "elapsed_sec": round(elapsed, 4),
+        **probe.report(),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Prepare the sites and run every round"""
+    cfg = configparser.ConfigParser()
+    cfg.read(args.config)
+    db_conn = DbConnector(
+        args.dsn or cfg["database"].get("test_pg_dsn"), args.migrations_dir
+    )
+    await db_conn.apply_migrations()
+    try:
+        watch_list: List[WatchList] = [
+            {
+                "url": f"https://bench-{i}.example.com/",
+                "regexp": "bench",
+                "check_interval_sec": 5,
+            }
+            for i in range(max(args.sites))
+        ]
+        saved = await db_conn.save_to_watch_list(watch_list)
+        site_ids = [site[0] for site in saved or []]
+
+        results = []
+        for sites in args.sites:
+            for mode in ("blocking", "executor"):
+                results.append(await run_round(db_conn, site_ids[:sites], mode))
+        print(json.dumps(results, indent=2))
+    finally:
+        await db_conn.rollback_migrations()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sites", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--dsn", default=None, help="defaults to test_pg_dsn")
+    parser.add_argument("--config", default="src/monmon/config.ini")
+    parser.add_argument("--migrations-dir", default="src/monmon/db/migrations")
+    asyncio.run(main(parser.parse_args()))
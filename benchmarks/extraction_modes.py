@@ -0,0 +1,66 @@
+"""Benchmark: regexp extraction inline, in a thread pool and in a process pool.
+
+Many checks of big pages finish at the same moment and their bodies are matched
+concurrently. The report contains the wall time of the whole batch and how late
+the event loop resumed a probe task meanwhile.
+
+Run from the repository root:
+    python benchmarks/extraction_modes.py --pages 16 --size-mb 2
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+
+from lag_probe import LagProbe
+from monmon.matcher.extractor import MODES, Extractor
+
+PATTERN = r"[a-z]+ing\b|[0-9]{4,}"
+
+
+def make_page(size_mb: int) -> str:
+    """Build a text of roughly the given size that the pattern rarely matches"""
+    line = "<p>lorem ipsum dolor sit amet, consectetur adipiscing elit 123</p>\n"
+    return line * (size_mb * 1024 * 1024 // len(line))
+
+
+async def run_mode(mode: str, pages: int, text: str, workers: int) -> dict:
+    """Extract content from all the pages concurrently"""
+    extractor = Extractor(mode, workers=workers, offload_threshold=1024)
+    regexp = re.compile(PATTERN)
+    # Warm the pool up, so starting workers is not measured.
+    await asyncio.gather(
+        *[extractor.extract(regexp, "x" * 2048) for _ in range(workers)]
+    )
+    try:
+        async with LagProbe() as probe:
+            start = time.perf_counter()
+            await asyncio.gather(
+                *[extractor.extract(regexp, text) for _ in range(pages)]
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        extractor.close()
+    return {
+        "mode": mode,
+        "pages": pages,
+        "elapsed_sec": round(elapsed, 3),
+        "max_queue_depth": extractor.max_queue_depth,
+        **probe.report(),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run every mode"""
+    text = make_page(args.size_mb)
+    results = [await run_mode(mode, args.pages, text, args.workers) for mode in MODES]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--size-mb", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+"""A probe that measures how late the event loop resumes a sleeping task"""
+import asyncio
+import statistics
+import time
+from typing import List
+
+
+class LagProbe:
+    """Sleeps for a fixed interval in a loop and records how late it wakes up"""
+
+    def __init__(self, interval_sec: float = 0.005) -> None:
+        self.interval_sec = interval_sec
+        self.lags: List[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "LagProbe":
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+        await asyncio.sleep(self.interval_sec * 2)
+        return self
+
+    async def __aexit__(self, *_exc) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_sec)
+            self.lags.append(time.perf_counter() - start - self.interval_sec)
+
+    def report(self) -> dict:
+        """Loop lag percentiles in milliseconds"""
+        lags = sorted(self.lags) or [0.0]
+        return {
+            "lag_p50_ms": round(statistics.median(lags) * 1000, 3),
+            "lag_p99_ms": round(lags[int(len(lags) * 0.99)] * 1000, 3),
+            "lag_max_ms": round(lags[-1] * 1000, 3),
+        }
@@ -0,0 +1,233 @@
+"""Benchmark: the whole service under load of a local farm of fake sites.
+
+Processes of a local aiohttp farm share one port and serve `--sites` fake sites,
+each site has its own latency and page size spread around `--latency-ms` and
+`--page-kb`, and answers with a status picked from `--status-mix` on every request.
+For every number of sites a fresh process applies the migrations, fills the watch
+list and runs `Watcher`, `HttpClient`, `MetricsSink` and `DbConnector` for
+`--duration` seconds, as the service does. The report of every run contains:
+    checks_per_sec - finished checks, `expected_checks_per_sec` if the schedule holds
+    drift_p50_ms, drift_p99_ms - how late checks start, by the schedule buckets
+    lag_p50_ms, lag_p99_ms, lag_max_ms - event-loop lag seen by a probe task
+    rows_per_sec, dropped_rows, failed_rows - writes of metrics to the database
+    max_rss_mb - the peak resident memory of the process
+The report is written to `--output` with the revision and the arguments of the run,
+`--loop uvloop` runs the service on uvloop to compare it with the asyncio loop.
+With `--baseline` the report of an earlier run is compared, every number of sites
+gets the ratios of its results to the baseline, so a regression is a ratio
+far from 1.
+
+Run from the repository root against a disposable database:
+    python benchmarks/load_test.py --sites 1000 5000 10000 --duration 30
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+from common import quiet, seed_watch_list, sites_parser
+from lag_probe import LagProbe
+from monmon.db.metrics_sink import MetricsSink
+from monmon.instrumentation.event_loop import LOOP_POLICIES, new_event_loop
+from monmon.requester.client import HttpClient
+from monmon.requester.limiter import RequestLimiter
+from monmon.watchdog.scheduler import SCHEDULE_DELAY_SECONDS
+from monmon.watchdog.watcher import CHECK_SECONDS, Watcher
+
+PORT = 8013
+COMPARED = (
+    "checks_per_sec",
+    "drift_p99_ms",
+    "lag_p99_ms",
+    "rows_per_sec",
+    "max_rss_mb",
+)
+
+
+def parse_status_mix(value: str) -> dict:
+    """Weights of status codes, e.g. `200:0.9,404:0.05,503:0.05`"""
+    mix = {}
+    for item in value.split(","):
+        status, weight = item.split(":")
+        mix[int(status)] = float(weight)
+    return mix
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Serve the fake sites until the process is terminated"""
+    page = b"<p>lorem ipsum dolor sit amet 2023</p>\n" * (args.page_kb * 2 * 1024 // 39)
+    statuses = list(args.status_mix)
+    weights = list(args.status_mix.values())
+
+    async def handler(request: web.Request) -> web.Response:
+        # Every site keeps its latency and size, only the status changes.
+        site = random.Random(int(request.match_info["site_id"]))
+        latency_sec = args.latency_ms * site.uniform(0.5, 1.5) / 1000
+        size = int(len(page) * site.uniform(0.25, 0.75))
+        await asyncio.sleep(latency_sec)
+        status = random.choices(statuses, weights)[0]
+        return web.Response(body=page[:size], status=status, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{site_id}", handler)
+    web.run_app(app, host="localhost", port=PORT, reuse_port=True, print=None)
+
+
+async def run_load(dsn: str, sites: int, args: argparse.Namespace) -> dict:
+    """Check the sites for a while and measure the service"""
+    db_conn = await seed_watch_list(dsn, sites, PORT, args.interval)
+    watch_list = await db_conn.get_watch_list()
+
+    metrics_sink = MetricsSink(db_conn)
+    metrics_sink.start()
+    http_client = HttpClient(
+        timeout_sec=30, limiter=RequestLimiter(max_in_flight=args.workers)
+    )
+    watcher = Watcher(
+        http_client, metrics_sink, workers=args.workers, conditional_requests=False
+    )
+    try:
+        async with LagProbe() as probe:
+            await watcher.add_to_monitoring(watch_list or [])
+            await asyncio.sleep(args.duration)
+        checks = CHECK_SECONDS.count()
+        lag = probe.report()
+    finally:
+        await watcher.scheduler.stop()
+        await metrics_sink.close()
+        await http_client.close_session()
+        await db_conn.rollback_migrations()
+
+    drift = {
+        name: SCHEDULE_DELAY_SECONDS.quantile(quantile)
+        for name, quantile in (("drift_p50_ms", 0.5), ("drift_p99_ms", 0.99))
+    }
+    return {
+        "sites": sites,
+        "checks_per_sec": round(checks / args.duration, 1),
+        "expected_checks_per_sec": round(sites / args.interval, 1),
+        **{name: value and value * 1000 for name, value in drift.items()},
+        **lag,
+        "rows_per_sec": round(metrics_sink.flushed_rows / args.duration, 1),
+        "dropped_rows": metrics_sink.dropped_rows,
+        "failed_rows": metrics_sink.failed_rows,
+        "max_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def run(dsn: str, sites: int, args: argparse.Namespace, results) -> None:
+    """The entry point of the process of a run"""
+    quiet()
+    loop = new_event_loop(args.loop)
+    try:
+        results.put(loop.run_until_complete(run_load(dsn, sites, args)))
+    finally:
+        loop.close()
+
+
+def compare(results: list, baseline: dict) -> dict:
+    """Ratios of the results to the baseline runs with the same number of sites"""
+    previous = {run["sites"]: run for run in baseline["results"]}
+    changes = {}
+    for result in results:
+        before = previous.get(result["sites"])
+        if before is None:
+            continue
+        changes[result["sites"]] = {
+            name: round(result[name] / before[name], 2)
+            for name in COMPARED
+            if result.get(name) and before.get(name)
+        }
+    return changes
+
+
+def revision() -> str | None:
+    """The commit that is benchmarked"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the service against the farm for every number of sites"""
+    cfg = configparser.ConfigParser()
+    cfg.read("src/monmon/config.ini")
+    dsn = args.dsn or cfg["database"].get("test_pg_dsn")
+
+    farm = [
+        multiprocessing.Process(target=serve, args=(args,), daemon=True)
+        for _ in range(args.farm_processes)
+    ]
+    for server in farm:
+        server.start()
+    time.sleep(1)
+    results = []
+    try:
+        for sites in args.sites:
+            # A fresh process per run, so its metrics and memory start from zero.
+            queue: multiprocessing.Queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=run, args=(dsn, sites, args, queue)
+            )
+            process.start()
+            results.append(queue.get())
+            process.join()
+    finally:
+        for server in farm:
+            server.terminate()
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": revision(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "args": {
+            name: value for name, value in vars(args).items() if name != "baseline"
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            report["baseline"] = args.baseline
+            report["change"] = compare(results, json.load(baseline))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    quiet()
+    parser = sites_parser(__doc__, [1000, 5000, 10000], nargs="+")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--interval", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--page-kb", type=int, default=16)
+    parser.add_argument(
+        "--status-mix", type=parse_status_mix, default="200:0.9,404:0.05,503:0.05"
+    )
+    parser.add_argument("--farm-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--loop", choices=LOOP_POLICIES, default="asyncio")
+    parser.add_argument("--dsn", help="a database instead of test_pg_dsn")
+    parser.add_argument("--output", default="benchmarks/results/load_test.json")
+    parser.add_argument("--baseline", help="the report of an earlier run")
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""Benchmark: event-loop time spent on logging per check.
+
+Every check logs the response it got, the way `HttpClient.get` does.
+The calls are timed on the event loop, writing to a file, for two pipelines:
+    stdlib - the previous setup: structlog's JSONRenderer and a synchronous
+        `StreamHandler`, the level is checked by the `filter_by_level` processor
+    pipeline - `configure_logging`: the level is checked by the bound logger,
+        lines are rendered with orjson (when installed) and written by a thread
+and two levels: `debug`, where every check is logged, and `info`, where
+the message is disabled. `--sites` is how many distinct sites the checks rotate
+through, so the pipeline also shows what its repeat limit saves.
+
+Run from the repository root:
+    python benchmarks/logging_overhead.py --checks 100000 --sites 1000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+
+import structlog
+
+from common import sites_parser
+from monmon.instrumentation.log_pipeline import configure_logging
+
+
+def configure_stdlib(level: str, stream) -> None:
+    """The logging setup of the service before the pipeline"""
+    log = logging.getLogger("main_logger")
+    log.handlers.clear()
+    log.setLevel(level.upper())
+    log.addHandler(logging.StreamHandler(stream))
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.processors.TimeStamper(fmt="iso", utc=True),
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.stdlib.add_log_level,
+            structlog.processors.dict_tracebacks,
+            structlog.processors.UnicodeDecoder(),
+            structlog.processors.JSONRenderer(),
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        cache_logger_on_first_use=True,
+    )
+
+
+async def log_checks(checks: int, sites: int) -> float:
+    """Log every check and return the seconds it took on the event loop"""
+    logger = structlog.getLogger("main_logger")
+    start = time.perf_counter()
+    for check in range(checks):
+        logger.debug(
+            "got this response while monitoring the site",
+            url=f"https://example.com/{check % sites}",
+            status_code=200,
+        )
+        if check % 100 == 0:
+            # Let other tasks run, as checks do between responses.
+            await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+def run(pipeline: str, level: str, args: argparse.Namespace) -> dict:
+    """Time the logging of all checks with one pipeline and level"""
+    structlog.reset_defaults()
+    with tempfile.TemporaryFile("w+b") as output:
+        if pipeline == "stdlib":
+            # Closing the text stream flushes it and leaves the file open.
+            with open(output.fileno(), "w", encoding="utf-8", closefd=False) as stream:
+                configure_stdlib(level, stream)
+                elapsed = asyncio.run(log_checks(args.checks, args.sites))
+        else:
+            writer = configure_logging(
+                level, stream=output, repeat_limit=args.repeat_limit
+            )
+            elapsed = asyncio.run(log_checks(args.checks, args.sites))
+            writer.close()
+        output.seek(0)
+        lines = sum(1 for _ in output)
+    return {
+        "pipeline": pipeline,
+        "level": level,
+        "ns_per_check": round(elapsed / args.checks * 1e9),
+        "loop_ms_per_1000_checks": round(elapsed / args.checks * 1e6, 3),
+        "lines": lines,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    """Compare the pipelines at both levels"""
+    results = [
+        run(pipeline, level, args)
+        for level in ("debug", "info")
+        for pipeline in ("stdlib", "pipeline")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = sites_parser(__doc__, 1000)
+    parser.add_argument("--checks", type=int, default=100000)
+    parser.add_argument(
+        "--repeat-limit", type=int, default=10, help="0 disables the repeat limit"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""Benchmark: memory of monitored sites and of queued metrics.
+
+A watcher with conditional requests and the default stats window takes a watch
+list of `--sites` sites, the report contains the bytes that it keeps per site.
+Then every site is checked once without a network: metrics of the check are built
+as the client builds them, recorded in the stats of the site and queued
+in the metrics sink as if the database were slow. The report contains the bytes
+and the memory blocks that every queued check keeps. Memory is traced
+with tracemalloc, so strings of the watch list itself are not counted.
+
+Run from the repository root:
+    python benchmarks/memory_footprint.py --sites 100000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import time
+import tracemalloc
+
+
+from common import quiet, sites_parser
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.metrics_sink import MetricsSink
+from monmon.requester.client import HttpClient
+from monmon.watchdog.watcher import Watcher
+
+
+def traced() -> tuple[int, int]:
+    """The traced bytes and memory blocks after a garbage collection"""
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.statistics("filename")
+    return sum(stat.size for stat in stats), sum(stat.count for stat in stats)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Add the sites, check each of them once and measure both steps"""
+    http_client = HttpClient(timeout_sec=5)
+    metrics_sink = MetricsSink(None, queue_size=args.sites)  # type: ignore[arg-type]
+    watcher = Watcher(http_client, metrics_sink)
+    watcher.scheduler.start = lambda: None  # type: ignore[method-assign]
+    watch_list = [
+        (
+            site,
+            f"https://host-{site}.example.com/page/{site}",
+            f"status-{site % 10}",
+            60,
+            None,
+        )
+        for site in range(args.sites)
+    ]
+    contents = [f"status-{site % 10}" for site in range(10)]
+
+    tracemalloc.start()
+    empty_bytes, _ = traced()
+    await watcher.add_to_monitoring(watch_list)
+    sites_bytes, sites_blocks = traced()
+    for site_id, site in watcher.sites.items():
+        metrics = Metrics(
+            site_id,
+            200,
+            time.time_ns(),
+            20_000_000,
+            contents[site_id % 10],
+            ttfb=5_000_000,
+            body_time=1_000_000,
+        )
+        site.stats.record(metrics)
+        metrics_sink.queue.put_nowait(metrics)
+    checks_bytes, checks_blocks = traced()
+    tracemalloc.stop()
+    await http_client.close_session()
+
+    print(
+        json.dumps(
+            {
+                "sites": args.sites,
+                "bytes_per_site": round((sites_bytes - empty_bytes) / args.sites),
+                "bytes_per_queued_check": round(
+                    (checks_bytes - sites_bytes) / args.sites
+                ),
+                "blocks_per_queued_check": round(
+                    (checks_blocks - sites_blocks) / args.sites, 2
+                ),
+                "queued_checks": metrics_sink.queue.qsize(),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    quiet(logging.CRITICAL)
+    parser = sites_parser(__doc__, 100000)
+    asyncio.run(main(parser.parse_args()))
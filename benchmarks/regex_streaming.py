@@ -0,0 +1,112 @@
+"""Benchmark: matching a regexp over multi-MB pages, full read vs the stream mode.
+
+A local aiohttp server, running in a separate process so that it doesn't affect
+the memory report, serves pages of the given sizes. For every size two patterns
+are checked: one that matches on every line (the stream mode stops as soon as
+the content is full) and one that matches only at the very end (both modes
+scan the whole body).
+The report contains the mean time per check and the peak memory allocated by Python.
+
+Run from the repository root:
+    python benchmarks/regex_streaming.py --sizes-mb 1 5 20
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import time
+import logging
+import tracemalloc
+from typing import List
+
+import structlog
+from aiohttp import web
+
+from monmon.requester.client import HttpClient
+
+PORT = 8011
+PATTERNS = {"every_line": "lorem", "bottom": "end-marker-[0-9]+"}
+
+
+def make_page(size_mb: int) -> bytes:
+    """Build an HTML page of roughly the given size"""
+    line = b"<p>lorem ipsum dolor sit amet, consectetur adipiscing elit</p>\n"
+    body = line * (size_mb * 1024 * 1024 // len(line))
+    return (
+        b"<html><head><title>benchmark page</title></head><body>\n"
+        + body
+        + b"end-marker-42</body></html>"
+    )
+
+
+async def run_mode(
+    stream_body: bool, url: str, regexp: re.Pattern, repeat: int
+) -> dict:
+    """Check the page `repeat` times and measure the time and the peak memory"""
+    http_client = HttpClient(
+        timeout_sec=60, stream_body=stream_body, max_body_bytes=1024 * 1024 * 1024
+    )
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            metrics = await http_client.get(1, url, regexp)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        await http_client.close_session()
+    return {
+        "mode": "stream" if stream_body else "full",
+        "check_ms": round(elapsed / repeat * 1000, 2),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "content": metrics.content if metrics else None,
+    }
+
+
+def serve(sizes_mb: List[int]) -> None:
+    """Serve the pages until the process is terminated"""
+    pages = {size: make_page(size) for size in sizes_mb}
+
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(
+            body=pages[int(request.match_info["size"])], content_type="text/html"
+        )
+
+    app = web.Application()
+    app.router.add_get("/{size}", handler)
+    web.run_app(app, host="localhost", port=PORT, print=None)
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run every mode against the page server"""
+    server = multiprocessing.Process(target=serve, args=(args.sizes_mb,), daemon=True)
+    server.start()
+    await asyncio.sleep(1)
+
+    results = []
+    try:
+        for size in args.sizes_mb:
+            for name, pattern in PATTERNS.items():
+                for stream_body in (False, True):
+                    result = await run_mode(
+                        stream_body,
+                        f"http://localhost:{PORT}/{size}",
+                        re.compile(pattern),
+                        args.repeat,
+                    )
+                    results.append({"size_mb": size, "pattern": name, **result})
+    finally:
+        server.terminate()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING)
+    )
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
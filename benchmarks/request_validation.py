@@ -0,0 +1,77 @@
+"""Benchmark: decoding and validating the body of `POST /`.
+
+The body is the longest watch list that `POST /` takes. It is decoded with
+the standard library and with orjson (if it is installed) and then validated
+field by field, as the handler does. The report contains the time per request
+and the sites per second of every step. No database or server is involved.
+
+Run from the repository root:
+    python benchmarks/request_validation.py --repeat 200
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+from monmon.matcher.regex_cache import RegexCache
+from monmon.schemas import codec
+from monmon.schemas.watch_list import MAX_WATCH_LIST_SIZE, parse_watch_list
+
+
+def body(sites: int) -> bytes:
+    """A watch list where sites of one host share a few regexps"""
+    return json.dumps(
+        [
+            {
+                "url": f"https://host-{site // 10}.example.com/page/{site}?tab=metrics",
+                "regexp": f"status: (ok|up)-{site % 4}",
+                "check_interval_sec": 5 + site % 296,
+            }
+            for site in range(sites)
+        ]
+    ).encode()
+
+
+def measure(step: Callable[[], Any], repeat: int, sites: int) -> dict:
+    """Run the step `repeat` times and report its mean time"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        step()
+    elapsed = (time.perf_counter() - start) / repeat
+    return {
+        "request_ms": round(elapsed * 1000, 3),
+        "sites_per_sec": round(sites / elapsed),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    """Measure every decoder and the validation"""
+    data = body(args.sites)
+    report: dict = {"sites": args.sites, "body_kb": round(len(data) / 1024)}
+    report["decode_json"] = measure(lambda: json.loads(data), args.repeat, args.sites)
+    if codec.orjson:
+        report["decode_orjson"] = measure(
+            lambda: codec.orjson.loads(data), args.repeat, args.sites
+        )
+
+    decoded = json.loads(data)
+    regex_cache = RegexCache(1024)
+    report["validate"] = measure(
+        lambda: parse_watch_list(decoded, regex_cache), args.repeat, args.sites
+    )
+    report["validate_without_cache"] = measure(
+        lambda: parse_watch_list(decoded), max(args.repeat // 10, 1), args.sites
+    )
+    report["decode_and_validate"] = measure(
+        lambda: parse_watch_list(codec.loads(data), regex_cache),
+        args.repeat,
+        args.sites,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sites", type=int, default=MAX_WATCH_LIST_SIZE)
+    parser.add_argument("--repeat", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+"""Benchmark: checks per second of 1, 2, 4... sharded worker processes.
+
+A local aiohttp server (a process per CPU sharing one port) serves a page big enough
+that matching it costs real CPU time. The watch list gets many more sites than one
+process can check at the minimal interval, then the given numbers of worker processes
+share it through `ShardCoordinator` and save their metrics to Postgres.
+The report contains the checks per second of every run, which should grow
+almost linearly until the workers run out of cores.
+
+Run from the repository root against a disposable database:
+    python benchmarks/sharded_workers.py --workers 1 2 4 --sites 5000 --duration 30
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import multiprocessing
+import os
+import time
+
+from aiohttp import web
+
+from common import MIGRATIONS_DIR, quiet, seed_watch_list, sites_parser
+from monmon.db.db_connector import DbConnector
+from monmon.db.metrics_sink import MetricsSink
+from monmon.matcher.regex_cache import RegexCache
+from monmon.requester.client import HttpClient
+from monmon.requester.limiter import RequestLimiter
+from monmon.watchdog.sharding import ShardCoordinator
+from monmon.watchdog.sync import WatchListSync
+from monmon.watchdog.watcher import Watcher
+
+PORT = 8012
+PAGE = b"<p>lorem ipsum dolor sit amet, consectetur adipiscing elit 2023</p>\n" * 4000
+
+
+def serve() -> None:
+    """Serve the page until the process is terminated"""
+
+    async def handler(_request: web.Request) -> web.Response:
+        return web.Response(body=PAGE, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{site_id}", handler)
+    web.run_app(app, host="localhost", port=PORT, reuse_port=True, print=None)
+
+
+async def run_worker(dsn: str, worker_id: str, duration_sec: float) -> int:
+    """Check the shard of the worker for a while and return how many rows it saved"""
+    db_conn = DbConnector(dsn, MIGRATIONS_DIR, pool_max_size=4)
+    metrics_sink = MetricsSink(db_conn)
+    metrics_sink.start()
+    http_client = HttpClient(timeout_sec=30, limiter=RequestLimiter(max_in_flight=200))
+    watcher = Watcher(
+        http_client,
+        metrics_sink,
+        workers=200,
+        conditional_requests=False,
+        regex_cache=RegexCache(),
+    )
+    sync = WatchListSync(db_conn, watcher, listen=False)
+    coordinator = ShardCoordinator(
+        db_conn, sync, worker_id, heartbeat_sec=1, lease_ttl_sec=3
+    )
+    await coordinator.start()
+    await sync.start()
+    await asyncio.sleep(duration_sec)
+    await coordinator.close()
+    await sync.close()
+    await watcher.scheduler.stop()
+    await metrics_sink.close()
+    await http_client.close_session()
+    return metrics_sink.flushed_rows
+
+
+def worker(dsn: str, worker_id: str, duration_sec: float, results) -> None:
+    """The entry point of a worker process"""
+    quiet()
+    results.put(asyncio.run(run_worker(dsn, worker_id, duration_sec)))
+
+
+def run(dsn: str, workers: int, duration_sec: float) -> dict:
+    """Start the workers at once and sum up their checks"""
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker, args=(dsn, f"bench-{workers}-{i}", duration_sec, results)
+        )
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    checks = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "checks": checks,
+        "checks_per_sec": round(checks / duration_sec, 1),
+        "elapsed_sec": round(elapsed, 1),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the workers against the page server for every number of workers"""
+    cfg = configparser.ConfigParser()
+    cfg.read("src/monmon/config.ini")
+    dsn = cfg["database"].get("test_pg_dsn")
+
+    servers = [
+        multiprocessing.Process(target=serve, daemon=True)
+        for _ in range(os.cpu_count() or 1)
+    ]
+    for server in servers:
+        server.start()
+    db_conn = await seed_watch_list(dsn, args.sites, PORT)
+    results = []
+    try:
+        for workers in args.workers:
+            # Workers run in their own processes with their own event loops.
+            results.append(
+                await asyncio.get_running_loop().run_in_executor(
+                    None, run, dsn, workers, args.duration
+                )
+            )
+    finally:
+        for server in servers:
+            server.terminate()
+        await db_conn.rollback_migrations()
+    print(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    quiet()
+    parser = sites_parser(__doc__, 5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""Benchmark: writes, range reads and aggregates of the metrics storage backends.
+
+Both backends get the same metrics: `--sites` sites with a check every
+`--interval` seconds over `--hours` hours, saved in batches of `--batch-size`
+as the metrics sink does. For every backend the report contains:
+    write_rows_per_sec - rows saved per second
+    range_read_ms - streaming one hour of metrics of a site through the API path
+    aggregate_ms - hourly rollups of a site over the whole range, for Postgres
+        the rollup of raw metrics plus the read of the rollup table,
+        for SQLite the aggregation on the fly
+
+Run from the repository root against a disposable database:
+    python benchmarks/storage_backends.py --sites 100 --hours 24
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from common import MIGRATIONS_DIR, quiet, sites_parser
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.db_connector import DbConnector
+from monmon.db.sqlite.sqlite_storage import SqliteStorage
+from monmon.db.storage import MetricsStorage
+
+
+def make_batches(
+    args: argparse.Namespace, start: datetime, site_ids: List[int]
+) -> List[List[Metrics]]:
+    """Metrics of every site and check, in the order they would arrive"""
+    rows = [
+        Metrics(
+            site_id,
+            random.choice((200, 200, 200, 503)),
+            Metrics.timestamp_ns_of(start + timedelta(seconds=offset)) + site_id,
+            random.randint(10, 500),
+            "found",
+            ttfb=random.randint(5, 100),
+        )
+        for offset in range(0, args.hours * 3600, args.interval)
+        for site_id in site_ids
+    ]
+    return [
+        rows[index : index + args.batch_size]
+        for index in range(0, len(rows), args.batch_size)
+    ]
+
+
+async def measure(
+    storage: MetricsStorage,
+    batches: List[List[Metrics]],
+    site_id: int,
+    start: datetime,
+    end: datetime,
+) -> dict:
+    """Write every batch, then read and aggregate a site"""
+    began = time.perf_counter()
+    for batch in batches:
+        await storage.save_metrics_batch(batch)
+    write_sec = time.perf_counter() - began
+
+    began = time.perf_counter()
+    rows = 0
+    async for batch in storage.stream_metrics(
+        site_id, since=end - timedelta(hours=1), until=end
+    ):
+        rows += len(batch)
+    range_read_sec = time.perf_counter() - began
+
+    began = time.perf_counter()
+    if isinstance(storage, DbConnector):
+        await storage.rollup_metrics("hour", start, end)
+    rollups = list(await storage.get_rollups(site_id, "hour", start, end) or [])
+    aggregate_sec = time.perf_counter() - began
+    return {
+        "write_rows_per_sec": round(sum(map(len, batches)) / write_sec),
+        "range_read_ms": round(range_read_sec * 1000, 2),
+        "range_rows": rows,
+        "aggregate_ms": round(aggregate_sec * 1000, 2),
+        "buckets": len(rollups),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the same workload against Postgres and SQLite"""
+    cfg = configparser.ConfigParser()
+    cfg.read("src/monmon/config.ini")
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=args.hours)
+
+    db_conn = DbConnector(
+        args.dsn or cfg["database"].get("test_pg_dsn"), MIGRATIONS_DIR
+    )
+    await db_conn.apply_migrations()
+    try:
+        # Metrics of Postgres reference the watch list.
+        await db_conn.save_to_watch_list(
+            [
+                {
+                    "url": f"http://localhost/{site}",
+                    "regexp": "found",
+                    "check_interval_sec": args.interval,
+                }
+                for site in range(args.sites)
+            ]
+        )
+        site_ids = [site[0] for site in await db_conn.get_watch_list() or []]
+        batches = make_batches(args, start, site_ids)
+        report = {"rows": sum(map(len, batches))}
+        report["postgres"] = await measure(db_conn, batches, site_ids[0], start, end)
+    finally:
+        await db_conn.rollback_migrations()
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_storage = SqliteStorage(os.path.join(directory, "metrics.sqlite3"))
+        try:
+            report["sqlite"] = await measure(
+                sqlite_storage, batches, site_ids[0], start, end
+            )
+        finally:
+            await sqlite_storage.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    quiet()
+    parser = sites_parser(__doc__, 100)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--interval", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dsn", help="a database instead of test_pg_dsn")
+    asyncio.run(main(parser.parse_args()))
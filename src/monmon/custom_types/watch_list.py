@@ -1,8 +1,21 @@
 """This file contains custom types for all modules"""
+from datetime import datetime, timedelta, timezone
 from typing import TypedDict
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# A monitored site as it is read from a database:
+# site_id, url, regexp, check_interval_sec, max_body_bytes
+WatchListRow = tuple[int, str, str, int, int | None]
 
-class WatchList(TypedDict):
+
+class WatchListOptions(TypedDict, total=False):
+    """Custom type for optional settings of a site:
+    the biggest body a check reads, the limit of the client if None"""
+
+    max_body_bytes: int | None
+
+
+class WatchList(WatchListOptions):
     """Custom type for a monitored site"""
 
     url: str
@@ -10,7 +23,28 @@ class WatchList(TypedDict):
     check_interval_sec: int
 
 
-class WatchListMetrics(TypedDict):
+class FieldError(TypedDict):
+    """Custom type for a validation error of a request: the index of the site
+    and its field, both are None for an error of the whole body"""
+
+    index: int | None
+    field: str | None
+    error: str
+
+
+class WatchListMetricsDetails(TypedDict, total=False):
+    """Custom type for optional details of metrics:
+    phases of a request to a site in nanoseconds
+    and whether the content is the same as on the previous check"""
+
+    dns_time: int | None
+    connect_time: int | None
+    ttfb: int | None
+    body_time: int | None
+    content_unchanged: bool
+
+
+class WatchListMetrics(WatchListMetricsDetails):
     """Custom type for metrics of sites"""
 
     site_id: int
@@ -18,3 +52,84 @@ class WatchListMetrics(TypedDict):
     timestamp: str
     response_time: int
     content: str | None
+
+
+class Metrics:
+    """
+    Metrics of one check of a site as they go from the client to a database.
+    Thousands of them are queued in the metrics sink, so they are slotted records
+    instead of dicts, and the time of the check is kept as an integer that is turned
+    into a timestamp only when the metrics are saved.
+
+    Attributes
+    ---------
+    timestamp_ns:
+        when the response came, in nanoseconds since the epoch
+    response_time, dns_time, connect_time, ttfb, body_time:
+        the whole request and its phases in nanoseconds
+    content_unchanged:
+        the content is the same as on the previous check
+    """
+
+    __slots__ = (
+        "site_id",
+        "status_code",
+        "timestamp_ns",
+        "response_time",
+        "content",
+        "dns_time",
+        "connect_time",
+        "ttfb",
+        "body_time",
+        "content_unchanged",
+    )
+
+    def __init__(
+        self,
+        site_id: int,
+        status_code: int,
+        timestamp_ns: int,
+        response_time: int,
+        content: str | None = None,
+        *,
+        dns_time: int | None = None,
+        connect_time: int | None = None,
+        ttfb: int | None = None,
+        body_time: int | None = None,
+        content_unchanged: bool = False,
+    ) -> None:
+        self.site_id = site_id
+        self.status_code = status_code
+        self.timestamp_ns = timestamp_ns
+        self.response_time = response_time
+        self.content = content
+        self.dns_time = dns_time
+        self.connect_time = connect_time
+        self.ttfb = ttfb
+        self.body_time = body_time
+        self.content_unchanged = content_unchanged
+
+    @property
+    def timestamp(self) -> datetime:
+        """When the response came, in UTC"""
+        return EPOCH + timedelta(microseconds=self.timestamp_ns // 1000)
+
+    @staticmethod
+    def timestamp_ns_of(moment: datetime) -> int:
+        """The integer timestamp of an aware datetime"""
+        return (moment - EPOCH) // timedelta(microseconds=1) * 1000
+
+    def row(self) -> tuple:
+        """The values in the order of the slots, the time as a timestamp"""
+        return (
+            self.site_id,
+            self.status_code,
+            self.timestamp,
+            self.response_time,
+            self.content,
+            self.dns_time,
+            self.connect_time,
+            self.ttfb,
+            self.body_time,
+            self.content_unchanged,
+        )
@@ -1,24 +1,97 @@
 """This module enables abstract database connection, which means
 you don't need to worry about which DB you are using."""
-from datetime import datetime
-from typing import Iterator, List
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, AsyncGenerator, Dict, Iterator, List
 
 import structlog
 from yoyo.exceptions import BadMigration, MigrationConflict, LockTimeout
 from yoyo import read_migrations
 from yoyo import get_backend
 
-from monmon.custom_types.watch_list import WatchList, WatchListMetrics
+from monmon.custom_types.watch_list import (
+    Metrics,
+    WatchList,
+    WatchListMetrics,
+    WatchListRow,
+)
 from monmon.db.pg.exceptions import QueryException
 from monmon.db.pg.pg_connector import PgConnector
 
+# Raw metrics are partitioned by UTC day, e.g. `metrics_p20240131`.
+PARTITION_PREFIX = "metrics_p"
+PARTITION_DATE_FORMAT = "%Y%m%d"
+# A trigger notifies this channel about every change of the watch list.
+WATCH_LIST_CHANNEL = "watch_list"
+WATCH_LIST_COLUMNS = "site_id, url, regexp, check_interval_sec, max_body_bytes"
+ROLLUP_TABLES = {"minute": "metrics_rollup_minute", "hour": "metrics_rollup_hour"}
+# Metrics are saved in the order of the fields of their records.
+METRICS_COLUMNS = tuple(
+    '"timestamp"' if field == "timestamp_ns" else field for field in Metrics.__slots__
+)
 
-class DbConnector(PgConnector):
+
+def partition_name(day: date) -> str:
+    """The name of the partition that keeps metrics of the given day"""
+    return PARTITION_PREFIX + day.strftime(PARTITION_DATE_FORMAT)
+
+
+def _metrics_range(
+    site_id: int,
+    since: datetime | None,
+    until: datetime | None,
+    after: datetime | None,
+) -> tuple[str, Dict[str, Any]]:
+    """The `where` clause that selects metrics of a site in a time range.
+    Metrics of a site are saved one check at a time, so their timestamps are unique
+    and the timestamp of the last read row is enough to continue reading."""
+    conditions = ["site_id = %(site_id)s"]
+    params: Dict[str, Any] = {"site_id": site_id}
+    for name, value, condition in (
+        ("since", since, '"timestamp" >= %(since)s'),
+        ("until", until, '"timestamp" < %(until)s'),
+        ("after", after, '"timestamp" > %(after)s'),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params[name] = value
+    return " and ".join(conditions), params
+
+
+def metrics_from_row(row: tuple) -> WatchListMetrics:
+    """Metrics from a row of `METRICS_COLUMNS` as they are served by the API"""
+    return {
+        "site_id": row[0],
+        "status_code": row[1],
+        "timestamp": row[2].isoformat(),
+        "response_time": row[3],
+        "content": row[4],
+        "dns_time": row[5],
+        "connect_time": row[6],
+        "ttfb": row[7],
+        "body_time": row[8],
+        "content_unchanged": row[9],
+    }
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    """The range of timestamps of the given UTC day"""
+    start = datetime.combine(day, time(), tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+class DbConnector(PgConnector):  # pylint: disable=too-many-public-methods
     """With this class, you can apply and roll back migrations
     and save and retrieve data from the database using provided methods."""
 
-    def __init__(self, dsn: str, migration_dir: str) -> None:
-        super().__init__(dsn)
+    def __init__(
+        self,
+        dsn: str,
+        migration_dir: str,
+        pool_min_size: int = 1,
+        pool_max_size: int = 10,
+        health_check_idle_sec: float = 30,
+    ) -> None:
+        super().__init__(dsn, pool_min_size, pool_max_size, health_check_idle_sec)
         self.migrations = read_migrations(migration_dir)
         self.migrations_conn = get_backend(dsn)
         self.logger = structlog.getLogger("main_logger")
@@ -53,58 +126,307 @@ class DbConnector(PgConnector):
             )
             raise error
 
-    async def save_metrics(self, metrics: WatchListMetrics) -> None:
+    async def save_metrics(self, metrics: Metrics) -> None:
         """
         This method saves metrics to a database.
         :param metrics: what we want to save
         :return:
         """
-        site_id = metrics["site_id"]
-        timestamp = metrics["timestamp"]
-        response_time = metrics["response_time"]
-        status_code = metrics["status_code"]
-        content = metrics["content"]
         query = (
-            "insert into metrics (site_id, timestamp, response_time, status_code, content) values "
-            "(%(site_id)s, %(timestamp)s, %(response_time)s, %(status_code)s, %(content)s);"
+            f"insert into metrics ({', '.join(METRICS_COLUMNS)}) values "
+            f"({', '.join(['%s'] * len(METRICS_COLUMNS))}) on conflict do nothing;"
         )
         try:
-            await self.query(
-                query,
-                {
-                    "site_id": site_id,
-                    "timestamp": timestamp,
-                    "response_time": response_time,
-                    "status_code": status_code,
-                    "content": content,
-                },
-            )
+            await self.query(query, metrics.row())
         except QueryException:
             return None
 
+    async def save_metrics_batch(self, batch: List[Metrics]) -> None:
+        """
+        This method saves many metrics to a database with a single multi-row insert.
+        :param batch: what we want to save
+        :return:
+        """
+        # Metrics of a site and moment are unique, so a replayed batch is saved once.
+        query = (
+            f"insert into metrics ({', '.join(METRICS_COLUMNS)}) values %s "
+            "on conflict do nothing;"
+        )
+        rows = [metrics.row() for metrics in batch]
+        try:
+            await self.query_values(query, rows)
+        except QueryException as error:
+            self.logger.error(
+                "got an error while saving a batch of metrics",
+                error=error,
+                rows=len(rows),
+            )
+            raise error
+
     async def get_metrics(
-        self, site_id: int
+        self,
+        site_id: int,
+        *,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: datetime | None = None,
+        limit: int = 1000,
     ) -> Iterator[tuple[int, int, datetime, int, str]] | None:
         """
-        This method gets metrics from a database.
+        This method gets a page of metrics from a database, oldest first.
         :param site_id: metrics for given site
+        :param since: metrics at or after this moment
+        :param until: metrics before this moment
+        :param after: the keyset cursor, the timestamp of the last row of the previous page
+        :param limit: the size of the page
         :return:
         """
+        where, params = _metrics_range(site_id, since, until, after)
         query = (
             "select site_id, status_code, timestamp, response_time, content from "
-            "metrics where site_id = %(site_id)s"
+            f'metrics where {where} order by "timestamp" limit %(limit)s'
+        )
+        try:
+            return await self.query(query, {**params, "limit": limit})
+        except QueryException:
+            return None
+
+    async def stream_metrics(
+        self,
+        site_id: int,
+        *,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: datetime | None = None,
+        limit: int | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncGenerator[List[WatchListMetrics], None]:
+        """
+        This method streams metrics of a site from a database in batches, oldest first,
+        so any range can be read in constant memory.
+        Every batch is a keyset page read with its own query, so no connection is held
+        while the caller handles a batch, e.g. while a slow client downloads it.
+        It raises `QueryException`.
+        :param site_id: metrics for given site
+        :param since: metrics at or after this moment
+        :param until: metrics before this moment
+        :param after: the keyset cursor, the timestamp of the last row already read
+        :param limit: stop after this many rows
+        :param batch_size: how many rows are fetched from a database at a time
+        :return: batches of metrics
+        """
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            where, params = _metrics_range(site_id, since, until, after)
+            rows = list(
+                await self.query(
+                    f"select {', '.join(METRICS_COLUMNS)} from metrics "
+                    f'where {where} order by "timestamp" limit %(limit)s',
+                    {**params, "limit": size},
+                )
+                or []
+            )
+            if rows:
+                yield [metrics_from_row(row) for row in rows]
+            if len(rows) < size:
+                return
+            after = rows[-1][2]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    async def get_metrics_partitions(self) -> List[date]:
+        """
+        This method lists days that have their own partition of metrics.
+        :return: sorted days
+        """
+        rows = await self.query(
+            "select c.relname from pg_inherits i "
+            "join pg_class c on c.oid = i.inhrelid "
+            "where i.inhparent = 'metrics'::regclass;"
+        )
+        days = []
+        for (name,) in rows or []:
+            if not name.startswith(PARTITION_PREFIX):
+                continue
+            try:
+                suffix = name[len(PARTITION_PREFIX) :]
+                days.append(datetime.strptime(suffix, PARTITION_DATE_FORMAT).date())
+            except ValueError:
+                continue
+        return sorted(days)
+
+    async def create_metrics_partition(self, day: date) -> None:
+        """
+        This method creates the partition of metrics for a day. Rows of that day
+        that already landed in the default partition are moved into the new one,
+        otherwise Postgres refuses to attach it.
+        :param day: UTC day
+        :return:
+        """
+        name = partition_name(day)
+        start, end = day_bounds(day)
+        query = (
+            f"create table {name} (like metrics including defaults including constraints); "
+            f"insert into {name} select * from metrics_default "
+            'where "timestamp" >= %(start)s and "timestamp" < %(end)s; '
+            "delete from metrics_default "
+            'where "timestamp" >= %(start)s and "timestamp" < %(end)s; '
+            f"alter table metrics attach partition {name} "
+            "for values from (%(start)s) to (%(end)s);"
+        )
+        await self.query(query, {"start": start, "end": end})
+        self.logger.info("metrics partition created", partition=name)
+
+    async def drop_metrics_partition(self, day: date) -> None:
+        """
+        This method drops the partition of metrics for a day with all its rows.
+        :param day: UTC day
+        :return:
+        """
+        name = partition_name(day)
+        await self.query(f"drop table if exists {name};")
+        self.logger.info("metrics partition dropped", partition=name)
+
+    async def delete_default_metrics(self, before: datetime) -> None:
+        """
+        This method deletes rows older than `before` from the default partition,
+        i.e. rows of days that never got their own partition.
+        :param before: the retention cutoff
+        :return:
+        """
+        await self.query(
+            'delete from metrics_default where "timestamp" < %(before)s;',
+            {"before": before},
+        )
+
+    async def rollup_metrics(self, unit: str, since: datetime, until: datetime) -> None:
+        """
+        This method (re)computes per-site rollups of raw metrics in `[since, until)`:
+        the number of checks, how many of them were up (a status code below 400),
+        the average and p50/p95/p99 response time and counts of every status code.
+        Buckets are upserted, so a range can be rolled up again when late rows arrive.
+        :param unit: `minute` or `hour`
+        :param since: the start of the first bucket
+        :param until: the end of the range
+        :return:
+        """
+        bucket = (
+            "date_trunc(%(unit)s, \"timestamp\" at time zone 'UTC') at time zone 'UTC'"
+        )
+        where = '"timestamp" >= %(since)s and "timestamp" < %(until)s'
+        query = (
+            f"insert into {ROLLUP_TABLES[unit]} (site_id, bucket, checks, up_checks, "
+            "response_time_avg, response_time_p50, response_time_p95, response_time_p99, "
+            "status_counts) "
+            "select stats.site_id, stats.bucket, stats.checks, stats.up_checks, "
+            "stats.response_time_avg, stats.percentiles[1], stats.percentiles[2], "
+            "stats.percentiles[3], statuses.status_counts from ("
+            f"select site_id, {bucket} as bucket, count(*) as checks, "
+            "count(*) filter (where status_code < 400) as up_checks, "
+            "round(avg(response_time)) as response_time_avg, "
+            "percentile_disc(array[0.5, 0.95, 0.99]) "
+            "within group (order by response_time) as percentiles "
+            f"from metrics where {where} group by 1, 2"
+            ") stats join ("
+            "select site_id, bucket, jsonb_object_agg(status_code, checks) as status_counts "
+            f"from (select site_id, {bucket} as bucket, status_code, count(*) as checks "
+            f"from metrics where {where} group by 1, 2, 3) codes group by 1, 2"
+            ") statuses using (site_id, bucket) "
+            "on conflict (site_id, bucket) do update set "
+            "checks = excluded.checks, up_checks = excluded.up_checks, "
+            "response_time_avg = excluded.response_time_avg, "
+            "response_time_p50 = excluded.response_time_p50, "
+            "response_time_p95 = excluded.response_time_p95, "
+            "response_time_p99 = excluded.response_time_p99, "
+            "status_counts = excluded.status_counts;"
+        )
+        await self.query(query, {"unit": unit, "since": since, "until": until})
+
+    async def get_rollup_watermark(self, unit: str) -> datetime | None:
+        """
+        This method finds where rolling up should continue from: the last rolled up
+        bucket, or the oldest raw metrics if nothing was rolled up yet.
+        :param unit: `minute` or `hour`
+        :return: None if there are no metrics at all
+        """
+        rows = await self.query(
+            f"select coalesce((select max(bucket) from {ROLLUP_TABLES[unit]}), "
+            '(select min("timestamp") from metrics));'
+        )
+        return next(rows)[0] if rows else None
+
+    async def delete_rollups(self, unit: str, before: datetime) -> None:
+        """
+        This method deletes rollups of buckets older than `before`.
+        :param unit: `minute` or `hour`
+        :param before: the retention cutoff
+        :return:
+        """
+        await self.query(
+            f"delete from {ROLLUP_TABLES[unit]} where bucket < %(before)s;",
+            {"before": before},
+        )
+
+    async def get_rollups(
+        self, site_id: int, unit: str, since: datetime, until: datetime
+    ) -> Iterator[tuple[datetime, int, int, float, int, int, int, int, dict]] | None:
+        """
+        This method gets rollups of a site, the cheap way to draw a dashboard.
+        :param site_id: rollups for given site
+        :param unit: `minute` or `hour`
+        :param since: the start of the first bucket
+        :param until: the end of the range
+        :return: bucket, checks, up_checks, uptime, average, p50, p95 and p99
+            response time and counts of every status code
+        """
+        query = (
+            "select bucket, checks, up_checks, up_checks::float / checks as uptime, "
+            "response_time_avg, response_time_p50, response_time_p95, "
+            "response_time_p99, status_counts "
+            f"from {ROLLUP_TABLES[unit]} where site_id = %(site_id)s "
+            "and bucket >= %(since)s and bucket < %(until)s order by bucket;"
         )
         try:
             return await self.query(
-                query,
-                {
-                    "site_id": site_id,
-                },
+                query, {"site_id": site_id, "since": since, "until": until}
             )
         except QueryException:
             return None
 
-    async def get_watch_list(self) -> Iterator[tuple[int, str, str, int]] | None:
+    async def heartbeat_worker(self, worker_id: str, lease_ttl_sec: float) -> List[str]:
+        """
+        This method renews the lease of a worker, forgets workers whose lease expired
+        and lists the live ones. It raises `QueryException`.
+        :param worker_id: the worker that is alive
+        :param lease_ttl_sec: how long a lease lasts without a heartbeat
+        :return: sorted ids of live workers
+        """
+        query = (
+            "insert into workers (worker_id) values (%(worker_id)s) "
+            "on conflict (worker_id) do update set heartbeat_at = now(); "
+            "delete from workers "
+            "where heartbeat_at < now() - %(lease_ttl_sec)s * interval '1 second'; "
+            "select worker_id from workers order by worker_id;"
+        )
+        rows = await self.query(
+            query, {"worker_id": worker_id, "lease_ttl_sec": lease_ttl_sec}
+        )
+        return [worker for (worker,) in rows or []]
+
+    async def remove_worker(self, worker_id: str) -> None:
+        """
+        This method gives up the lease of a worker, so others take over its sites
+        without waiting for the lease to expire.
+        :param worker_id: the worker that stops
+        :return:
+        """
+        await self.query(
+            "delete from workers where worker_id = %(worker_id)s;",
+            {"worker_id": worker_id},
+        )
+
+    async def get_watch_list(self) -> Iterator[WatchListRow] | None:
         """
         This method retrieves all site settings that require monitoring.
         :return: List[str]
@@ -113,14 +435,94 @@ class DbConnector(PgConnector):
         self.logger.debug("get urls for monitoring from database")
         try:
             return await self.query(
-                "select site_id, url, regexp, check_interval_sec from watch_list;"
+                f"select {WATCH_LIST_COLUMNS} from watch_list where active;"
             )
         except QueryException:
             return None
 
+    async def stream_watch_list(
+        self,
+        batch_size: int = 1000,
+        *,
+        first_id: int | None = None,
+        last_id: int | None = None,
+    ) -> AsyncGenerator[List[WatchListRow], None]:
+        """
+        This method streams settings of monitored sites in batches,
+        so a long watch list is never loaded into memory at once.
+        It raises `QueryException`.
+        :param batch_size: how many sites are fetched from a database at a time
+        :param first_id: only sites with this or a greater id
+        :param last_id: only sites with this or a lower id
+        :return: batches of site_id, url, regexp, check_interval_sec, max_body_bytes
+        """
+        conditions = ["active"]
+        if first_id is not None:
+            conditions.append("site_id >= %(first_id)s")
+        if last_id is not None:
+            conditions.append("site_id <= %(last_id)s")
+        rows = self.stream(
+            f"select {WATCH_LIST_COLUMNS} from watch_list "
+            f"where {' and '.join(conditions)} order by site_id;",
+            {"first_id": first_id, "last_id": last_id},
+            batch_size=batch_size,
+        )
+        try:
+            async for batch in rows:
+                yield batch
+        finally:
+            await rows.aclose()
+
+    async def get_sites(self, site_ids: List[int]) -> Dict[int, WatchListRow]:
+        """
+        This method retrieves settings of the given sites that are monitored,
+        deleted and unknown sites are missing from the result.
+        It raises `QueryException`.
+        :param site_ids: ids of sites
+        :return: site_id: (site_id, url, regexp, check_interval_sec, max_body_bytes)
+        """
+        rows = await self.query(
+            f"select {WATCH_LIST_COLUMNS} from watch_list "
+            "where site_id = any(%s) and active;",
+            (site_ids,),
+        )
+        return {row[0]: row for row in rows or []}
+
+    async def update_site(self, site_id: int, site: WatchList) -> WatchListRow | None:
+        """
+        This method replaces settings of a monitored site.
+        It raises `QueryException`.
+        :param site_id: id of the site
+        :param site: new settings
+        :return: the saved settings, None if there is no such site
+        """
+        rows = await self.query(
+            "update watch_list set url = %(url)s, regexp = %(regexp)s, "
+            "check_interval_sec = %(check_interval_sec)s, "
+            "max_body_bytes = %(max_body_bytes)s "
+            f"where site_id = %(site_id)s and active returning {WATCH_LIST_COLUMNS};",
+            {"max_body_bytes": None, **site, "site_id": site_id},
+        )
+        return next(rows, None) if rows else None
+
+    async def delete_site(self, site_id: int) -> bool:
+        """
+        This method stops monitoring of a site. The site is only deactivated,
+        so its metrics and rollups are kept.
+        It raises `QueryException`.
+        :param site_id: id of the site
+        :return: False if there is no such site
+        """
+        rows = await self.query(
+            "update watch_list set active = false "
+            "where site_id = %s and active returning site_id;",
+            (site_id,),
+        )
+        return next(rows, None) is not None if rows else False
+
     async def save_to_watch_list(
-        self, watch_list: List[WatchList]
-    ) -> Iterator[tuple[int, str, str, int]] | None:
+        self, watch_list: List[WatchList], *, skip_known_urls: bool = False
+    ) -> Iterator[WatchListRow] | None:
         """
         This method saves preferences for a site.
 
@@ -128,20 +530,37 @@ class DbConnector(PgConnector):
             url:  address
             regexp: regexp with witch we should match content on a site
             check_interval_sec: how often check a site content
-        :return:
+            max_body_bytes: the biggest body of the site, optional
+        :param skip_known_urls: don't save sites whose URL is monitored already
+        :return: saved sites: site_id, url, regexp, check_interval_sec, max_body_bytes
         """
-        query = "insert into watch_list (url, regexp, check_interval_sec) values "
-        for site in watch_list:
-            url, regexp, check_interval_sec = (
+        values = [
+            (
                 site["url"],
                 site["regexp"],
                 site["check_interval_sec"],
+                site.get("max_body_bytes"),
             )
-            query = query + f"('{url}', '{regexp}', {check_interval_sec}), "
-
-        query = query.rstrip(", ") + " returning *;"
+            for site in watch_list
+        ]
+        if skip_known_urls:
+            query = (
+                "insert into watch_list (url, regexp, check_interval_sec, max_body_bytes) "
+                "select new.url, new.regexp, new.check_interval_sec, new.max_body_bytes "
+                "from (values %s) as new (url, regexp, check_interval_sec, max_body_bytes) "
+                "where not exists (select 1 from watch_list "
+                "where watch_list.url = new.url and watch_list.active) "
+                f"returning {WATCH_LIST_COLUMNS};"
+            )
+            template = "(%s::varchar, %s::varchar, %s::smallint, %s::integer)"
+        else:
+            query = (
+                "insert into watch_list (url, regexp, check_interval_sec, max_body_bytes) "
+                f"values %s returning {WATCH_LIST_COLUMNS};"
+            )
+            template = None
         try:
-            return await self.query(query)
+            return await self.query_values(query, values, template, fetch=True)
         except QueryException as error:
             self.logger.error(
                 "got an error while saving URLs to a watch list", error=error
@@ -0,0 +1,152 @@
+"""This module keeps partitions of metrics and their rollups up to date."""
+import asyncio
+import functools
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List
+
+import structlog
+
+from monmon.db.db_connector import ROLLUP_TABLES, DbConnector, day_bounds
+from monmon.db.pg.exceptions import QueryException
+
+# How much raw data a single rollup query covers while catching up.
+CATCH_UP_STEPS = {"minute": timedelta(hours=1), "hour": timedelta(days=1)}
+
+
+def floor_time(moment: datetime, unit: str) -> datetime:
+    """The start of the bucket that the moment falls into"""
+    moment = moment.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    if unit == "hour":
+        moment = moment.replace(minute=0)
+    return moment
+
+
+class MetricsMaintenance:
+    """
+    This class runs periodic database jobs in the background:
+
+    partitions - creates daily partitions of metrics `premake_days` ahead and drops
+        partitions older than `retention_days`, which is much cheaper than deleting rows
+    rollups - every `rollup_every_sec[unit]` recomputes per-minute and per-hour
+        rollups of the last `rollup_lookback_sec` and deletes rollups older than
+        `rollup_retention_days[unit]`
+
+    After a restart, rollups catch up from the last rolled up bucket.
+    A failed job is logged and retried on its next run.
+    When several workers share a database, `should_run` lets only one of them run jobs.
+
+    Attributes
+    ---------
+    runs:
+        how many times every job completed
+    failures:
+        how many times every job failed
+    """
+
+    def __init__(
+        self,
+        db_conn: DbConnector,
+        *,
+        premake_days: int = 3,
+        retention_days: int = 14,
+        partitions_every_sec: float = 3600,
+        rollup_lookback_sec: float = 300,
+        rollup_every_sec: Dict[str, float] | None = None,
+        rollup_retention_days: Dict[str, int] | None = None,
+    ) -> None:
+        self.db_conn = db_conn
+        self.premake_days = premake_days
+        self.retention_days = retention_days
+        self.partitions_every_sec = partitions_every_sec
+        self.rollup_lookback = timedelta(seconds=rollup_lookback_sec)
+        self.rollup_every_sec = {"minute": 60.0, "hour": 300.0}
+        self.rollup_every_sec.update(rollup_every_sec or {})
+        self.rollup_retention_days = {"minute": 90, "hour": 730}
+        self.rollup_retention_days.update(rollup_retention_days or {})
+        self.tasks: List[asyncio.Task] = []
+        self.runs: Dict[str, int] = {}
+        self.failures: Dict[str, int] = {}
+        self.logger = structlog.getLogger("main_logger")
+        self.should_run: Callable[[], bool] = lambda: True
+        self._rolled_up: Dict[str, datetime] = {}
+
+    def start(self) -> None:
+        """This method starts the background jobs."""
+        loop = asyncio.get_running_loop()
+        self.tasks.append(
+            loop.create_task(
+                self._every("partitions", self.partitions_every_sec, self.partitions)
+            )
+        )
+        for unit in ROLLUP_TABLES:
+            self.tasks.append(
+                loop.create_task(
+                    self._every(
+                        f"rollup_{unit}",
+                        self.rollup_every_sec[unit],
+                        functools.partial(self.rollup, unit),
+                    )
+                )
+            )
+
+    async def close(self) -> None:
+        """This method stops the background jobs."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def partitions(self) -> None:
+        """This method creates partitions for the next days and drops expired ones."""
+        today = datetime.now(timezone.utc).date()
+        existing = set(await self.db_conn.get_metrics_partitions())
+        for offset in range(self.premake_days + 1):
+            day = today + timedelta(days=offset)
+            if day not in existing:
+                await self.db_conn.create_metrics_partition(day)
+        if self.retention_days <= 0:
+            return
+        cutoff = today - timedelta(days=self.retention_days)
+        for day in sorted(existing):
+            if day < cutoff:
+                await self.db_conn.drop_metrics_partition(day)
+        await self.db_conn.delete_default_metrics(day_bounds(cutoff)[0])
+
+    async def rollup(self, unit: str) -> None:
+        """This method rolls up metrics that arrived since the previous run."""
+        now = datetime.now(timezone.utc)
+        since = self._rolled_up.get(unit)
+        if since is None:
+            since = await self.db_conn.get_rollup_watermark(unit)
+            if since is None:
+                return
+        since = floor_time(min(since, now - self.rollup_lookback), unit)
+        while since < now:
+            until = min(since + CATCH_UP_STEPS[unit], now)
+            await self.db_conn.rollup_metrics(unit, since, until)
+            since = until
+        # Rows are saved in batches, so the next run recomputes the recent buckets.
+        self._rolled_up[unit] = now - self.rollup_lookback
+
+        retention_days = self.rollup_retention_days[unit]
+        if retention_days > 0:
+            await self.db_conn.delete_rollups(
+                unit, floor_time(now, unit) - timedelta(days=retention_days)
+            )
+
+    async def _every(
+        self, job: str, period_sec: float, run: Callable[[], Awaitable[None]]
+    ) -> None:
+        while True:
+            if not self.should_run():
+                # Another worker runs the jobs, rollups catch up if it is handed over.
+                self._rolled_up.clear()
+                await asyncio.sleep(period_sec)
+                continue
+            try:
+                await run()
+                self.runs[job] = self.runs.get(job, 0) + 1
+            except QueryException as error:
+                self.failures[job] = self.failures.get(job, 0) + 1
+                self.logger.error("maintenance job failed", job=job, error=error)
+            await asyncio.sleep(period_sec)
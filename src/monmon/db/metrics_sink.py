@@ -0,0 +1,217 @@
+"""This module buffers metrics in memory and writes them to a database in bulk."""
+import asyncio
+import time
+from typing import List, Set
+
+import structlog
+
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.pg.exceptions import QueryException
+from monmon.db.spool import MetricsSpool
+from monmon.db.storage import MetricsStorage
+from monmon.instrumentation.prometheus import REGISTRY
+
+FLUSH_SECONDS = REGISTRY.histogram(
+    "monmon_metrics_flush_seconds", "Time to save a batch of metrics to a database"
+)
+REPLAY_SECONDS = REGISTRY.histogram(
+    "monmon_spool_replay_seconds",
+    "Time to save a batch of spooled metrics to a database",
+)
+
+
+class MetricsSink:
+    """
+    This class collects metrics of all checks in a bounded queue and flushes them
+    to a database with multi-row inserts, either when `batch_size` rows are queued
+    or when the oldest queued row has waited for `flush_interval_sec`.
+
+    When the queue is full, producers wait for up to `put_timeout_sec`,
+    which slows the checks down instead of growing memory.
+    If the queue is still full after that, the row is dropped.
+
+    With a `spool` batches that cannot be written to a database are appended
+    to it instead of being lost, and every `replay_interval_sec` the spool
+    is replayed in batches of `replay_batch_size` until it is empty
+    or a write fails again. A replay cancelled on shutdown may save its last batch
+    once more on the next start.
+
+    Attributes
+    ---------
+    flushed_rows:
+        how many rows were written to a database
+    dropped_rows:
+        how many rows were dropped because the queue was full or the sink was closed
+    failed_rows:
+        how many rows were lost because a database write failed
+        and they couldn't be spooled
+    """
+
+    def __init__(
+        self,
+        db_conn: MetricsStorage,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval_sec: float = 1.0,
+        put_timeout_sec: float = 0.5,
+        *,
+        spool: MetricsSpool | None = None,
+        replay_interval_sec: float = 5.0,
+        replay_batch_size: int = 5000,
+    ) -> None:
+        self.db_conn = db_conn
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self.put_timeout_sec = put_timeout_sec
+        self.spool = spool
+        self.replay_interval_sec = replay_interval_sec
+        self.replay_batch_size = replay_batch_size
+        self.queue: asyncio.Queue[Metrics] = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task | None = None
+        self.replay_task: asyncio.Task | None = None
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.failed_rows = 0
+        self.logger = structlog.getLogger("main_logger")
+        self._batch_ready = asyncio.Event()
+        self._pending: List[Metrics] = []
+        self._in_flight: asyncio.Task | None = None
+        self._closed = False
+
+    def start(self) -> None:
+        """This method starts the background flushing task
+        and the replay of the spool."""
+        loop = asyncio.get_running_loop()
+        self.task = loop.create_task(self._run())
+        if self.spool:
+            self.replay_task = loop.create_task(self._replay_periodically())
+
+    @property
+    def tasks(self) -> Set[asyncio.Task]:
+        """Tasks that `close` ends itself. They must not be cancelled from outside:
+        cancelling the write in flight loses its batch."""
+        return {task for task in (self.task, self._in_flight, self.replay_task) if task}
+
+    async def put(self, metrics: Metrics) -> None:
+        """This method queues metrics for saving; it waits while the queue is full."""
+        if self._closed:
+            self.dropped_rows += 1
+            return
+        try:
+            self.queue.put_nowait(metrics)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(metrics), self.put_timeout_sec)
+            except asyncio.TimeoutError:
+                self.dropped_rows += 1
+                self.logger.warning(
+                    "metrics queue is full: dropping metrics",
+                    site_id=metrics.site_id,
+                    dropped_rows=self.dropped_rows,
+                )
+                return
+        if self.queue.qsize() >= self.batch_size - 1:
+            self._batch_ready.set()
+
+    async def close(self) -> None:
+        """This method stops accepting metrics and flushes everything that is queued."""
+        self._closed = True
+        for task in (self.task, self.replay_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if self._in_flight:
+            await asyncio.gather(self._in_flight, return_exceptions=True)
+        await self._flush(self._pending)
+        self._pending = []
+        while not self.queue.empty():
+            await self._flush(self._take(self.batch_size))
+        if self.spool:
+            self.spool.close()
+        self.logger.info(
+            "metrics sink closed",
+            flushed_rows=self.flushed_rows,
+            dropped_rows=self.dropped_rows,
+            failed_rows=self.failed_rows,
+        )
+
+    async def replay(self) -> int:
+        """This method saves spooled metrics to a database until the spool is empty
+        and returns how many rows were replayed. It raises `QueryException`,
+        the rows that are not saved yet stay in the spool then."""
+        if self.spool is None:
+            return 0
+        loop = asyncio.get_running_loop()
+        replayed = 0
+        while self.spool.depth_rows:
+            batch, cursor = await loop.run_in_executor(
+                None, self.spool.read, self.replay_batch_size
+            )
+            if not batch:
+                break
+            start = time.perf_counter()
+            await self.db_conn.save_metrics_batch(batch)
+            REPLAY_SECONDS.observe(time.perf_counter() - start)
+            await loop.run_in_executor(None, self.spool.commit, cursor, len(batch))
+            replayed += len(batch)
+        if replayed:
+            self.logger.info("spooled metrics replayed", rows=replayed)
+        return replayed
+
+    async def _replay_periodically(self) -> None:
+        while True:
+            try:
+                await self.replay()
+            except QueryException as error:
+                self.logger.warning("cannot replay spooled metrics", error=error)
+            await asyncio.sleep(self.replay_interval_sec)
+
+    async def _run(self) -> None:
+        while True:
+            self._pending = [await self.queue.get()]
+            if self.queue.qsize() < self.batch_size - 1:
+                self._batch_ready.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), self.flush_interval_sec
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self._pending.extend(self._take(self.batch_size - 1))
+            batch, self._pending = self._pending, []
+            # The write itself is shielded, so a cancellation during shutdown
+            # lets `close` wait for it instead of losing track of the batch.
+            self._in_flight = asyncio.create_task(self._flush(batch))
+            await asyncio.shield(self._in_flight)
+            self._in_flight = None
+
+    def _take(self, limit: int) -> List[Metrics]:
+        batch: List[Metrics] = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[Metrics]) -> None:
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            await self.db_conn.save_metrics_batch(batch)
+        except QueryException:
+            await self._spool(batch)
+            return
+        finally:
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+        self.flushed_rows += len(batch)
+        self.logger.debug("metrics flushed to a database", rows=len(batch))
+
+    async def _spool(self, batch: List[Metrics]) -> None:
+        spooled = 0
+        if self.spool:
+            try:
+                spooled = await asyncio.get_running_loop().run_in_executor(
+                    None, self.spool.append, batch
+                )
+            except OSError as error:
+                self.logger.error("cannot spool metrics", error=error)
+        self.failed_rows += len(batch) - spooled
@@ -0,0 +1,2 @@
+DROP INDEX IF EXISTS uq__metrics__site_id__timestamp;
+CREATE INDEX IF NOT EXISTS idx__metrics__site_id__timestamp on metrics(site_id, "timestamp");
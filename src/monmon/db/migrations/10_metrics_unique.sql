@@ -0,0 +1,9 @@
+-- depends: 9_watch_list_max_body_bytes
+-- A check of a site is saved once, so a replayed batch of the spool doesn't duplicate
+-- metrics and a timestamp is an exact keyset cursor for streamed metrics.
+DELETE FROM metrics a USING metrics b
+WHERE a.site_id = b.site_id AND a."timestamp" = b."timestamp"
+    AND a.tableoid = b.tableoid AND a.ctid < b.ctid;
+
+DROP INDEX IF EXISTS idx__metrics__site_id__timestamp;
+CREATE UNIQUE INDEX IF NOT EXISTS uq__metrics__site_id__timestamp on metrics(site_id, "timestamp");
@@ -0,0 +1,5 @@
+ALTER TABLE metrics
+    DROP COLUMN IF EXISTS dns_time,
+    DROP COLUMN IF EXISTS connect_time,
+    DROP COLUMN IF EXISTS ttfb,
+    DROP COLUMN IF EXISTS body_time;
@@ -0,0 +1,6 @@
+-- depends: 1_init_db
+ALTER TABLE metrics
+    ADD COLUMN IF NOT EXISTS dns_time bigint,
+    ADD COLUMN IF NOT EXISTS connect_time bigint,
+    ADD COLUMN IF NOT EXISTS ttfb bigint,
+    ADD COLUMN IF NOT EXISTS body_time bigint;
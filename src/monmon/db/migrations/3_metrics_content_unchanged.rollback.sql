@@ -0,0 +1 @@
+ALTER TABLE metrics DROP COLUMN IF EXISTS content_unchanged;
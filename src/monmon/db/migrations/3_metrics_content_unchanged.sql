@@ -0,0 +1,2 @@
+-- depends: 2_metrics_timings
+ALTER TABLE metrics ADD COLUMN IF NOT EXISTS content_unchanged boolean not null default false;
@@ -0,0 +1,26 @@
+CREATE TABLE metrics_unpartitioned (
+    site_id bigint not null references watch_list(site_id),
+    "timestamp" timestamp with time zone not null,
+    response_time bigint not null,
+    status_code smallint not null,
+    content varchar(256),
+    dns_time bigint,
+    connect_time bigint,
+    ttfb bigint,
+    body_time bigint,
+    content_unchanged boolean not null default false
+);
+
+INSERT INTO metrics_unpartitioned (
+    site_id, "timestamp", response_time, status_code, content,
+    dns_time, connect_time, ttfb, body_time, content_unchanged
+)
+SELECT
+    site_id, "timestamp", response_time, status_code, content,
+    dns_time, connect_time, ttfb, body_time, content_unchanged
+FROM metrics;
+
+DROP TABLE metrics;
+ALTER TABLE metrics_unpartitioned RENAME TO metrics;
+
+CREATE INDEX IF NOT EXISTS idx__metrics__site_id__timestamp on metrics(site_id, "timestamp");
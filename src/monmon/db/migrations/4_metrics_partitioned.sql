@@ -0,0 +1,57 @@
+-- depends: 3_metrics_content_unchanged
+ALTER TABLE metrics RENAME TO metrics_unpartitioned;
+ALTER INDEX idx__metrics__site_id__timestamp RENAME TO idx__metrics_unpartitioned__site_id__timestamp;
+
+CREATE TABLE metrics (
+    site_id bigint not null references watch_list(site_id),
+    "timestamp" timestamp with time zone not null,
+    response_time bigint not null,
+    status_code smallint not null,
+    content varchar(256),
+    dns_time bigint,
+    connect_time bigint,
+    ttfb bigint,
+    body_time bigint,
+    content_unchanged boolean not null default false
+) PARTITION BY RANGE ("timestamp");
+
+CREATE INDEX IF NOT EXISTS idx__metrics__site_id__timestamp on metrics(site_id, "timestamp");
+
+-- Rows of days without a partition land here until the app creates the partition.
+CREATE TABLE IF NOT EXISTS metrics_default PARTITION OF metrics DEFAULT;
+
+-- One partition per UTC day for the existing rows and the next few days.
+DO $$
+DECLARE
+    day date;
+BEGIN
+    FOR day IN
+        SELECT generate_series(
+            coalesce(
+                (SELECT min("timestamp") AT TIME ZONE 'UTC' FROM metrics_unpartitioned)::date,
+                (now() AT TIME ZONE 'UTC')::date
+            ),
+            (now() AT TIME ZONE 'UTC')::date + 3,
+            interval '1 day'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF metrics FOR VALUES FROM (%L) TO (%L)',
+            'metrics_p' || to_char(day, 'YYYYMMDD'),
+            day::text || ' 00:00:00+00',
+            (day + 1)::text || ' 00:00:00+00'
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO metrics (
+    site_id, "timestamp", response_time, status_code, content,
+    dns_time, connect_time, ttfb, body_time, content_unchanged
+)
+SELECT
+    site_id, "timestamp", response_time, status_code, content,
+    dns_time, connect_time, ttfb, body_time, content_unchanged
+FROM metrics_unpartitioned;
+
+DROP TABLE metrics_unpartitioned;
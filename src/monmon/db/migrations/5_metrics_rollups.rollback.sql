@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS metrics_rollup_hour;
+DROP TABLE IF EXISTS metrics_rollup_minute;
@@ -0,0 +1,30 @@
+-- depends: 4_metrics_partitioned
+CREATE TABLE IF NOT EXISTS metrics_rollup_minute (
+    site_id bigint not null references watch_list(site_id),
+    bucket timestamp with time zone not null,
+    checks integer not null,
+    up_checks integer not null,
+    response_time_avg bigint not null,
+    response_time_p50 bigint not null,
+    response_time_p95 bigint not null,
+    response_time_p99 bigint not null,
+    status_counts jsonb not null,
+    primary key (site_id, bucket)
+);
+
+CREATE INDEX IF NOT EXISTS idx__metrics_rollup_minute__bucket on metrics_rollup_minute(bucket);
+
+CREATE TABLE IF NOT EXISTS metrics_rollup_hour (
+    site_id bigint not null references watch_list(site_id),
+    bucket timestamp with time zone not null,
+    checks integer not null,
+    up_checks integer not null,
+    response_time_avg bigint not null,
+    response_time_p50 bigint not null,
+    response_time_p95 bigint not null,
+    response_time_p99 bigint not null,
+    status_counts jsonb not null,
+    primary key (site_id, bucket)
+);
+
+CREATE INDEX IF NOT EXISTS idx__metrics_rollup_hour__bucket on metrics_rollup_hour(bucket);
@@ -0,0 +1,6 @@
+-- depends: 5_metrics_rollups
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id varchar(128) primary key,
+    started_at timestamp with time zone not null default now(),
+    heartbeat_at timestamp with time zone not null default now()
+);
@@ -0,0 +1,4 @@
+DROP TRIGGER IF EXISTS watch_list_updated ON watch_list;
+DROP TRIGGER IF EXISTS watch_list_inserted ON watch_list;
+DROP FUNCTION IF EXISTS notify_watch_list_changes();
+ALTER TABLE watch_list DROP COLUMN IF EXISTS active;
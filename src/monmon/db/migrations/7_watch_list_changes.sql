@@ -0,0 +1,31 @@
+-- depends: 6_workers
+-- Deleted sites are only deactivated, their metrics and rollups still reference them.
+ALTER TABLE watch_list ADD COLUMN IF NOT EXISTS active boolean not null default true;
+
+-- Every statement that changes the watch list notifies the workers about the changed
+-- sites, a payload is limited to 8000 bytes, so big changes only ask for a full sync.
+CREATE OR REPLACE FUNCTION notify_watch_list_changes() RETURNS trigger AS $$
+DECLARE
+    changed_count bigint;
+    site_ids text;
+BEGIN
+    SELECT count(*), string_agg(site_id::text, ',') INTO changed_count, site_ids
+    FROM (SELECT site_id FROM changed LIMIT 501) AS limited;
+    IF changed_count = 0 THEN
+        RETURN NULL;
+    END IF;
+    IF changed_count > 500 THEN
+        site_ids := '';
+    END IF;
+    PERFORM pg_notify('watch_list', site_ids);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER watch_list_inserted AFTER INSERT ON watch_list
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_watch_list_changes();
+
+CREATE TRIGGER watch_list_updated AFTER UPDATE ON watch_list
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_watch_list_changes();
@@ -0,0 +1,19 @@
+CREATE OR REPLACE FUNCTION notify_watch_list_changes() RETURNS trigger AS $$
+DECLARE
+    changed_count bigint;
+    site_ids text;
+BEGIN
+    SELECT count(*), string_agg(site_id::text, ',') INTO changed_count, site_ids
+    FROM (SELECT site_id FROM changed LIMIT 501) AS limited;
+    IF changed_count = 0 THEN
+        RETURN NULL;
+    END IF;
+    IF changed_count > 500 THEN
+        site_ids := '';
+    END IF;
+    PERFORM pg_notify('watch_list', site_ids);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP INDEX IF EXISTS idx__watch_list__url;
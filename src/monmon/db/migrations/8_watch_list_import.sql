@@ -0,0 +1,27 @@
+-- depends: 7_watch_list_changes
+-- Imports skip URLs that are monitored already.
+CREATE INDEX IF NOT EXISTS idx__watch_list__url on watch_list(url) where active;
+
+-- A big change, e.g. a chunk of an import, notifies about the range of changed ids
+-- instead of asking for a full sync, so workers only read the changed part of the list.
+CREATE OR REPLACE FUNCTION notify_watch_list_changes() RETURNS trigger AS $$
+DECLARE
+    changed_count bigint;
+    first_id bigint;
+    last_id bigint;
+    site_ids text;
+BEGIN
+    SELECT count(*), min(site_id), max(site_id) INTO changed_count, first_id, last_id
+    FROM changed;
+    IF changed_count = 0 THEN
+        RETURN NULL;
+    END IF;
+    IF changed_count > 500 THEN
+        site_ids := first_id::text || '-' || last_id::text;
+    ELSE
+        SELECT string_agg(site_id::text, ',') INTO site_ids FROM changed;
+    END IF;
+    PERFORM pg_notify('watch_list', site_ids);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1 @@
+ALTER TABLE watch_list DROP COLUMN IF EXISTS max_body_bytes;
@@ -0,0 +1,3 @@
+-- depends: 8_watch_list_import
+-- The biggest body a check of the site reads, null means the limit of the client.
+ALTER TABLE watch_list ADD COLUMN IF NOT EXISTS max_body_bytes integer;
@@ -1,11 +1,124 @@
 """Module abstract database connection, so you don't care what driver you use"""
-from typing import Iterator, Any
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Iterator, Any, List, Callable, TypeVar, Dict
 
 import psycopg2 as pg
 import structlog
-from psycopg2 import OperationalError
+from psycopg2 import OperationalError, sql
+from psycopg2.extensions import connection, cursor
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 from monmon.db.pg.exceptions import OpenConnectionException, QueryException
+from monmon.instrumentation.prometheus import REGISTRY
+
+T = TypeVar("T")
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "monmon_db_query_seconds",
+    "Time of a database call including the wait for a connection, by the method",
+    ("method",),
+)
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "monmon_db_pool_wait_seconds", "Time spent waiting for a free connection"
+)
+DB_ERRORS = REGISTRY.counter(
+    "monmon_db_errors_total", "Database calls that failed, by the method", ("method",)
+)
+
+
+async def run_counted(
+    executor: ThreadPoolExecutor | None,
+    func: Callable[[], T],
+    method: str,
+    start: float | None = None,
+) -> T:
+    """Run the blocking call in the executor, record its time since `start` and
+    count it as failed when it raises `QueryException`. The metrics are updated
+    here, on the event loop, not in the thread of the executor."""
+    if start is None:
+        start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func)
+    except QueryException:
+        DB_ERRORS.inc((method,))
+        raise
+    finally:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, (method,))
+
+
+class PoolStats:
+    """
+    Counters of the connection pool usage.
+
+    Attributes
+    ---------
+    checkouts:
+        how many times a connection was taken from the pool
+    waiting:
+        how many queries are waiting for a free connection right now
+    wait_sec_total:
+        total time that queries spent waiting for a free connection
+    wait_sec_max:
+        the longest time that a query waited for a free connection
+    reconnects:
+        how many broken connections were replaced with new ones
+    """
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.waiting = 0
+        self.wait_sec_total = 0.0
+        self.wait_sec_max = 0.0
+        self.reconnects = 0
+
+
+class Listener:
+    """
+    A dedicated connection subscribed to a channel with `LISTEN`.
+    It isn't taken from the pool, so a long subscription never holds a query slot.
+    The event loop watches the socket of the connection and calls back on every
+    notification, nothing polls Postgres.
+
+    Attributes
+    ---------
+    alive:
+        False once the connection is lost or closed, notifications sent after that
+        are missed, so the subscriber has to listen again and catch up
+    """
+
+    def __init__(
+        self, conn: connection, callback: Callable[[str], None], logger: Any
+    ) -> None:
+        self.conn = conn
+        self.callback = callback
+        self.alive = True
+        self.logger = logger
+        # The descriptor is kept, `fileno` raises once the connection is lost.
+        self._fd = conn.fileno()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            self.conn.poll()
+        except pg.Error as error:
+            self.logger.error("the listening connection is lost", error=error)
+            self.close()
+            return
+        while self.conn.notifies:
+            self.callback(self.conn.notifies.pop(0).payload)
+
+    def close(self) -> None:
+        """Stop listening and close the connection."""
+        if not self.alive:
+            return
+        self.alive = False
+        self._loop.remove_reader(self._fd)
+        self.conn.close()
 
 
 class PgConnector:
@@ -13,31 +126,62 @@ class PgConnector:
     This class functions as a PostgreSQL connector,
     enabling users to establish a connection and perform
     database-related tasks.
-    The connection is automatically terminated upon the class's destruction.
+    The connections are automatically terminated upon the class's destruction.
+
+    psycopg2 is a blocking driver, so every query is executed in an executor thread
+    with its own connection from the pool. The event loop only awaits the result
+    and keeps serving other checks and web requests while Postgres is busy.
+    A connection that was idle for longer than `health_check_idle_sec` is pinged
+    before use, and a broken connection is replaced and the query is retried once.
 
     Attributes
     ---------
     logger:
         an instance of main logger
-    conn:
-        database connection
+    pool:
+        database connections pool
+    executor:
+        the thread pool where blocking driver calls are executed
+    stats:
+        counters of the pool usage
     """
 
-    def __init__(self, dsn: str) -> None:
+    def __init__(
+        self,
+        dsn: str,
+        pool_min_size: int = 1,
+        pool_max_size: int = 10,
+        health_check_idle_sec: float = 30,
+    ) -> None:
         """
         :param dsn: str
             credentials for database connection
+        :param pool_min_size: int
+            how many connections are opened at start and kept open
+        :param pool_max_size: int
+            how many connections can be opened at the same time
+        :param health_check_idle_sec: float
+            ping a connection before use if it was idle for longer than this
         """
         self.logger = structlog.getLogger("main_logger")
+        self.dsn = dsn
+        self.health_check_idle_sec = health_check_idle_sec
+        self.stats = PoolStats()
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_max_size, thread_name_prefix="pg"
+        )
+        self._slots = asyncio.Semaphore(pool_max_size)
+        self._last_used: Dict[int, float] = {}
 
         try:
-            self.conn = pg.connect(dsn)
+            self.pool = ThreadedConnectionPool(pool_min_size, pool_max_size, dsn)
         except OperationalError as error:
             self.logger.error("cannot connect to a postgres", error=error)
+            self.executor.shutdown(wait=False)
             raise OpenConnectionException(error) from error
 
     async def query(self, query: str, params=None) -> Iterator[Any] | None:
-        """Execute query with its params.
+        """Execute query with its params without blocking the event loop.
 
         :param query: str
             query that must be executed
@@ -45,19 +189,262 @@ class PgConnector:
             params for current query
         :return: None
         """
-        with self.conn:
-            with self.conn.cursor() as curr:
-                try:
-                    curr.execute(query, params)
-                except pg.Error as error:
-                    self.logger.error("error while executing a query", error=error)
-                    raise QueryException(error) from error
-                if curr.description:
-                    return iter(curr.fetchall())
-                return None
+
+        def work(curr: cursor) -> Iterator[Any] | None:
+            curr.execute(query, params)
+            if curr.description:
+                return iter(curr.fetchall())
+            return None
+
+        return await self._run(work, "query")
+
+    async def query_values(
+        self,
+        query: str,
+        values: List[tuple],
+        template: str | None = None,
+        fetch: bool = False,
+    ) -> Iterator[Any] | None:
+        """Execute a multi-row statement, e.g. `insert ... values %s`,
+        for all given rows in one transaction without blocking the event loop.
+
+        :param query: str
+            query with a single `%s` placeholder for the rows
+        :param values: list
+            rows that must be expanded into the query
+        :param template: str
+            template of a single row, e.g. `(%s, %s)`
+        :param fetch: bool
+            return rows produced by a `returning` clause
+        :return: None
+        """
+
+        def work(curr: cursor) -> Iterator[Any] | None:
+            rows = execute_values(
+                curr,
+                query,
+                values,
+                template=template,
+                page_size=max(len(values), 1),
+                fetch=fetch,
+            )
+            if fetch:
+                return iter(rows)
+            return None
+
+        return await self._run(work, "query_values")
+
+    async def stream(
+        self, query: str, params=None, batch_size: int = 1000
+    ) -> AsyncGenerator[List[Any], None]:
+        """Execute query with a server-side cursor and yield its rows in batches,
+        so a big result is never loaded into memory at once.
+
+        The connection is held until the iteration ends, so iterate it
+        with `contextlib.aclosing` or `aclose` it when you stop early.
+
+        :param query: str
+            query that must be executed
+        :param params: dict
+            params for current query
+        :param batch_size: int
+            how many rows are fetched from Postgres at a time
+        :return: lists of at most `batch_size` rows
+        """
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            opening = loop.run_in_executor(
+                self.executor, self._open_cursor, query, params
+            )
+            try:
+                conn, curr = await asyncio.shield(opening)
+            except asyncio.CancelledError:
+                # The cursor is still being opened in a thread, close it once it is.
+                opening.add_done_callback(self._close_abandoned)
+                raise
+            except QueryException:
+                DB_ERRORS.inc(("stream",))
+                raise
+            try:
+                while True:
+                    fetch_start = time.perf_counter()
+                    rows = await loop.run_in_executor(
+                        self.executor, self._fetch, curr, batch_size
+                    )
+                    DB_QUERY_SECONDS.observe(
+                        time.perf_counter() - fetch_start, ("stream_fetch",)
+                    )
+                    if not rows:
+                        return
+                    yield rows
+            except QueryException:
+                DB_ERRORS.inc(("stream",))
+                raise
+            finally:
+                await loop.run_in_executor(
+                    self.executor, self._close_cursor, conn, curr
+                )
+        finally:
+            self._slots.release()
+
+    async def listen(self, channel: str, callback: Callable[[str], None]) -> Listener:
+        """Subscribe to notifications that are sent with `NOTIFY channel, payload`.
+
+        :param channel: str
+            name of the channel
+        :param callback: Callable
+            called in the event loop with the payload of every notification
+        :return: the subscription, close it to stop listening
+        """
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(self.executor, self._open_listener, channel)
+        return Listener(conn, callback, self.logger)
+
+    def _open_listener(self, channel: str) -> connection:
+        try:
+            conn = pg.connect(self.dsn)
+        except OperationalError as error:
+            self.logger.error("cannot connect to a postgres", error=error)
+            raise QueryException(error) from error
+        try:
+            conn.autocommit = True
+            with conn.cursor() as curr:
+                curr.execute(sql.SQL("listen {};").format(sql.Identifier(channel)))
+        except pg.Error as error:
+            conn.close()
+            self.logger.error("cannot listen to a channel", error=error)
+            raise QueryException(error) from error
+        return conn
+
+    def _open_cursor(self, query: str, params) -> tuple[connection, cursor]:
+        """Declare a server-side cursor for the query in a new transaction."""
+        conn = self._checkout()
+        try:
+            curr = conn.cursor(name=f"stream_{id(conn)}")
+            curr.execute(query, params)
+        except pg.Error as error:
+            self._checkin(conn, broken=conn.closed != 0)
+            self.logger.error("error while executing a query", error=error)
+            raise QueryException(error) from error
+        return conn, curr
+
+    def _close_abandoned(self, opening: asyncio.Future) -> None:
+        if not opening.cancelled() and opening.exception() is None:
+            self.executor.submit(self._close_cursor, *opening.result())
+
+    def _fetch(self, curr: cursor, size: int) -> List[Any]:
+        try:
+            return curr.fetchmany(size)
+        except pg.Error as error:
+            self.logger.error("error while fetching rows", error=error)
+            raise QueryException(error) from error
+
+    def _close_cursor(self, conn: connection, curr: cursor) -> None:
+        """Close the cursor, end its read-only transaction and return the connection."""
+        try:
+            curr.close()
+            conn.rollback()
+        except pg.Error as error:
+            self.logger.warning("cannot close a server-side cursor", error=error)
+        self._checkin(conn, broken=conn.closed != 0)
+
+    async def _acquire(self) -> None:
+        """Wait for a free connection slot."""
+        self.stats.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats.waiting -= 1
+        waited = time.perf_counter() - start
+        self.stats.checkouts += 1
+        self.stats.wait_sec_total += waited
+        self.stats.wait_sec_max = max(self.stats.wait_sec_max, waited)
+        DB_POOL_WAIT_SECONDS.observe(waited)
+
+    async def _run(self, work: Callable[[cursor], T], method: str) -> T:
+        """Wait for a free connection and run the work in the executor."""
+        start = time.perf_counter()
+        await self._acquire()
+        try:
+            return await run_counted(
+                self.executor, functools.partial(self._execute, work), method, start
+            )
+        finally:
+            self._slots.release()
+
+    def _execute(self, work: Callable[[cursor], T]) -> T:
+        """Run the work in a transaction of a pooled connection in the calling thread.
+        If the connection turns out to be broken, the work is retried once with a new one.
+        """
+        attempts = 2
+        for attempt in range(1, attempts + 1):
+            conn = self._checkout()
+            try:
+                with conn:
+                    with conn.cursor() as curr:
+                        result = work(curr)
+            except pg.Error as error:
+                broken = conn.closed != 0
+                self._checkin(conn, broken)
+                if broken and attempt < attempts:
+                    self.stats.reconnects += 1
+                    self.logger.warning(
+                        "the connection to a postgres is broken: reconnecting",
+                        error=error,
+                    )
+                    continue
+                self.logger.error("error while executing a query", error=error)
+                raise QueryException(error) from error
+            self._checkin(conn)
+            return result
+        raise QueryException("no attempts left to execute a query")
+
+    def _checkout(self) -> connection:
+        """Take a connection from the pool and make sure it is alive."""
+        try:
+            conn = self.pool.getconn()
+            if conn.closed:
+                self._checkin(conn, broken=True)
+                conn = self.pool.getconn()
+            idle_since = self._last_used.get(id(conn), time.monotonic())
+            if time.monotonic() - idle_since > self.health_check_idle_sec:
+                conn = self._ping(conn)
+        except OperationalError as error:
+            self.logger.error("cannot connect to a postgres", error=error)
+            raise QueryException(error) from error
+        return conn
+
+    def _ping(self, conn: connection) -> connection:
+        """Check that an idle connection is alive, otherwise replace it."""
+        try:
+            with conn.cursor() as curr:
+                curr.execute("select 1;")
+            conn.rollback()
+            return conn
+        except pg.Error as error:
+            self.stats.reconnects += 1
+            self.logger.warning(
+                "an idle connection to a postgres is broken: reconnecting",
+                error=error,
+            )
+            self._checkin(conn, broken=True)
+            return self.pool.getconn()
+
+    def _checkin(self, conn: connection, broken: bool = False) -> None:
+        """Return a connection to the pool, broken connections are closed."""
+        if broken:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        self.pool.putconn(conn, close=broken)
 
     def __del__(self) -> None:
+        if not hasattr(self, "pool"):
+            return
+        self.executor.shutdown(wait=False)
         try:
-            self.conn.close()
+            self.pool.closeall()
         except OperationalError as error:
             self.logger.error("cannot close connection to a postgres", error=error)
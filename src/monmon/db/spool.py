@@ -0,0 +1,335 @@
+"""This module keeps metrics on disk while a database is unreachable."""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, List
+
+import structlog
+
+from monmon.custom_types.watch_list import Metrics
+
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+# Every record is framed by the length and the CRC32 of its payload,
+# so a torn write at the end of a segment is found on recovery.
+FRAME = struct.Struct("<II")
+# site_id, status_code, timestamp_ns, response_time, dns_time, connect_time,
+# ttfb, body_time (-1 for None) and flags; the content follows in UTF-8.
+FIELDS = struct.Struct("<qhqqqqqqB")
+UNCHANGED = 1
+HAS_CONTENT = 2
+
+
+def encode(metrics: Metrics) -> bytes:
+    """A framed record of metrics"""
+    flags = UNCHANGED if metrics.content_unchanged else 0
+    content = b""
+    if metrics.content is not None:
+        flags |= HAS_CONTENT
+        content = metrics.content.encode()
+    payload = (
+        FIELDS.pack(
+            metrics.site_id,
+            metrics.status_code,
+            metrics.timestamp_ns,
+            metrics.response_time,
+            *(
+                -1 if value is None else value
+                for value in (
+                    metrics.dns_time,
+                    metrics.connect_time,
+                    metrics.ttfb,
+                    metrics.body_time,
+                )
+            ),
+            flags,
+        )
+        + content
+    )
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(payload: bytes) -> Metrics:
+    """Metrics from the payload of a record"""
+    (
+        site_id,
+        status_code,
+        timestamp_ns,
+        response_time,
+        dns_time,
+        connect_time,
+        ttfb,
+        body_time,
+        flags,
+    ) = FIELDS.unpack_from(payload)
+    return Metrics(
+        site_id,
+        status_code,
+        timestamp_ns,
+        response_time,
+        payload[FIELDS.size :].decode() if flags & HAS_CONTENT else None,
+        dns_time=None if dns_time < 0 else dns_time,
+        connect_time=None if connect_time < 0 else connect_time,
+        ttfb=None if ttfb < 0 else ttfb,
+        body_time=None if body_time < 0 else body_time,
+        content_unchanged=bool(flags & UNCHANGED),
+    )
+
+
+def _scan(data: bytes, end: int | None = None) -> tuple[int, int]:
+    """How many valid records the data starts with (up to the `end` offset)
+    and where they end"""
+    end = len(data) if end is None else min(end, len(data))
+    records = 0
+    offset = 0
+    while offset + FRAME.size <= end:
+        length, crc = FRAME.unpack_from(data, offset)
+        record_end = offset + FRAME.size + length
+        if length < FIELDS.size or record_end > end:
+            break
+        if zlib.crc32(data[offset + FRAME.size : record_end]) != crc:
+            break
+        records += 1
+        offset = record_end
+    return records, offset
+
+
+class MetricsSpool:
+    """
+    This class is an append-only spool of metrics on disk for the time
+    a database is unreachable. Batches that cannot be written are appended
+    to the active segment file, the segment is sealed once it grows
+    to `segment_bytes`, and replayed segments are deleted.
+    Records are read through mmap and never change once written.
+
+    Every append is fsynced before it returns (unless `fsync` is off),
+    and the replay position is kept in a cursor file that is replaced atomically,
+    so a crash loses at most a torn record at the end of a segment:
+    it is cut off on recovery. A crash between a replayed batch and its
+    cursor makes the batch replay once more.
+
+    Batches that don't fit into `max_bytes` on disk are dropped.
+    The methods block on disk I/O, the sink runs them in an executor.
+
+    Attributes
+    ---------
+    depth_rows:
+        rows in the spool that are not replayed yet
+    depth_bytes:
+        bytes of the rows that are not replayed yet
+    spooled_rows:
+        how many rows were appended
+    replayed_rows:
+        how many rows were read back and committed
+    dropped_rows:
+        how many rows were dropped because the spool was full
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        segment_bytes: int = 4 * 1024 * 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        fsync: bool = True,
+    ) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.depth_rows = 0
+        self.depth_bytes = 0
+        self.spooled_rows = 0
+        self.replayed_rows = 0
+        self.dropped_rows = 0
+        self.logger = structlog.getLogger("main_logger")
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._sizes: Dict[int, int] = {}
+        self._cursor = (1, 0)
+        self._next_seq = 1
+        self._active: int | None = None
+        self._fd: int | None = None
+
+    def open(self) -> None:
+        """This method recovers the spool left by a previous run: torn records
+        at the ends of segments are cut off and replayed segments are deleted."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            segments = sorted(
+                int(name[: -len(SEGMENT_SUFFIX)])
+                for name in os.listdir(self.directory)
+                if name.endswith(SEGMENT_SUFFIX)
+            )
+            self._cursor = self._read_cursor() or (
+                segments[0] if segments else 1,
+                0,
+            )
+            self._next_seq = max(segments + [self._cursor[0]]) + 1
+            for seq in segments:
+                if seq < self._cursor[0]:
+                    os.remove(self._path(seq))
+                    continue
+                self._recover(seq)
+            self.logger.info(
+                "metrics spool opened",
+                directory=self.directory,
+                segments=len(self._segments),
+                rows=self.depth_rows,
+            )
+
+    def close(self) -> None:
+        """This method closes the active segment, the spool is kept on disk."""
+        with self._lock:
+            self._seal()
+
+    def append(self, batch: List[Metrics]) -> int:
+        """This method appends metrics and returns how many of them were spooled,
+        the rest didn't fit into `max_bytes`."""
+        records = [encode(metrics) for metrics in batch]
+        with self._lock:
+            on_disk = sum(self._sizes.values())
+            fits = 0
+            size = 0
+            for record in records:
+                if on_disk + size + len(record) > self.max_bytes:
+                    break
+                size += len(record)
+                fits += 1
+            if fits:
+                self._write(b"".join(records[:fits]))
+                self.depth_rows += fits
+                self.depth_bytes += size
+                self.spooled_rows += fits
+            if fits < len(records):
+                self.dropped_rows += len(records) - fits
+                self.logger.warning(
+                    "metrics spool is full: dropping metrics",
+                    dropped_rows=len(records) - fits,
+                    max_bytes=self.max_bytes,
+                )
+            return fits
+
+    def read(self, limit: int) -> tuple[List[Metrics], tuple[int, int]]:
+        """Up to `limit` of the oldest metrics and the cursor after them,
+        pass the cursor to `commit` once they are saved."""
+        with self._lock:
+            batch: List[Metrics] = []
+            seq, offset = self._cursor
+            for segment in self._segments:
+                if segment < seq:
+                    continue
+                if segment > seq:
+                    seq, offset = segment, 0
+                size = self._sizes[segment]
+                if offset < size:
+                    with open(self._path(segment), "rb") as file, mmap.mmap(
+                        file.fileno(), size, access=mmap.ACCESS_READ
+                    ) as data:
+                        while len(batch) < limit and offset < size:
+                            length, _ = FRAME.unpack_from(data, offset)
+                            start = offset + FRAME.size
+                            batch.append(decode(data[start : start + length]))
+                            offset = start + length
+                if len(batch) == limit:
+                    break
+            return batch, (seq, offset)
+
+    def commit(self, cursor: tuple[int, int], rows: int) -> None:
+        """This method marks the rows up to the cursor as replayed
+        and deletes the segments that are replayed completely."""
+        with self._lock:
+            self.depth_bytes -= self._bytes_between(self._cursor, cursor)
+            self.depth_rows -= rows
+            self.replayed_rows += rows
+            seq, offset = cursor
+            if seq in self._sizes and offset == self._sizes[seq]:
+                if seq == self._active:
+                    self._seal()
+                seq, offset = seq + 1, 0
+            self._cursor = (seq, offset)
+            self._write_cursor()
+            for segment in [segment for segment in self._segments if segment < seq]:
+                os.remove(self._path(segment))
+                self._segments.remove(segment)
+                del self._sizes[segment]
+
+    def _bytes_between(self, start: tuple[int, int], end: tuple[int, int]) -> int:
+        total = 0
+        for segment in self._segments:
+            if start[0] <= segment <= end[0]:
+                first = start[1] if segment == start[0] else 0
+                last = end[1] if segment == end[0] else self._sizes[segment]
+                total += last - first
+        return total
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _recover(self, seq: int) -> None:
+        path = self._path(seq)
+        with open(path, "rb") as file:
+            data = file.read()
+        records, end = _scan(data)
+        if end < len(data):
+            self.logger.warning(
+                "a torn record is cut off the metrics spool",
+                segment=path,
+                bytes=len(data) - end,
+            )
+            with open(path, "r+b") as file:
+                file.truncate(end)
+                os.fsync(file.fileno())
+        start = self._cursor[1] if seq == self._cursor[0] else 0
+        if start >= end:
+            # The segment was replayed before the crash, only its deletion was lost.
+            os.remove(path)
+            return
+        replayed, _ = _scan(data, start)
+        self._segments.append(seq)
+        self._sizes[seq] = end
+        self.depth_rows += records - replayed
+        self.depth_bytes += end - start
+
+    def _write(self, data: bytes) -> None:
+        if self._fd is None or self._active is None:
+            self._active = self._next_seq
+            self._next_seq += 1
+            self._fd = os.open(
+                self._path(self._active), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+            )
+            self._segments.append(self._active)
+            self._sizes[self._active] = 0
+        os.write(self._fd, data)
+        if self.fsync:
+            os.fsync(self._fd)
+        self._sizes[self._active] += len(data)
+        if self._sizes[self._active] >= self.segment_bytes:
+            self._seal()
+
+    def _seal(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self._active = None
+
+    def _read_cursor(self) -> tuple[int, int] | None:
+        try:
+            with open(
+                os.path.join(self.directory, CURSOR_FILE), encoding="utf-8"
+            ) as file:
+                seq, offset = file.read().split()
+            return int(seq), int(offset)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cursor(self) -> None:
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(f"{self._cursor[0]} {self._cursor[1]}")
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,244 @@
+"""This module keeps metrics in an embedded SQLite database."""
+import asyncio
+import functools
+import math
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, Callable, Iterator, List, TypeVar
+
+import structlog
+
+from monmon.custom_types.watch_list import EPOCH, Metrics, WatchListMetrics
+from monmon.db.db_connector import metrics_from_row
+from monmon.db.pg.exceptions import OpenConnectionException, QueryException
+from monmon.db.pg.pg_connector import run_counted
+
+T = TypeVar("T")
+
+BUCKET_US = {"minute": 60 * 10**6, "hour": 3600 * 10**6}
+QUANTILES = (0.5, 0.95, 0.99)
+SCHEMA = (
+    "create table if not exists metrics ("
+    "site_id integer not null, "
+    "timestamp_us integer not null, "
+    "status_code integer not null, "
+    "response_time integer not null, "
+    "content text, "
+    "dns_time integer, "
+    "connect_time integer, "
+    "ttfb integer, "
+    "body_time integer, "
+    "content_unchanged integer not null default 0, "
+    "primary key (site_id, timestamp_us)"
+    ") without rowid;"
+)
+COLUMNS = (
+    "site_id, status_code, timestamp_us, response_time, content, "
+    "dns_time, connect_time, ttfb, body_time, content_unchanged"
+)
+
+
+def _us(moment: datetime) -> int:
+    return Metrics.timestamp_ns_of(moment) // 1000
+
+
+def _time(timestamp_us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=timestamp_us)
+
+
+def _metrics_from_row(row: tuple) -> WatchListMetrics:
+    return metrics_from_row((*row[:2], _time(row[2]), *row[3:9], bool(row[9])))
+
+
+def _rollup(bucket_us: int, response_times: List[int], statuses: dict) -> tuple:
+    """A rollup of a bucket in the shape of the rollup tables of Postgres"""
+    checks = len(response_times)
+    up_checks = sum(count for status, count in statuses.items() if int(status) < 400)
+    response_times.sort()
+    return (
+        _time(bucket_us),
+        checks,
+        up_checks,
+        up_checks / checks,
+        # Rounded half up as `round` of Postgres does.
+        (2 * sum(response_times) + checks) // (2 * checks),
+        *(response_times[math.ceil(quantile * checks) - 1] for quantile in QUANTILES),
+        statuses,
+    )
+
+
+class SqliteStorage:
+    """
+    This class keeps metrics in a SQLite file for deployments and benchmark runs
+    without a database server. The file is in WAL mode, so reads don't wait
+    for writes, and metrics are clustered by site and time (`without rowid`),
+    so the range of a site is read and aggregated straight from the primary key.
+    Rows of the same site and microsecond are saved once, so a replayed batch
+    is not saved twice.
+
+    All calls run in a single thread next to the event loop, SQLite serializes
+    writes anyway. Rollups are computed from raw metrics on every call,
+    there are no rollup tables to maintain.
+    """
+
+    def __init__(self, path: str, *, synchronous: str = "normal") -> None:
+        """
+        :param path: str
+            the database file, it is created if it doesn't exist
+        :param synchronous: str
+            `normal` may lose the last transactions on a power loss, `full` doesn't
+        """
+        self.path = path
+        self.logger = structlog.getLogger("main_logger")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        try:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("pragma journal_mode=wal;")
+            self.conn.execute(f"pragma synchronous={synchronous};")
+            self.conn.execute(SCHEMA)
+            self.conn.commit()
+        except sqlite3.Error as error:
+            self.logger.error("cannot open a sqlite database", path=path, error=error)
+            self.executor.shutdown(wait=False)
+            raise OpenConnectionException(error) from error
+
+    async def close(self) -> None:
+        """This method closes the database, waiting for running calls."""
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.conn.close)
+        self.executor.shutdown()
+
+    async def save_metrics_batch(self, batch: List[Metrics]) -> None:
+        """
+        This method saves many metrics in one transaction.
+        It raises `QueryException`.
+        :param batch: what we want to save
+        :return:
+        """
+        rows = [
+            (
+                metrics.site_id,
+                metrics.status_code,
+                metrics.timestamp_ns // 1000,
+                metrics.response_time,
+                metrics.content,
+                metrics.dns_time,
+                metrics.connect_time,
+                metrics.ttfb,
+                metrics.body_time,
+                metrics.content_unchanged,
+            )
+            for metrics in batch
+        ]
+
+        def work(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.executemany(
+                    f"insert or ignore into metrics ({COLUMNS}) "
+                    "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+                    rows,
+                )
+
+        await self._run(work, "save_metrics_batch")
+
+    async def stream_metrics(
+        self,
+        site_id: int,
+        *,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: datetime | None = None,
+        limit: int | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncGenerator[List[WatchListMetrics], None]:
+        """
+        This method streams metrics of a site in batches, oldest first,
+        the same way as `DbConnector.stream_metrics`. It raises `QueryException`.
+        :param site_id: metrics for given site
+        :param since: metrics at or after this moment
+        :param until: metrics before this moment
+        :param after: the keyset cursor, the timestamp of the last row already read
+        :param limit: stop after this many rows
+        :param batch_size: how many rows are read at a time
+        :return: batches of metrics
+        """
+        low = max(
+            _us(since) if since else -1,
+            _us(after) + 1 if after else -1,
+        )
+        high = _us(until) if until else 2**63 - 1
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = await self._query(
+                f"select {COLUMNS} from metrics where site_id = ? "
+                "and timestamp_us >= ? and timestamp_us < ? "
+                "order by timestamp_us limit ?;",
+                (site_id, low, high, size),
+                "stream_metrics",
+            )
+            if rows:
+                yield [_metrics_from_row(row) for row in rows]
+            if len(rows) < size:
+                return
+            low = rows[-1][2] + 1
+            if remaining is not None:
+                remaining -= len(rows)
+
+    async def get_rollups(
+        self, site_id: int, unit: str, since: datetime, until: datetime
+    ) -> Iterator[tuple[datetime, int, int, float, int, int, int, int, dict]] | None:
+        """
+        This method aggregates raw metrics of a site per bucket, in the shape
+        of `DbConnector.get_rollups`.
+        :param site_id: rollups for given site
+        :param unit: `minute` or `hour`
+        :param since: the start of the first bucket
+        :param until: the end of the range
+        :return: bucket, checks, up_checks, uptime, average, p50, p95 and p99
+            response time and counts of every status code
+        """
+        width = BUCKET_US[unit]
+        try:
+            rows = await self._query(
+                "select timestamp_us, status_code, response_time from metrics "
+                "where site_id = ? and timestamp_us >= ? and timestamp_us < ? "
+                "order by timestamp_us;",
+                (site_id, _us(since), _us(until)),
+                "get_rollups",
+            )
+        except QueryException:
+            return None
+        rollups = []
+        bucket = -1
+        response_times: List[int] = []
+        statuses: dict = {}
+        for timestamp_us, status_code, response_time in rows:
+            if bucket != timestamp_us // width * width:
+                if response_times:
+                    rollups.append(_rollup(bucket, response_times, statuses))
+                bucket = timestamp_us // width * width
+                response_times, statuses = [], {}
+            response_times.append(response_time)
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        if response_times:
+            rollups.append(_rollup(bucket, response_times, statuses))
+        return iter(rollups)
+
+    async def _query(self, query: str, params: tuple, method: str) -> List[tuple]:
+        return await self._run(
+            lambda conn: conn.execute(query, params).fetchall(), method
+        )
+
+    async def _run(self, work: Callable[[sqlite3.Connection], T], method: str) -> T:
+        """Run the work in the thread of the database."""
+        return await run_counted(
+            self.executor, functools.partial(self._execute, work), method
+        )
+
+    def _execute(self, work: Callable[[sqlite3.Connection], T]) -> T:
+        try:
+            return work(self.conn)
+        except sqlite3.Error as error:
+            self.logger.error("error while executing a query", error=error)
+            raise QueryException(error) from error
@@ -0,0 +1,38 @@
+"""This module describes where metrics of checks are stored."""
+from datetime import datetime
+from typing import AsyncGenerator, Iterator, List, Protocol
+
+from monmon.custom_types.watch_list import Metrics, WatchListMetrics
+
+BACKENDS = ("postgres", "sqlite")
+
+
+class MetricsStorage(Protocol):
+    """
+    A backend that keeps metrics of checks: the metrics sink writes to it
+    and the API reads from it. `DbConnector` keeps them in Postgres,
+    `SqliteStorage` in an embedded database that needs no server.
+    """
+
+    async def save_metrics_batch(self, batch: List[Metrics]) -> None:
+        """Save many metrics at once. It raises `QueryException`."""
+
+    def stream_metrics(
+        self,
+        site_id: int,
+        *,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        after: datetime | None = None,
+        limit: int | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncGenerator[List[WatchListMetrics], None]:
+        """Metrics of a site in a time range in batches, oldest first.
+        It raises `QueryException`."""
+
+    async def get_rollups(
+        self, site_id: int, unit: str, since: datetime, until: datetime
+    ) -> Iterator[tuple[datetime, int, int, float, int, int, int, int, dict]] | None:
+        """Aggregates of a site per `minute` or `hour` bucket: checks, up checks,
+        uptime, average, p50, p95 and p99 response time and counts of every
+        status code. None if they cannot be read."""
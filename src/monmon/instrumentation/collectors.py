@@ -0,0 +1,153 @@
+"""This module exposes counters that components already keep as Prometheus metrics."""
+from monmon.db.maintenance import MetricsMaintenance
+from monmon.db.metrics_sink import MetricsSink
+from monmon.db.pg.pg_connector import PgConnector
+from monmon.instrumentation.log_pipeline import LogWriter
+from monmon.instrumentation.prometheus import Registry
+from monmon.matcher.extractor import Extractor
+from monmon.requester.limiter import RequestLimiter
+from monmon.watchdog.watcher import Watcher
+
+
+def register_collectors(
+    registry: Registry,
+    *,
+    db_conn: PgConnector,
+    metrics_sink: MetricsSink,
+    limiter: RequestLimiter,
+    extractor: Extractor,
+    watcher: Watcher,
+    maintenance: MetricsMaintenance,
+    log_writer: LogWriter,
+) -> None:
+    """Register metrics that are read from the components when they are scraped"""
+    pool = db_conn.stats
+    registry.collected(
+        "monmon_db_pool_waiting",
+        "Database calls waiting for a free connection",
+        lambda: [((), pool.waiting)],
+    )
+    registry.collected(
+        "monmon_db_pool_checkouts_total",
+        "How many times a connection was taken from the pool",
+        lambda: [((), pool.checkouts)],
+        kind="counter",
+    )
+    registry.collected(
+        "monmon_db_reconnects_total",
+        "Broken database connections replaced with new ones",
+        lambda: [((), pool.reconnects)],
+        kind="counter",
+    )
+    registry.collected(
+        "monmon_metrics_queue_size",
+        "Metrics waiting in the sink to be saved to a database",
+        lambda: [((), metrics_sink.queue.qsize())],
+    )
+    registry.collected(
+        "monmon_metrics_rows_total",
+        "Metrics handled by the sink, by the outcome",
+        lambda: [
+            (("flushed",), metrics_sink.flushed_rows),
+            (("dropped",), metrics_sink.dropped_rows),
+            (("failed",), metrics_sink.failed_rows),
+        ],
+        labelnames=("outcome",),
+        kind="counter",
+    )
+    spool = metrics_sink.spool
+    if spool:
+        registry.collected(
+            "monmon_spool_depth_rows",
+            "Metrics in the spool waiting for the database to be replayed",
+            lambda: [((), spool.depth_rows)],
+        )
+        registry.collected(
+            "monmon_spool_depth_bytes",
+            "Bytes of the metrics waiting in the spool",
+            lambda: [((), spool.depth_bytes)],
+        )
+        registry.collected(
+            "monmon_spool_rows_total",
+            "Metrics handled by the spool, by the outcome",
+            lambda: [
+                (("spooled",), spool.spooled_rows),
+                (("replayed",), spool.replayed_rows),
+                (("dropped",), spool.dropped_rows),
+            ],
+            labelnames=("outcome",),
+            kind="counter",
+        )
+    registry.collected(
+        "monmon_limiter_waiting",
+        "Requests to sites waiting for the concurrency or rate limits",
+        lambda: [((), limiter.stats.waiting)],
+    )
+    registry.collected(
+        "monmon_limiter_wait_seconds_total",
+        "Total time that requests to sites spent waiting for the limits",
+        lambda: [((), limiter.stats.wait_sec_total)],
+        kind="counter",
+    )
+    registry.collected(
+        "monmon_limiter_wait_seconds_max",
+        "The longest time that a request to a site spent waiting for the limits",
+        lambda: [((), limiter.stats.wait_sec_max)],
+    )
+    registry.collected(
+        "monmon_extraction_queue_depth",
+        "Extractions waiting or running in the extraction pool",
+        lambda: [((), extractor.queue_depth)],
+    )
+    registry.collected(
+        "monmon_sites_monitored",
+        "Sites that are checked periodically",
+        lambda: [((), len(watcher.scheduler))],
+    )
+    adaptive = watcher.adaptive
+    if adaptive:
+        registry.collected(
+            "monmon_sites_backed_off",
+            "Sites checked less often than their interval because they fail or don't change",
+            lambda: [((), adaptive.backed_off())],
+        )
+        registry.collected(
+            "monmon_circuits_open",
+            "Sites that don't respond and are only probed with a short timeout",
+            lambda: [((), adaptive.open_circuits())],
+        )
+    registry.collected(
+        "monmon_regex_cache_lookups_total",
+        "Lookups of compiled regexps, by whether the regexp was compiled already",
+        lambda: [
+            (("hit",), watcher.regex_cache.hits),
+            (("miss",), watcher.regex_cache.misses),
+        ],
+        labelnames=("result",),
+        kind="counter",
+    )
+    registry.collected(
+        "monmon_maintenance_failures_total",
+        "Database maintenance jobs that failed, by the job",
+        lambda: [((job,), count) for job, count in maintenance.failures.items()],
+        labelnames=("job",),
+        kind="counter",
+    )
+    registry.collected(
+        "monmon_log_lines_total",
+        "Log lines by the outcome: written, dropped when the queue is full, "
+        "failed to be written or suppressed as repeats",
+        lambda: [
+            (("written",), log_writer.written),
+            (("dropped",), log_writer.dropped),
+            (("failed",), log_writer.failed),
+            (
+                ("suppressed",),
+                log_writer.repeat_limiter.suppressed
+                if log_writer.repeat_limiter
+                else 0,
+            ),
+        ],
+        labelnames=("outcome",),
+        kind="counter",
+    )
@@ -0,0 +1,27 @@
+"""This module creates the event loop of the service."""
+import asyncio
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional dependency
+    uvloop = None  # type: ignore[assignment]
+
+LOOP_POLICIES = ("auto", "asyncio", "uvloop")
+
+
+def new_event_loop(policy: str = "auto") -> asyncio.AbstractEventLoop:
+    """
+    A new event loop of the given policy: `asyncio` is the loop of the standard
+    library, `uvloop` is the libuv based one with less overhead per callback
+    and socket, `auto` picks uvloop when it is installed.
+    It raises `ValueError` for an unknown policy or a missing uvloop.
+    """
+    if policy not in LOOP_POLICIES:
+        raise ValueError(
+            f"unknown event loop policy {policy}, use one of {LOOP_POLICIES}"
+        )
+    if policy == "uvloop" and uvloop is None:
+        raise ValueError("the event loop policy uvloop is not installed")
+    if policy != "asyncio" and uvloop is not None:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
@@ -0,0 +1,215 @@
+"""This module writes structured logs without blocking the event loop."""
+import logging
+import queue
+import sys
+import threading
+import time
+from typing import Any, BinaryIO, Dict, List, MutableMapping, Tuple
+
+import structlog
+
+from monmon.schemas.codec import dumps
+
+
+class QueueLogger:
+    """
+    The logger at the end of the structlog chain: it takes rendered lines
+    and puts them into the queue of a `LogWriter`, it never waits.
+    """
+
+    def __init__(self, writer: "LogWriter") -> None:
+        self.writer = writer
+
+    def msg(self, message: bytes | str) -> None:
+        """This method queues a rendered line."""
+        self.writer.put(message if isinstance(message, bytes) else message.encode())
+
+    log = debug = info = warn = warning = msg
+    fatal = failure = err = error = critical = exception = msg
+
+
+class LogWriter:
+    """
+    This class writes log lines to a stream in a background thread. Callers only
+    put lines into a bounded queue, the thread takes everything that is queued
+    and writes it with one `write` and one `flush`, so a burst of messages costs
+    one system call instead of one per message. Lines that don't fit into the
+    queue are dropped and counted rather than slowing the caller down.
+    Once the writer is closed, lines are written by the caller right away,
+    so messages of the end of a shutdown are not lost.
+    The counters are plain attributes read when metrics are scraped, because
+    the metrics of the registry are only updated from the event loop thread.
+
+    Attributes
+    ---------
+    written:
+        how many lines were written
+    dropped:
+        how many lines were dropped because the queue was full
+    failed:
+        how many lines were lost because the stream couldn't be written
+    repeat_limiter:
+        the `RepeatLimiter` in front of the writer, if there is one
+    """
+
+    def __init__(
+        self,
+        stream: BinaryIO | None = None,
+        *,
+        queue_size: int = 10000,
+        batch_size: int = 1000,
+    ) -> None:
+        self.stream = stream or sys.stderr.buffer
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.repeat_limiter: "RepeatLimiter | None" = None
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def start(self) -> None:
+        """This method starts the writing thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """This method writes the queued lines and stops the thread."""
+        self._closed = True
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def put(self, line: bytes) -> None:
+        """This method queues a line, it is dropped if the queue is full."""
+        if self._closed:
+            self._write([line])
+            return
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            lines: List[bytes] = []
+            line = self._queue.get()
+            while line is not None:
+                lines.append(line)
+                if len(lines) >= self.batch_size:
+                    break
+                try:
+                    line = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            running = line is not None
+            if lines:
+                self._write(lines)
+
+    def _write(self, lines: List[bytes]) -> None:
+        try:
+            self.stream.write(b"\n".join(lines) + b"\n")
+            self.stream.flush()
+        except (OSError, ValueError):
+            # There is nowhere to report a broken log stream.
+            self.failed += len(lines)
+            return
+        self.written += len(lines)
+
+
+class RepeatLimiter:
+    """
+    A structlog processor that lets through at most `limit` messages with the same
+    event and site during `window_sec`, so a site that fails on every check
+    doesn't flood the log. The first message of the next window carries
+    the number of suppressed ones in `suppressed`. Errors are never limited.
+    Messages are logged from more than one thread, so the windows are guarded
+    by a lock and the suppressed messages are counted in a plain attribute
+    that is read when metrics are scraped.
+
+    Attributes
+    ---------
+    suppressed:
+        how many messages were suppressed
+    """
+
+    def __init__(
+        self, limit: int = 10, window_sec: float = 60, *, max_keys: int = 100_000
+    ) -> None:
+        self.limit = limit
+        self.window_sec = window_sec
+        self.max_keys = max_keys
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        # key: the start of its window, messages let through and suppressed in it
+        self._windows: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def __call__(
+        self, logger: Any, method_name: str, event_dict: MutableMapping[str, Any]
+    ) -> MutableMapping[str, Any]:
+        if method_name in ("error", "critical", "exception"):
+            return event_dict
+        key = (
+            event_dict.get("event"),
+            event_dict.get("site_id"),
+            event_dict.get("url"),
+        )
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_sec:
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._windows.clear()
+                if window and window[2]:
+                    event_dict["suppressed"] = int(window[2])
+                self._windows[key] = [now, 1, 0]
+                return event_dict
+            if window[1] < self.limit:
+                window[1] += 1
+                return event_dict
+            window[2] += 1
+            self.suppressed += 1
+        raise structlog.DropEvent
+
+
+def configure_logging(
+    level: str = "INFO",
+    *,
+    stream: BinaryIO | None = None,
+    queue_size: int = 10000,
+    batch_size: int = 1000,
+    repeat_limit: int = 10,
+    repeat_window_sec: float = 60,
+) -> LogWriter:
+    """
+    This function sets structlog up to render JSON lines (with orjson when it is
+    installed) and write them through a `LogWriter`, which it starts and returns.
+    Methods below `level` are no-ops of the bound logger, so disabled messages
+    cost a call and nothing else. `repeat_limit` of 0 turns `RepeatLimiter` off.
+    """
+    writer = LogWriter(stream, queue_size=queue_size, batch_size=batch_size)
+    writer.start()
+    processors: List[Any] = [structlog.processors.add_log_level]
+    if repeat_limit > 0:
+        writer.repeat_limiter = RepeatLimiter(repeat_limit, repeat_window_sec)
+        processors.append(writer.repeat_limiter)
+    processors += [
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
+        structlog.processors.dict_tracebacks,
+        structlog.processors.UnicodeDecoder(),
+        structlog.processors.JSONRenderer(serializer=dumps),
+    ]
+    structlog.configure(
+        processors=processors,
+        wrapper_class=structlog.make_filtering_bound_logger(
+            logging.getLevelName(level.upper())
+        ),
+        logger_factory=lambda *args: QueueLogger(writer),
+        cache_logger_on_first_use=True,
+    )
+    return writer
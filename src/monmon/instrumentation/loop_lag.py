@@ -0,0 +1,158 @@
+"""This module measures how late the event loop runs scheduled callbacks."""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+import structlog
+
+from monmon.instrumentation.prometheus import REGISTRY
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "monmon_event_loop_lag_seconds",
+    "How much later than scheduled the event loop woke up a sleeping task",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_LAG_MAX_SECONDS = REGISTRY.gauge(
+    "monmon_event_loop_lag_max_seconds",
+    "The highest event loop lag during the last window of the monitor",
+)
+SLOW_CALLBACKS = REGISTRY.counter(
+    "monmon_event_loop_slow_callbacks_total",
+    "How many times a callback held the event loop longer than the threshold",
+)
+
+
+class LoopLagMonitor:
+    """
+    This class sleeps for `interval_sec` in a loop and records how late it wakes up.
+    A blocking call anywhere in the service shows up as lag, while the probe itself
+    costs one wake-up per interval.
+
+    Attributes
+    ---------
+    max_lag_sec:
+        the highest lag seen during the last `window_sec`
+    """
+
+    def __init__(self, interval_sec: float = 0.5, window_sec: float = 60) -> None:
+        self.interval_sec = interval_sec
+        self.window_sec = window_sec
+        self.max_lag_sec = 0.0
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """This method starts measuring."""
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """This method stops measuring."""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self) -> None:
+        window_started = time.monotonic()
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval_sec)
+            now = time.monotonic()
+            lag = max(now - start - self.interval_sec, 0.0)
+            LOOP_LAG_SECONDS.observe(lag)
+            if now - window_started > self.window_sec:
+                window_started = now
+                self.max_lag_sec = lag
+            else:
+                self.max_lag_sec = max(self.max_lag_sec, lag)
+            LOOP_LAG_MAX_SECONDS.set(self.max_lag_sec)
+
+
+class SlowCallbackDetector:
+    """
+    This class finds callbacks that hold the event loop for longer than
+    `threshold_sec`. A watchdog thread schedules a no-op on the loop and waits
+    for it: when it doesn't run in time, the thread takes the stack of the loop
+    thread and the task that is running, and once the loop is free again it logs
+    them with how long the loop was blocked. Unlike the debug mode of asyncio,
+    it costs nothing per callback and works with uvloop too.
+
+    Attributes
+    ---------
+    slow_callbacks:
+        how many slow callbacks were found
+    """
+
+    def __init__(self, threshold_sec: float = 0.1, *, stack_depth: int = 8) -> None:
+        self.threshold_sec = threshold_sec
+        self.stack_depth = stack_depth
+        self.slow_callbacks = 0
+        self.logger = structlog.getLogger("main_logger")
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """This method starts watching the running loop."""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(asyncio.get_running_loop(), threading.get_ident()),
+            name="slow-callbacks",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """This method stops watching."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> None:
+        while not self._stopped.is_set():
+            ran = threading.Event()
+            posted = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(ran.set)
+            except RuntimeError:
+                # The loop is closed.
+                return
+            if ran.wait(self.threshold_sec):
+                self._stopped.wait(self.threshold_sec / 2)
+                continue
+            where = self._where(loop, loop_thread)
+            while not ran.wait(self.threshold_sec):
+                if self._stopped.is_set() or loop.is_closed():
+                    return
+            self.slow_callbacks += 1
+            try:
+                # Metrics are only updated from the loop thread.
+                loop.call_soon_threadsafe(SLOW_CALLBACKS.inc)
+            except RuntimeError:
+                return
+            self.logger.warning(
+                "a callback blocked the event loop",
+                blocked_ms=round((time.monotonic() - posted) * 1000, 1),
+                **where,
+            )
+
+    def _where(self, loop: asyncio.AbstractEventLoop, loop_thread: int) -> dict:
+        """The task and the stack the loop is busy with"""
+        task = asyncio.current_task(loop)
+        frame = sys._current_frames().get(  # pylint: disable=protected-access
+            loop_thread
+        )
+        return {
+            "task": task.get_name() if task else None,
+            "coroutine": getattr(task.get_coro(), "__qualname__", None)
+            if task
+            else None,
+            "stack": [
+                f"{entry.filename}:{entry.lineno} {entry.name}"
+                for entry in traceback.extract_stack(frame, self.stack_depth)
+            ]
+            if frame
+            else [],
+        }
@@ -0,0 +1,49 @@
+"""This module measures how long the service takes to start."""
+import time
+from typing import Any, Dict
+
+from monmon.instrumentation.prometheus import REGISTRY
+
+STARTUP_SECONDS = REGISTRY.gauge(
+    "monmon_startup_seconds",
+    "How long every phase of the startup took",
+    ("phase",),
+)
+
+
+class StartupTimer:
+    """
+    This class splits the startup into phases that run one after another,
+    every `lap` ends the current phase and starts the next one.
+
+    Attributes
+    ---------
+    phases:
+        seconds of every finished phase in the order they ran
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lap_started = self.started
+
+    def lap(self, phase: str) -> None:
+        """This method ends the phase that is running now."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self._lap_started
+        self._lap_started = now
+
+    def report(self, logger: Any) -> None:
+        """This method logs and exports the time of every phase and the total."""
+        for phase, seconds in self.phases.items():
+            STARTUP_SECONDS.set(seconds, (phase,))
+        total = self._lap_started - self.started
+        STARTUP_SECONDS.set(total, ("total",))
+        logger.info(
+            "service started",
+            total_ms=round(total * 1000, 1),
+            **{
+                f"{phase}_ms": round(seconds * 1000, 1)
+                for phase, seconds in self.phases.items()
+            },
+        )
@@ -0,0 +1,108 @@
+"""This module runs regexp extraction inline, in a thread pool or in a process pool."""
+import asyncio
+import functools
+import multiprocessing
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from monmon.matcher.regex_cache import Matcher, TimeoutMatcher, compile_regexp
+from monmon.requester.stream_matcher import match_text, truncate_content
+
+MODES = ("inline", "thread", "process")
+
+
+def extract(regexp: Matcher, text: str) -> str:
+    """Collect all matches of the regexp in the text as the content of metrics"""
+    return truncate_content(
+        "\n".join(map(match_text, regexp.findall(text))).lstrip("\n")
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(engine: str, pattern: str, timeout_sec: float) -> Matcher:
+    return compile_regexp(pattern, engine, timeout_sec)
+
+
+def _extract_spec(spec: Any, text: str) -> str:
+    """Extract in a worker process, `spec` is a picklable regexp or its source"""
+    if isinstance(spec, tuple):
+        spec = _compile(*spec)
+    return extract(spec, text)
+
+
+def _portable(regexp: Matcher) -> Any:
+    """Standard and `regex` regexps can be sent to another process as they are,
+    the other engines are compiled there again from the source."""
+    if isinstance(regexp, (re.Pattern, TimeoutMatcher)):
+        return regexp
+    return ("re2", regexp.pattern, 0)
+
+
+class Extractor:
+    """
+    This class runs `extract` for big texts out of the event loop, so an expensive
+    regexp doesn't delay other checks and the web server. Texts shorter than
+    `offload_threshold` characters are always matched inline, because handing them
+    over costs more than matching them.
+
+    Modes:
+        inline - everything runs on the event loop
+        thread - a thread pool, it keeps the loop responsive but shares the GIL
+        process - a process pool, it scales across cores but copies every text
+
+    Attributes
+    ---------
+    queue_depth:
+        how many offloaded extractions are waiting or running right now
+    max_queue_depth:
+        the highest queue depth seen
+    offloaded:
+        how many extractions were offloaded
+    """
+
+    def __init__(
+        self,
+        mode: str = "inline",
+        workers: int | None = None,
+        offload_threshold: int = 256 * 1024,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"unknown extraction mode {mode}, use one of {MODES}")
+        self.mode = mode
+        self.offload_threshold = offload_threshold
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.offloaded = 0
+        self.executor: Executor | None = None
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="extract"
+            )
+        elif mode == "process":
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def extract(self, regexp: Matcher, text: str) -> str:
+        """This method collects all matches of the regexp in the text."""
+        if self.executor is None or len(text) < self.offload_threshold:
+            return extract(regexp, text)
+
+        self.offloaded += 1
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            loop = asyncio.get_running_loop()
+            if self.mode == "process":
+                return await loop.run_in_executor(
+                    self.executor, _extract_spec, _portable(regexp), text
+                )
+            return await loop.run_in_executor(self.executor, extract, regexp, text)
+        finally:
+            self.queue_depth -= 1
+
+    def close(self) -> None:
+        """This method stops the workers."""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
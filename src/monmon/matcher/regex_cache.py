@@ -0,0 +1,198 @@
+"""This module compiles regexps of sites once and shares them between sites."""
+import re
+from collections import OrderedDict
+from typing import Any, Iterator, Protocol
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover - Python 3.10
+    import sre_parse  # pylint: disable=deprecated-module
+
+try:
+    import regex
+except ImportError:  # pragma: no cover - optional dependency
+    regex = None
+
+try:
+    import re2
+except ImportError:  # pragma: no cover - optional dependency
+    re2 = None
+
+ENGINES = ("auto", "re", "regex", "re2")
+
+
+class InvalidRegexp(ValueError):
+    """It raises when a regexp cannot be compiled"""
+
+
+class RegexpTimeout(TimeoutError):
+    """It raises when matching a regexp takes too long"""
+
+
+class Matcher(Protocol):
+    """A compiled regexp, `re.Pattern` is one of them"""
+
+    @property
+    def pattern(self) -> Any:
+        """The source of the regexp"""
+
+    @property
+    def groups(self) -> int:
+        """The number of groups in the regexp"""
+
+    def findall(self, string: str) -> list:
+        """Return all matches in the string"""
+
+    def finditer(self, string: str) -> Iterator[Any]:
+        """Iterate over all matches in the string"""
+
+
+class TimeoutMatcher:
+    """
+    A regexp compiled by the `regex` engine that gives up after `timeout_sec`
+    with `RegexpTimeout`, so catastrophic backtracking can't hang the event loop.
+    """
+
+    __slots__ = ("compiled", "timeout_sec")
+
+    def __init__(self, compiled: Any, timeout_sec: float) -> None:
+        self.compiled = compiled
+        self.timeout_sec = timeout_sec
+
+    @property
+    def pattern(self) -> str:
+        """The source of the regexp"""
+        return self.compiled.pattern
+
+    @property
+    def groups(self) -> int:
+        """The number of groups in the regexp"""
+        return self.compiled.groups
+
+    def findall(self, string: str) -> list:
+        """Return all matches in the string"""
+        try:
+            return self.compiled.findall(string, timeout=self.timeout_sec)
+        except TimeoutError as error:
+            raise RegexpTimeout(str(error)) from error
+
+    def finditer(self, string: str) -> Iterator[Any]:
+        """Iterate over all matches in the string"""
+        try:
+            yield from self.compiled.finditer(string, timeout=self.timeout_sec)
+        except TimeoutError as error:
+            raise RegexpTimeout(str(error)) from error
+
+
+def default_engine() -> str:
+    """The engine that `auto` stands for: `regex` keeps the syntax of the standard
+    library and gives up after a timeout, `re2` runs in linear time, and `re`
+    is left when neither of them is installed."""
+    if regex is not None:
+        return "regex"
+    if re2 is not None:
+        return "re2"
+    return "re"
+
+
+def _nested_repeat(items: Any, outer_max: int = 0) -> bool:
+    """Whether the parsed regexp repeats a repeat and one of them is unbounded,
+    like `(a+)+`, the usual cause of catastrophic backtracking"""
+    for op, arg in items:
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            _, high, sub = arg
+            if outer_max > 1 and high > 1 and sre_parse.MAXREPEAT in (outer_max, high):
+                return True
+            if _nested_repeat(sub, max(outer_max, high)):
+                return True
+        elif op is sre_parse.SUBPATTERN:
+            if _nested_repeat(arg[-1], outer_max):
+                return True
+        elif op is sre_parse.BRANCH:
+            if any(_nested_repeat(branch, outer_max) for branch in arg[1]):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if _nested_repeat(arg[1], outer_max):
+                return True
+    return False
+
+
+def compile_regexp(
+    pattern: str, engine: str = "auto", timeout_sec: float = 1
+) -> Matcher:
+    """Compile the pattern with the given engine.
+
+    The `re` engine has no timeout and a regexp can keep it busy forever,
+    so it rejects regexps with nested unbounded repeats.
+
+    :param pattern: the regexp
+    :param engine: `auto` (see `default_engine`), `re` (the standard library),
+        `regex` (with a timeout) or `re2` (linear time, no backreferences
+        and lookarounds)
+    :param timeout_sec: how long the `regex` engine may match a single text
+    :return: the compiled regexp, the standard library compiles it
+        if the engine is not installed
+    """
+    if engine == "auto":
+        engine = default_engine()
+    try:
+        if engine == "regex" and regex is not None:
+            return TimeoutMatcher(regex.compile(pattern), timeout_sec)
+        if engine == "re2" and re2 is not None:
+            return re2.compile(pattern)
+        compiled = re.compile(pattern)
+    except Exception as error:  # every engine has its own error type
+        raise InvalidRegexp(str(error)) from error
+    if _nested_repeat(sre_parse.parse(pattern)):
+        raise InvalidRegexp(
+            "nested repeats may backtrack for too long with the re engine, "
+            "install regex or re2 to use them"
+        )
+    return compiled
+
+
+class RegexCache:
+    """
+    A bounded LRU cache of compiled regexps keyed by the pattern,
+    so sites with the same regexp share one compiled object.
+
+    Attributes
+    ---------
+    engine:
+        the engine that compiles regexps, `auto` is resolved to an installed one
+    hits:
+        how many times a compiled regexp was reused
+    misses:
+        how many times a regexp was compiled
+    """
+
+    def __init__(
+        self, max_size: int = 1024, engine: str = "auto", timeout_sec: float = 1
+    ) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"unknown regexp engine {engine}, use one of {ENGINES}")
+        if (engine == "regex" and regex is None) or (engine == "re2" and re2 is None):
+            raise ValueError(f"the regexp engine {engine} is not installed")
+        self.max_size = max_size
+        self.engine = default_engine() if engine == "auto" else engine
+        self.timeout_sec = timeout_sec
+        self.hits = 0
+        self.misses = 0
+        self._compiled: OrderedDict[str, Matcher] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+    def get(self, pattern: str) -> Matcher:
+        """This method returns the compiled regexp, it raises `InvalidRegexp`."""
+        compiled = self._compiled.get(pattern)
+        if compiled is not None:
+            self.hits += 1
+            self._compiled.move_to_end(pattern)
+            return compiled
+        self.misses += 1
+        compiled = compile_regexp(pattern, self.engine, self.timeout_sec)
+        self._compiled[pattern] = compiled
+        if len(self._compiled) > self.max_size:
+            self._compiled.popitem(last=False)
+        return compiled
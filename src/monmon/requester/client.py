@@ -1,59 +1,295 @@
 """This module abstracts the HTTP library,
  allowing you to use it without having to worry about the specific implementation."""
+import asyncio
+import codecs
+import hashlib
 import http
-import re
-from datetime import datetime
 
 import time
 import aiohttp
 import structlog
+from aiohttp import hdrs
+from yarl import URL
 
-from monmon.custom_types.watch_list import WatchListMetrics
+from monmon.custom_types.watch_list import Metrics
+from monmon.instrumentation.prometheus import REGISTRY
+from monmon.matcher.extractor import Extractor
+from monmon.matcher.regex_cache import Matcher, RegexpTimeout
+from monmon.requester.limiter import RequestLimiter
+from monmon.requester.site_state import SiteState
+from monmon.requester.stream_matcher import StreamMatcher
+from monmon.requester.tracing import RequestTimings, make_trace_config
+
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "monmon_http_requests_in_flight",
+    "Requests to sites that are waiting for a response or reading a body",
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "monmon_http_requests_total",
+    "Requests to sites by the class of their status code or by their error",
+    ("outcome",),
+)
+HTTP_PHASE_SECONDS = REGISTRY.histogram(
+    "monmon_http_phase_seconds",
+    "Time of a request to a site: until the response headers and by phase",
+    ("phase",),
+)
+REGEX_SECONDS = REGISTRY.histogram(
+    "monmon_regex_seconds",
+    "Time spent extracting the content of a body with a regexp",
+    ("mode",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+def _encoding(response: aiohttp.ClientResponse) -> str:
+    """The charset of the response, UTF-8 if it has none or an unknown one"""
+    try:
+        return codecs.lookup(response.charset or "utf-8").name
+    except LookupError:
+        return "utf-8"
+
+
+class BodyTooLarge(Exception):
+    """It raises when a body is longer than the limit of the site"""
+
+
+def _timed_feed(matcher: StreamMatcher, text: str, final: bool = False) -> float:
+    """Feed the matcher and return how long matching took"""
+    start = time.perf_counter()
+    matcher.feed(text, final)
+    return time.perf_counter() - start
 
 
 class HttpClient:
-    """This class allows for making HTTP calls and parsing content using regular expressions."""
+    """This class allows for making HTTP calls and parsing content using regular expressions.
+    Requests wait in the limiter queue before they are sent, so `response_time`
+    doesn't include the time spent in the queue.
+
+    In the stream mode the body is decoded and matched chunk by chunk instead of being
+    read into memory as a whole. Reading stops as soon as enough content is collected.
+
+    In both modes a check fails once the body grows beyond `max_body_bytes`
+    (or the limit of the site), so a huge or endless response can't exhaust memory.
+
+    All requests share one connector, so connections are kept alive and reused
+    and resolved host names are cached. Every request is split into DNS, connect,
+    TTFB and body phases, which are returned alongside the metrics.
+    The body phase includes matching the content.
+
+    Outside of the stream mode big bodies are matched by the extractor,
+    which may run it out of the event loop."""
 
-    def __init__(self, timeout_sec: int = 60) -> None:
-        timeout = aiohttp.ClientTimeout(total=timeout_sec)
-        self.session = aiohttp.ClientSession(timeout=timeout)
+    def __init__(
+        self,
+        timeout_sec: int = 60,
+        limiter: RequestLimiter | None = None,
+        extractor: Extractor | None = None,
+        *,
+        stream_body: bool = False,
+        chunk_size: int = 64 * 1024,
+        match_overlap: int = 1024,
+        max_body_bytes: int = 10 * 1024 * 1024,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout_sec: float = 15,
+        dns_cache_ttl_sec: int = 300,
+        connect_timeout_sec: float = 0,
+        read_timeout_sec: float = 0,
+    ) -> None:
+        timeout = aiohttp.ClientTimeout(
+            total=timeout_sec,
+            connect=connect_timeout_sec or None,
+            sock_read=read_timeout_sec or None,
+        )
+        connector = aiohttp.TCPConnector(
+            limit=connection_limit,
+            limit_per_host=connection_limit_per_host,
+            use_dns_cache=dns_cache_ttl_sec > 0,
+            ttl_dns_cache=dns_cache_ttl_sec or None,
+            keepalive_timeout=keepalive_timeout_sec or None,
+            force_close=keepalive_timeout_sec <= 0,
+        )
+        self.session = aiohttp.ClientSession(
+            timeout=timeout, connector=connector, trace_configs=[make_trace_config()]
+        )
+        self.limiter = limiter or RequestLimiter()
+        self.extractor = extractor or Extractor()
+        self.stream_body = stream_body
+        self.chunk_size = chunk_size
+        self.match_overlap = match_overlap
+        self.max_body_bytes = max_body_bytes
         self.logger = structlog.getLogger("main_logger")
 
     async def get(
-        self, site_id: int, url: str, regexp: re.Pattern
-    ) -> WatchListMetrics | None:
-        """Get the URL and parse its content with regexp (only if the response is 200)"""
-        result: WatchListMetrics = {
-            "site_id": -1,
-            "status_code": 0,
-            "timestamp": "",
-            "response_time": -1,
-            "content": None,
-        }
-        start = time.time_ns()
+        self,
+        site_id: int,
+        url: str,
+        regexp: Matcher,
+        state: SiteState | None = None,
+        *,
+        timeout_sec: float | None = None,
+        max_body_bytes: int | None = None,
+    ) -> Metrics | None:
+        """Get the URL and parse its content with regexp (only if the response is 200).
+
+        When the state of the previous check is given, the request is conditional:
+        on 304 or on the same body the previous content is reused without matching,
+        and the metrics are marked with `content_unchanged`.
+        `timeout_sec` replaces all timeouts of the client for this request
+        and `max_body_bytes` replaces its body limit.
+        """
+        HTTP_IN_FLIGHT.inc()
         try:
-            async with self.session.get(url) as response:
-                result["site_id"] = site_id
-                result["status_code"] = response.status
-                result["timestamp"] = datetime.now().isoformat()
-                result["response_time"] = time.time_ns() - start
-                html = await response.text()
-                result["content"] = None
-                if response.status == http.HTTPStatus.OK:
-                    result["content"] = "\n".join(regexp.findall(html)).lstrip("\n")
-            if len(result) > 0:
-                self.logger.debug(
-                    "got this response while monitoring the site",
-                    url=url,
-                    status_code=result["status_code"],
-                )
-                return result
-
-            self.logger.debug("empty response for the site", site_id=site_id, url=url)
-            return None
+            timings = RequestTimings()
+            headers = state.headers() if state else None
+            timeout = (
+                aiohttp.ClientTimeout(total=timeout_sec)
+                if timeout_sec
+                else self.session.timeout
+            )
+            async with self.limiter.slot(URL(url).host or ""):
+                start = time.time_ns()
+                async with self.session.get(
+                    url, headers=headers, timeout=timeout, trace_request_ctx=timings
+                ) as response:
+                    timestamp_ns = time.time_ns()
+                    result = Metrics(
+                        site_id, response.status, timestamp_ns, timestamp_ns - start
+                    )
+                    body_start = time.perf_counter_ns()
+                    result.content, result.content_unchanged = await self._read_content(
+                        response,
+                        regexp,
+                        state,
+                        max_body_bytes or self.max_body_bytes,
+                    )
+                    timings.body_time = time.perf_counter_ns() - body_start
+            result.dns_time = timings.dns_time
+            result.connect_time = timings.connect_time
+            result.ttfb = timings.ttfb
+            result.body_time = timings.body_time
+            HTTP_REQUESTS.inc((f"{result.status_code // 100}xx",))
+            HTTP_PHASE_SECONDS.observe(result.response_time / 1e9, ("response",))
+            for phase, value in (
+                ("dns", timings.dns_time),
+                ("connect", timings.connect_time),
+                ("ttfb", timings.ttfb),
+                ("body", timings.body_time),
+            ):
+                if value is not None:
+                    HTTP_PHASE_SECONDS.observe(value / 1e9, (phase,))
+            self.logger.debug(
+                "got this response while monitoring the site",
+                url=url,
+                status_code=result.status_code,
+            )
+            return result
         except aiohttp.client.ClientError as error:
+            HTTP_REQUESTS.inc(("error",))
             self.logger.error("cannot get the site content", error=error)
             return None
+        except RegexpTimeout as error:
+            HTTP_REQUESTS.inc(("regexp_timeout",))
+            self.logger.error(
+                "matching the site content took too long",
+                site_id=site_id,
+                regexp=regexp.pattern,
+                error=error,
+            )
+            return None
+        except BodyTooLarge as error:
+            HTTP_REQUESTS.inc(("body_too_large",))
+            self.logger.warning(
+                "the body of the site is too big", site_id=site_id, error=error
+            )
+            return None
+        except asyncio.TimeoutError as error:
+            HTTP_REQUESTS.inc(("timeout",))
+            self.logger.error(
+                "the site didn't respond in time", site_id=site_id, error=error
+            )
+            return None
+        finally:
+            HTTP_IN_FLIGHT.dec()
+
+    async def _read_content(
+        self,
+        response: aiohttp.ClientResponse,
+        regexp: Matcher,
+        state: SiteState | None,
+        max_body_bytes: int,
+    ) -> tuple[str | None, bool]:
+        """Read the body and match it, returns the content and whether it is unchanged.
+        It raises `BodyTooLarge`."""
+        if response.status == http.HTTPStatus.NOT_MODIFIED and state:
+            return state.content, True
+        if response.content_length and response.content_length > max_body_bytes:
+            raise BodyTooLarge(f"{response.content_length} bytes")
+
+        body_hash = None
+        if self.stream_body:
+            if response.status != http.HTTPStatus.OK:
+                return None, False
+            content = await self._match_stream(response, regexp, max_body_bytes)
+        else:
+            body = await self._read_body(response, max_body_bytes)
+            if response.status != http.HTTPStatus.OK:
+                return None, False
+            body_hash = hashlib.blake2b(body, digest_size=16).digest()
+            if state and state.content is not None and body_hash == state.body_hash:
+                return state.content, True
+            html = body.decode(_encoding(response), errors="replace")
+            regex_start = time.perf_counter()
+            content = await self.extractor.extract(regexp, html)
+            REGEX_SECONDS.observe(
+                time.perf_counter() - regex_start, (self.extractor.mode,)
+            )
+
+        if state is None:
+            return content, False
+        unchanged = content == state.content
+        state.etag = response.headers.get(hdrs.ETAG)
+        state.last_modified = response.headers.get(hdrs.LAST_MODIFIED)
+        state.body_hash = body_hash
+        state.content = content
+        return content, unchanged
+
+    async def _read_body(
+        self, response: aiohttp.ClientResponse, max_body_bytes: int
+    ) -> bytes:
+        """Read the whole body, it raises `BodyTooLarge` past the limit"""
+        chunks = []
+        body_size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            body_size += len(chunk)
+            if body_size > max_body_bytes:
+                raise BodyTooLarge(f"more than {max_body_bytes} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _match_stream(
+        self, response: aiohttp.ClientResponse, regexp: Matcher, max_body_bytes: int
+    ) -> str:
+        """Decode and match the body chunk by chunk,
+        it raises `BodyTooLarge` past the limit"""
+        decoder = codecs.getincrementaldecoder(_encoding(response))(errors="replace")
+        matcher = StreamMatcher(regexp, overlap=self.match_overlap)
+        matching_sec = 0.0
+        body_size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            body_size += len(chunk)
+            if body_size > max_body_bytes:
+                REGEX_SECONDS.observe(matching_sec, ("stream",))
+                raise BodyTooLarge(f"more than {max_body_bytes} bytes")
+            matching_sec += _timed_feed(matcher, decoder.decode(chunk))
+            if matcher.done:
+                break
+        matching_sec += _timed_feed(
+            matcher, decoder.decode(b"", final=True), final=True
+        )
+        REGEX_SECONDS.observe(matching_sec, ("stream",))
+        return matcher.content
 
     async def close_session(self) -> None:
         """This method closes the HTTP session."""
@@ -0,0 +1,167 @@
+"""This module limits how many requests are sent at the same time and how often."""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter: it allows `burst` requests at once
+    and refills `rate` tokens per second after that.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        """This method adds the tokens collected since the last refill."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        """This method takes a token, it waits until a token is available."""
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LimiterStats:
+    """
+    Counters of the requests queueing.
+
+    Attributes
+    ---------
+    acquired:
+        how many requests were let through
+    waiting:
+        how many requests are waiting for a slot right now
+    in_flight:
+        how many requests are running right now
+    wait_sec_total:
+        total time that requests spent in the queue
+    wait_sec_max:
+        the longest time that a request spent in the queue
+    """
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.wait_sec_total = 0.0
+        self.wait_sec_max = 0.0
+
+
+class _Host:
+    """Limits of a single host"""
+
+    def __init__(self, max_per_host: int, rate: float, burst: int) -> None:
+        self.semaphore = asyncio.Semaphore(max_per_host) if max_per_host else None
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.users = 0
+
+    def is_idle(self) -> bool:
+        """A host is idle when nobody uses it and its bucket is full again."""
+        if self.users:
+            return False
+        if self.bucket:
+            self.bucket.refill()
+            return self.bucket.tokens >= self.bucket.burst
+        return True
+
+
+class RequestLimiter:
+    """
+    This class limits outbound requests: the total number of requests in flight,
+    the number of requests in flight to a single host and, optionally,
+    the rate of requests to a single host. Zero disables a limit.
+
+    Attributes
+    ---------
+    stats:
+        counters of the requests queueing
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 100,
+        max_per_host: int = 0,
+        per_host_rate: float = 0,
+        per_host_burst: int = 1,
+    ) -> None:
+        """
+        :param max_in_flight: int
+            how many requests can be sent at the same time
+        :param max_per_host: int
+            how many requests can be sent to one host at the same time
+        :param per_host_rate: float
+            how many requests per second can be sent to one host
+        :param per_host_burst: int
+            how many requests can be sent to one host at once before the rate applies
+        """
+        self.max_per_host = max_per_host
+        self.per_host_rate = per_host_rate
+        self.per_host_burst = per_host_burst
+        self.stats = LimiterStats()
+        self._global = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self._hosts: Dict[str, _Host] = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        """This context manager waits until a request to the host is allowed
+        and holds the slot while the request runs."""
+        limits = self._hosts.get(host)
+        if limits is None and (self.max_per_host or self.per_host_rate):
+            limits = _Host(self.max_per_host, self.per_host_rate, self.per_host_burst)
+            self._hosts[host] = limits
+
+        self.stats.waiting += 1
+        start = time.perf_counter()
+        acquired = []
+        try:
+            # The host limits go first: waiting for a busy host
+            # must not hold one of the global slots.
+            if limits:
+                limits.users += 1
+                if limits.semaphore:
+                    await limits.semaphore.acquire()
+                    acquired.append(limits.semaphore)
+                if limits.bucket:
+                    await limits.bucket.acquire()
+            if self._global:
+                await self._global.acquire()
+                acquired.append(self._global)
+        except BaseException:
+            self._release(host, limits, acquired)
+            self.stats.waiting -= 1
+            raise
+        self.stats.waiting -= 1
+        waited = time.perf_counter() - start
+        self.stats.acquired += 1
+        self.stats.wait_sec_total += waited
+        self.stats.wait_sec_max = max(self.stats.wait_sec_max, waited)
+
+        self.stats.in_flight += 1
+        try:
+            yield
+        finally:
+            self.stats.in_flight -= 1
+            self._release(host, limits, acquired)
+
+    def _release(
+        self, host: str, limits: _Host | None, acquired: list[asyncio.Semaphore]
+    ) -> None:
+        for semaphore in acquired:
+            semaphore.release()
+        if limits is None:
+            return
+        limits.users -= 1
+        if limits.is_idle():
+            self._hosts.pop(host, None)
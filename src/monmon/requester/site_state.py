@@ -0,0 +1,38 @@
+"""This module keeps what the previous check of a site returned."""
+
+
+class SiteState:
+    """
+    The result of the previous successful check of a site. It is used to send
+    conditional requests and to skip matching a body that hasn't changed.
+
+    Attributes
+    ---------
+    etag:
+        the `ETag` header of the previous response
+    last_modified:
+        the `Last-Modified` header of the previous response
+    body_hash:
+        the digest of the previous body
+    content:
+        the content that was matched in the previous body
+    """
+
+    __slots__ = ("etag", "last_modified", "body_hash", "content")
+
+    def __init__(self) -> None:
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.body_hash: bytes | None = None
+        self.content: str | None = None
+
+    def headers(self) -> dict[str, str]:
+        """Headers that make the next request conditional"""
+        headers: dict[str, str] = {}
+        if self.content is None:
+            return headers
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
@@ -0,0 +1,86 @@
+"""This module matches a regexp against a text that arrives in chunks."""
+from typing import Any, Tuple
+
+from monmon.matcher.regex_cache import Matcher
+
+# The size of the `metrics.content` column.
+MAX_CONTENT_LENGTH = 256
+
+
+def truncate_content(content: str) -> str:
+    """Cut the content to the size that fits into a database."""
+    return content[:MAX_CONTENT_LENGTH]
+
+
+def match_text(found: str | Tuple[str, ...]) -> str:
+    """The text of an item of `findall`: a regexp with several groups finds
+    a tuple of them, which is kept as the groups separated by tabs."""
+    return found if isinstance(found, str) else "\t".join(found)
+
+
+class StreamMatcher:
+    """
+    This class collects regexp matches from a text fed chunk by chunk and produces
+    the same content as `"\\n".join(map(match_text, regexp.findall(text))).lstrip("\\n")`.
+
+    The last `overlap` characters of every chunk are kept and matched again together
+    with the next chunk, so a match that spans a chunk boundary is found as long as
+    it is shorter than the overlap. Anchors and lookarounds see only the buffered
+    text, so they may behave differently near chunk boundaries.
+    Once `limit` characters of content are collected, the matcher is done
+    and the rest of the text can be skipped.
+    """
+
+    def __init__(
+        self, regexp: Matcher, overlap: int = 1024, limit: int = MAX_CONTENT_LENGTH
+    ) -> None:
+        self.regexp = regexp
+        self.overlap = overlap
+        self.limit = limit
+        self.matches = 0
+        self._buffer = ""
+        self._content = ""
+
+    @property
+    def done(self) -> bool:
+        """The matcher is done when it has collected enough content"""
+        return len(self._content) >= self.limit
+
+    @property
+    def content(self) -> str:
+        """Content collected so far"""
+        return self._content[: self.limit]
+
+    def feed(self, text: str, final: bool = False) -> None:
+        """This method matches the regexp against the next chunk of the text.
+
+        :param text: the next chunk
+        :param final: there are no more chunks, so nothing is kept for the next one
+        """
+        buffer = self._buffer + text
+        pending_from = len(buffer) - self.overlap
+        cut = 0 if final else max(pending_from, 0)
+        for match in self.regexp.finditer(buffer):
+            if not final and match.end() > pending_from:
+                # The match may continue in the next chunk, so it is matched again later.
+                cut = match.start()
+                break
+            self._add(match_text(self._output(match)))
+            cut = max(cut, match.end())
+            if self.done:
+                break
+        self._buffer = "" if final else buffer[cut:]
+
+    def _output(self, match: Any) -> str | Tuple[str, ...]:
+        """The item `findall` returns for the match"""
+        if self.regexp.groups == 0:
+            return match.group(0)
+        if self.regexp.groups == 1:
+            return match.group(1) or ""
+        return match.groups("")
+
+    def _add(self, output: str) -> None:
+        if self.matches:
+            self._content += "\n"
+        self._content = (self._content + output).lstrip("\n")
+        self.matches += 1
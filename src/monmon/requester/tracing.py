@@ -0,0 +1,96 @@
+"""This module splits the time of a request into phases with aiohttp trace hooks."""
+import time
+from types import SimpleNamespace
+
+import aiohttp
+
+
+class RequestTimings:
+    """
+    Phases of a single request in nanoseconds. A phase is None when it didn't happen,
+    e.g. there is no DNS or connect phase when a kept-alive connection is reused.
+
+    Attributes
+    ---------
+    dns_time:
+        resolving the host name
+    connect_time:
+        opening a connection, including the TLS handshake for https,
+        aiohttp doesn't expose the handshake as a separate phase
+    ttfb:
+        from sending the request headers to receiving the response headers
+    body_time:
+        reading the response body
+    """
+
+    __slots__ = (
+        "dns_time",
+        "connect_time",
+        "ttfb",
+        "body_time",
+        "dns_started_at",
+        "connect_started_at",
+        "sent_at",
+    )
+
+    def __init__(self) -> None:
+        self.dns_time: int | None = None
+        self.connect_time: int | None = None
+        self.ttfb: int | None = None
+        self.body_time: int | None = None
+        self.dns_started_at = 0
+        self.connect_started_at = 0
+        self.sent_at = 0
+
+
+def _timings(ctx: SimpleNamespace) -> RequestTimings | None:
+    timings = ctx.trace_request_ctx
+    return timings if isinstance(timings, RequestTimings) else None
+
+
+async def _on_request_start(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.sent_at = time.perf_counter_ns()
+
+
+async def _on_dns_resolvehost_start(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.dns_started_at = time.perf_counter_ns()
+
+
+async def _on_dns_resolvehost_end(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.dns_time = time.perf_counter_ns() - timings.dns_started_at
+
+
+async def _on_connection_create_start(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.connect_started_at = time.perf_counter_ns()
+
+
+async def _on_connection_create_end(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.connect_time = time.perf_counter_ns() - timings.connect_started_at
+
+
+async def _on_request_headers_sent(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.sent_at = time.perf_counter_ns()
+
+
+async def _on_request_end(_session, ctx: SimpleNamespace, _params) -> None:
+    if timings := _timings(ctx):
+        timings.ttfb = time.perf_counter_ns() - timings.sent_at
+
+
+def make_trace_config() -> aiohttp.TraceConfig:
+    """Build the trace config that fills `RequestTimings` passed as `trace_request_ctx`"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
@@ -0,0 +1,25 @@
+"""JSON decoding of request bodies and encoding of log lines,
+with orjson when it is installed"""
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore[assignment]
+
+
+def loads(data: bytes | str) -> Any:
+    """Decode a JSON document. orjson is several times faster than the standard
+    library on big watch lists. It raises `ValueError` if the document is invalid."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, default: Callable[[Any], Any] | None = None) -> bytes:
+    """Encode a document to compact UTF-8 JSON, `default` converts what JSON
+    cannot represent. orjson renders log lines several times faster."""
+    if orjson:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, default=default, separators=(",", ":")).encode()
@@ -1,24 +1,184 @@
 """Schema validators"""
-from typing import List, Tuple
+import ipaddress
+import re
+from typing import Any, Callable, List, Tuple
 
-import validators
+from monmon.custom_types.watch_list import FieldError, WatchList
+from monmon.matcher.regex_cache import InvalidRegexp, RegexCache, compile_regexp
 
+# Sizes of the `watch_list.url` and `watch_list.regexp` columns.
+MAX_URL_LENGTH = 128
+MAX_REGEXP_LENGTH = 32
+# Longer lists are imported with `POST /bulk` chunk by chunk.
+MAX_WATCH_LIST_SIZE = 1000
+# Bounds of the body limit of a site.
+MIN_BODY_BYTES = 1024
+MAX_BODY_BYTES = 1024 * 1024 * 1024
 
-async def is_watch_list_valid(request: List[dict]) -> Tuple[str, bool]:
-    """With this module, you can determine if a request is a valid WatchList"""
+# An absolute http(s) URL: a domain name, localhost or an IP address, then an optional
+# port and a path without spaces. One precompiled match per URL is two orders
+# of magnitude faster than `validators.url`, which matters for imports.
+URL_RE = re.compile(
+    r"https?://"
+    r"(?:[^\s/?#@]+@)?"
+    r"(?P<host>localhost"
+    r"|(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})"
+    r"|(?P<ipv4>[0-9]{1,3}(?:\.[0-9]{1,3}){3})"
+    r"|\[(?P<ipv6>[0-9a-f:.]+)\])"
+    r"(?::(?P<port>[0-9]{1,5}))?"
+    r"(?:[/?#]\S*)?",
+    re.IGNORECASE,
+)
 
-    if len(request) == 0:
-        return "empty request", False
+FieldCheck = Callable[[Any, RegexCache | None], str | None]
 
-    for req in request:
-        url: str = req["url"]
-        regexp: str = req["regexp"]
-        check_interval_sec: int = req["check_interval_sec"]
 
-        if not validators.url(url):
-            return "invalid url", False
-        if not validators.length(regexp, 1):
-            return "empty regexp", False
-        if not validators.between(check_interval_sec, 5, 300):
-            return "check_interval_sec must be between 5 and 300", False
+# Every field of a site with its type and a check of its value.
+SITE_FIELDS: Tuple[Tuple[str, type, FieldCheck], ...] = (
+    ("url", str, lambda url, _: _url_error(url)),
+    ("regexp", str, lambda regexp, regex_cache: _regexp_error(regexp, regex_cache)),
+    (
+        "check_interval_sec",
+        int,
+        lambda check_interval_sec, _: _interval_error(check_interval_sec),
+    ),
+)
+# Fields that may be missing or null.
+OPTIONAL_SITE_FIELDS: Tuple[Tuple[str, type, FieldCheck], ...] = (
+    (
+        "max_body_bytes",
+        int,
+        lambda max_body_bytes, _: _body_limit_error(max_body_bytes),
+    ),
+)
+OPTIONAL_FIELD_NAMES = {field for field, _, _ in OPTIONAL_SITE_FIELDS}
+TYPE_NAMES = {str: "a string", int: "an integer"}
+
+
+async def is_watch_list_valid(
+    request: List[dict], regex_cache: RegexCache | None = None
+) -> Tuple[str, bool]:
+    """With this module, you can determine if a request is a valid WatchList.
+    Regexps are compiled with the cache if it is given, so a pattern that can't be compiled
+    is rejected here instead of failing later in the watcher."""
+    _, errors = parse_watch_list(request, regex_cache)
+    if errors:
+        return errors[0]["error"], False
     return "ok", True
+
+
+def parse_watch_list(
+    body: Any, regex_cache: RegexCache | None = None
+) -> Tuple[List[WatchList], List[FieldError]]:
+    """Validate a decoded request body field by field and collect all errors.
+    The sites are returned without unknown fields, and only if there are no errors."""
+    if not isinstance(body, list):
+        return [], [body_error("the body must be a list of sites")]
+    if len(body) == 0:
+        return [], [body_error("empty request")]
+    if len(body) > MAX_WATCH_LIST_SIZE:
+        return [], [body_error(f"at most {MAX_WATCH_LIST_SIZE} sites in a request")]
+
+    watch_list: List[WatchList] = []
+    errors: List[FieldError] = []
+    for index, site in enumerate(body):
+        site_errors = field_errors(site, regex_cache)
+        if site_errors:
+            errors.extend(
+                {"index": index, "field": field, "error": error}
+                for field, error in site_errors
+            )
+        elif not errors:
+            watch_list.append(
+                {
+                    "url": site["url"],
+                    "regexp": site["regexp"],
+                    "check_interval_sec": site["check_interval_sec"],
+                    "max_body_bytes": site.get("max_body_bytes"),
+                }
+            )
+    if errors:
+        return [], errors
+    return watch_list, []
+
+
+def body_error(error: str) -> FieldError:
+    """An error of the whole request body"""
+    return {"index": None, "field": None, "error": error}
+
+
+def field_errors(
+    site: Any, regex_cache: RegexCache | None = None
+) -> List[Tuple[str | None, str]]:
+    """Check settings of one site, every invalid field is reported with its error"""
+    if not isinstance(site, dict):
+        return [(None, "a site must be an object")]
+    errors: List[Tuple[str | None, str]] = []
+    for field, kind, check in SITE_FIELDS + OPTIONAL_SITE_FIELDS:
+        value = site.get(field)
+        if value is None and field in OPTIONAL_FIELD_NAMES:
+            continue
+        # Decoded JSON holds exact types only, and a bool must not pass for an int.
+        if type(value) is not kind:  # pylint: disable=unidiomatic-typecheck
+            error: str | None = (
+                f"{field} is required"
+                if value is None
+                else f"{field} must be {TYPE_NAMES[kind]}"
+            )
+        else:
+            error = check(value, regex_cache)
+        if error:
+            errors.append((field, error))
+    return errors
+
+
+def site_error(site: Any, regex_cache: RegexCache | None = None) -> str | None:
+    """Check settings of one site, the first error or None if they are valid"""
+    errors = field_errors(site, regex_cache)
+    return errors[0][1] if errors else None
+
+
+def _url_error(url: str) -> str | None:
+    """Check that the URL fits into a database and is valid"""
+    if len(url) > MAX_URL_LENGTH:
+        return f"url must be at most {MAX_URL_LENGTH} characters"
+    match = URL_RE.fullmatch(url)
+    if not match:
+        return "invalid url"
+    address = match["ipv4"] or match["ipv6"]
+    if address:
+        try:
+            ipaddress.ip_address(address)
+        except ValueError:
+            return "invalid url"
+    if match["port"] and not 0 < int(match["port"]) < 65536:
+        return "invalid url"
+    return None
+
+
+def _interval_error(check_interval_sec: int) -> str | None:
+    if not 5 <= check_interval_sec <= 300:
+        return "check_interval_sec must be between 5 and 300"
+    return None
+
+
+def _body_limit_error(max_body_bytes: int) -> str | None:
+    if not MIN_BODY_BYTES <= max_body_bytes <= MAX_BODY_BYTES:
+        return f"max_body_bytes must be between {MIN_BODY_BYTES} and {MAX_BODY_BYTES}"
+    return None
+
+
+def _regexp_error(regexp: str, regex_cache: RegexCache | None) -> str | None:
+    """Check that the regexp fits into a database and compiles"""
+    if len(regexp) < 1:
+        return "empty regexp"
+    if len(regexp) > MAX_REGEXP_LENGTH:
+        return f"regexp must be at most {MAX_REGEXP_LENGTH} characters"
+    try:
+        if regex_cache:
+            regex_cache.get(regexp)
+        else:
+            compile_regexp(regexp)
+    except InvalidRegexp as error:
+        return f"invalid regexp: {error}"
+    return None
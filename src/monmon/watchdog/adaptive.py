@@ -0,0 +1,143 @@
+"""The module stretches check intervals of failing and unchanged sites"""
+import math
+from typing import Dict
+
+from monmon.custom_types.watch_list import Metrics
+
+
+class SiteBackoff:
+    """
+    Recent outcomes of a site that the next interval depends on.
+    Only sites that failed or didn't change recently have one.
+
+    Attributes
+    ---------
+    failures:
+        checks in a row that got no response or an error status
+    no_response:
+        checks in a row that got no response at all: timeouts and connection errors
+    unchanged:
+        successful checks in a row that found the same content
+    """
+
+    __slots__ = ("failures", "no_response", "unchanged")
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.no_response = 0
+        self.unchanged = 0
+
+
+class AdaptiveSchedule:
+    """
+    This class picks the delay until the next check of a site from the outcome
+    of its last check, so failing and unchanged sites cost less outbound load.
+
+    A failing site, without a response or with a status of 400 and above,
+    is checked `backoff_factor` times less often after every failure, up to
+    `max_backoff_sec`. The first successful check brings it back to its own interval
+    at once, so a recovery is noticed as soon as it happens and stays noticed.
+    A site that returns the same content `stable_after` times in a row is checked
+    `stable_factor` times less often after every next such check, but never
+    less often than every `max_stretch` intervals. Unchanged content is only known
+    with conditional requests of the watcher.
+
+    After `breaker_failures` checks in a row without a response the circuit of
+    the site is open: it is still probed at its backoff interval, but a probe gives up
+    after `probe_timeout_sec`, so a site that always times out doesn't hold
+    a connection and a limiter slot for the whole timeout of the client.
+    The first response closes the circuit.
+
+    Attributes
+    ---------
+    backoffs:
+        the state of every site that failed or didn't change recently
+    """
+
+    def __init__(
+        self,
+        *,
+        backoff_factor: float = 2,
+        max_backoff_sec: float = 1800,
+        stable_after: int = 5,
+        stable_factor: float = 1.5,
+        max_stretch: float = 4,
+        breaker_failures: int = 3,
+        probe_timeout_sec: float = 5,
+    ) -> None:
+        self.backoff_factor = backoff_factor
+        self.max_backoff_sec = max_backoff_sec
+        self.stable_after = stable_after
+        self.stable_factor = stable_factor
+        self.max_stretch = max_stretch
+        self.breaker_failures = breaker_failures
+        self.probe_timeout_sec = probe_timeout_sec
+        self.backoffs: Dict[int, SiteBackoff] = {}
+
+    def next_interval(
+        self, site_id: int, interval_sec: float, metrics: Metrics | None
+    ) -> float:
+        """This method records the outcome of a check and returns the delay
+        until the next check of the site."""
+        backoff = self.backoffs.get(site_id) or SiteBackoff()
+        if metrics is None or metrics.status_code >= 400:
+            backoff.failures += 1
+            backoff.no_response = backoff.no_response + 1 if metrics is None else 0
+            backoff.unchanged = 0
+            self.backoffs[site_id] = backoff
+            return max(
+                min(self._backoff(interval_sec, backoff), self.max_backoff_sec),
+                interval_sec,
+            )
+
+        if not metrics.content_unchanged:
+            self.backoffs.pop(site_id, None)
+            return interval_sec
+        backoff.failures = backoff.no_response = 0
+        backoff.unchanged += 1
+        self.backoffs[site_id] = backoff
+        if backoff.unchanged < self.stable_after:
+            return interval_sec
+        stretch = self.stable_factor ** (backoff.unchanged - self.stable_after + 1)
+        return interval_sec * min(stretch, self.max_stretch)
+
+    def _backoff(self, interval_sec: float, backoff: SiteBackoff) -> float:
+        """The interval multiplied by the factor for every failure"""
+        exponent = backoff.failures
+        if self.max_backoff_sec <= interval_sec:
+            exponent = 0
+        elif self.backoff_factor > 1:
+            # The delay is capped past this power anyway, and the power itself
+            # would overflow after a long outage.
+            exponent = min(
+                exponent,
+                math.ceil(
+                    math.log(self.max_backoff_sec / interval_sec, self.backoff_factor)
+                ),
+            )
+        return interval_sec * self.backoff_factor**exponent
+
+    def timeout_sec(self, site_id: int) -> float | None:
+        """The timeout of the next check, None unless the circuit of the site is open"""
+        backoff = self.backoffs.get(site_id)
+        if backoff and backoff.no_response >= self.breaker_failures:
+            return self.probe_timeout_sec
+        return None
+
+    def forget(self, site_id: int) -> None:
+        """This method drops the outcomes of a site that was removed or changed."""
+        self.backoffs.pop(site_id, None)
+
+    def backed_off(self) -> int:
+        """How many sites are checked less often than their interval"""
+        return sum(
+            backoff.failures > 0 or backoff.unchanged >= self.stable_after
+            for backoff in self.backoffs.values()
+        )
+
+    def open_circuits(self) -> int:
+        """How many sites are probed with the short timeout"""
+        return sum(
+            backoff.no_response >= self.breaker_failures
+            for backoff in self.backoffs.values()
+        )
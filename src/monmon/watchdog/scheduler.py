@@ -0,0 +1,199 @@
+"""The module runs periodic checks of many sites from a single timer"""
+import asyncio
+import heapq
+import random
+from typing import Awaitable, Callable, Dict, List, Set, Tuple
+
+import structlog
+
+from monmon.instrumentation.prometheus import REGISTRY
+
+# Marks a site whose check is running right now, so it has no entry in the heap.
+_RUNNING = -1
+
+SCHEDULE_DELAY_SECONDS = REGISTRY.histogram(
+    "monmon_schedule_delay_seconds",
+    "How much later than due a check started, i.e. drift of the schedule",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+class Scheduler:
+    """
+    This class keeps the next due time of every site in a heap and runs one timer task
+    for all of them. Due sites are handed to a fixed number of worker tasks,
+    so the number of concurrent checks is bounded no matter how many sites there are.
+
+    The first check of a site is spread randomly over its interval and every next one
+    is shifted by up to `jitter` of the interval, so sites with the same interval
+    don't fire in bursts. A site is re-armed only after its check finishes,
+    so checks of the same site never overlap. A site that is removed and added again
+    while its check runs starts a new generation, which is armed once the old check
+    finishes instead of the old check re-arming the site.
+    The job may return the delay until the next check, e.g. to back a failing site off,
+    otherwise the next check comes after the interval of the site.
+
+    Attributes
+    ---------
+    job:
+        a coroutine function that checks a site by its id
+    workers:
+        how many checks can run at the same time
+    jitter:
+        a fraction of the interval that a check may be shifted by
+    """
+
+    def __init__(
+        self,
+        job: Callable[[int], Awaitable[float | None]],
+        workers: int = 100,
+        jitter: float = 0.1,
+    ) -> None:
+        self.job = job
+        self.workers = workers
+        self.jitter = jitter
+        self.logger = structlog.getLogger("main_logger")
+        self._heap: List[Tuple[float, int, int]] = []
+        self._intervals: Dict[int, float] = {}
+        self._tokens: Dict[int, int] = {}
+        self._generations: Dict[int, int] = {}
+        # Sites whose check is queued or running, whatever their generation is.
+        self._running: Set[int] = set()
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._queue: asyncio.Queue[Tuple[int, float, int]] = asyncio.Queue(
+            maxsize=workers
+        )
+        self._tasks: List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __contains__(self, site_id: int) -> bool:
+        return site_id in self._intervals
+
+    def start(self) -> None:
+        """This method starts the timer and the workers, it does nothing if they run."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(self._dispatch()))
+        for _ in range(self.workers):
+            self._tasks.append(loop.create_task(self._work()))
+
+    async def stop(self) -> None:
+        """This method stops the timer and the workers."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def add(self, site_id: int, interval_sec: float) -> None:
+        """This method schedules periodic checks of a site.
+        The first check is spread randomly over the interval.
+        If the site is already scheduled, only its interval is changed.
+        """
+        if site_id in self._intervals:
+            self._intervals[site_id] = interval_sec
+            return
+        self._intervals[site_id] = interval_sec
+        if site_id in self._running:
+            # The check of the old generation arms the new one when it finishes.
+            self._seq += 1
+            self._tokens[site_id] = _RUNNING
+        else:
+            self._push(site_id, self._now() + random.uniform(0, interval_sec))
+        self._generations[site_id] = self._seq
+
+    def remove(self, site_id: int) -> None:
+        """This method stops checks of a site, a running check is allowed to finish."""
+        self._intervals.pop(site_id, None)
+        self._tokens.pop(site_id, None)
+        self._generations.pop(site_id, None)
+
+    def interval(self, site_id: int) -> float | None:
+        """The interval of a site, None if the site isn't scheduled"""
+        return self._intervals.get(site_id)
+
+    def reschedule(
+        self, site_id: int, interval_sec: float, delay_sec: float | None = None
+    ) -> None:
+        """This method changes the interval of a site and moves its next check
+        to `delay_sec` from now (a full new interval by default).
+        If the check is running right now, the new interval applies after it finishes.
+        """
+        if site_id not in self._intervals:
+            return
+        self._intervals[site_id] = interval_sec
+        if self._tokens.get(site_id) == _RUNNING:
+            return
+        delay = interval_sec if delay_sec is None else delay_sec
+        self._push(site_id, self._now() + delay)
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, site_id: int, due: float) -> None:
+        self._seq += 1
+        self._tokens[site_id] = self._seq
+        heapq.heappush(self._heap, (due, self._seq, site_id))
+        # Wake the timer up only if the new check must happen before the one it waits for.
+        if self._heap[0][1] == self._seq:
+            self._wakeup.set()
+
+    def _rearm(
+        self, site_id: int, due: float, delay_sec: float | None, generation: int
+    ) -> None:
+        # A check of a removed site must not re-arm it. A site that was added again
+        # since the check started is a new generation waiting for this check to end,
+        # it starts with its first check spread over the interval.
+        if self._generations.get(site_id) != generation:
+            if site_id in self._intervals:
+                interval = self._intervals[site_id]
+                self._push(site_id, self._now() + random.uniform(0, interval))
+            return
+        interval = self._intervals[site_id]
+        delay = interval if delay_sec is None else delay_sec
+        shift = random.uniform(-self.jitter, self.jitter) * delay
+        self._push(site_id, max(due + delay + shift, self._now()))
+
+    async def _dispatch(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due, seq, site_id = self._heap[0]
+            delay = due - self._now()
+            if delay > 0:
+                self._wakeup.clear()
+                # A timer instead of `asyncio.wait_for`, which swallows a cancellation
+                # that arrives together with the wakeup before Python 3.12.
+                timer = asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    timer.cancel()
+                continue
+            heapq.heappop(self._heap)
+            if self._tokens.get(site_id) != seq:
+                # The site was removed or rescheduled, this entry is stale.
+                continue
+            self._tokens[site_id] = _RUNNING
+            self._running.add(site_id)
+            await self._queue.put((site_id, due, self._generations[site_id]))
+
+    async def _work(self) -> None:
+        while True:
+            site_id, due, generation = await self._queue.get()
+            SCHEDULE_DELAY_SECONDS.observe(max(self._now() - due, 0.0))
+            delay_sec = None
+            try:
+                delay_sec = await self.job(site_id)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                self.logger.error(
+                    "the check of the site failed", site_id=site_id, error=error
+                )
+            finally:
+                self._running.discard(site_id)
+                self._rearm(site_id, due, delay_sec, generation)
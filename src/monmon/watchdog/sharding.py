@@ -0,0 +1,144 @@
+"""The module splits sites between workers that share one database"""
+import asyncio
+import bisect
+import hashlib
+import os
+import socket
+from typing import Sequence
+
+import structlog
+
+from monmon.db.db_connector import DbConnector
+from monmon.db.pg.exceptions import QueryException
+from monmon.watchdog.sync import WatchListSync
+
+
+def _point(key: str) -> int:
+    """A position on the ring that is the same in every process"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+def default_worker_id() -> str:
+    """An id that is unique for every process on every host"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class HashRing:
+    """
+    A consistent hash ring of workers. Every worker is placed on the ring
+    `vnodes` times and a site belongs to the first worker after the site's position,
+    so when a worker joins or leaves only about 1/N of sites change their owner.
+    """
+
+    def __init__(self, workers: Sequence[str], vnodes: int = 64) -> None:
+        self.workers = tuple(sorted(workers))
+        ring = sorted(
+            (_point(f"{worker}#{vnode}"), worker)
+            for worker in self.workers
+            for vnode in range(vnodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [worker for _, worker in ring]
+
+    def owner(self, site_id: int) -> str | None:
+        """The worker that checks the site, None if there are no workers"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _point(str(site_id)))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardCoordinator:
+    """
+    This class lets many processes or hosts share the watch list of one database.
+
+    Every worker renews its lease in the `workers` table every `heartbeat_sec`.
+    Workers whose lease is older than `lease_ttl_sec` are considered dead and removed.
+    All live workers build the same hash ring from the list of workers, and each
+    one monitors only the sites that the ring assigns to it. When the list changes,
+    sites are rebalanced with a full sync of the watch list: the watcher drops sites
+    that moved away and starts the ones that moved in. Changes of the watch list
+    itself are followed by the sync.
+
+    While workers see different lists (up to one heartbeat), a site may be
+    checked by two workers or by none for a moment.
+    """
+
+    def __init__(
+        self,
+        db_conn: DbConnector,
+        sync: WatchListSync,
+        worker_id: str | None = None,
+        *,
+        heartbeat_sec: float = 5,
+        lease_ttl_sec: float = 15,
+        vnodes: int = 64,
+    ) -> None:
+        self.db_conn = db_conn
+        self.sync = sync
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_sec = heartbeat_sec
+        self.lease_ttl_sec = lease_ttl_sec
+        self.vnodes = vnodes
+        self.ring = HashRing([self.worker_id], vnodes)
+        self.rebalances = 0
+        self.task: asyncio.Task | None = None
+        self.logger = structlog.getLogger("main_logger")
+
+    def is_leader(self) -> bool:
+        """Whether this worker runs jobs that need a single runner, e.g. maintenance"""
+        return self.ring.workers[0] == self.worker_id
+
+    def owns(self, site_id: int) -> bool:
+        """Whether the site belongs to this worker"""
+        return self.ring.owner(site_id) == self.worker_id
+
+    async def start(self) -> None:
+        """This method joins the workers and claims a shard,
+        the sync starts the sites of the shard."""
+        self.sync.watcher.owns = self.owns
+        await self._renew()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """This method stops the heartbeat and gives the shard up to other workers."""
+        task, self.task = self.task, None
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await self.db_conn.remove_worker(self.worker_id)
+        except QueryException as error:
+            self.logger.error("cannot remove the worker", error=error)
+
+    async def heartbeat(self) -> None:
+        """This method renews the lease and rebalances sites if workers changed."""
+        if await self._renew():
+            await self.sync.full_sync()
+
+    async def _renew(self) -> bool:
+        """Renew the lease and rebuild the ring, whether the workers changed"""
+        workers = await self.db_conn.heartbeat_worker(
+            self.worker_id, self.lease_ttl_sec
+        )
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        if tuple(sorted(workers)) == self.ring.workers:
+            return False
+        self.ring = HashRing(workers, self.vnodes)
+        self.rebalances += 1
+        self.logger.info(
+            "workers changed: rebalancing sites",
+            worker_id=self.worker_id,
+            workers=len(workers),
+        )
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_sec)
+            try:
+                await self.heartbeat()
+            except QueryException as error:
+                # The shard is kept as is until the database is back.
+                self.logger.error("the heartbeat of the worker failed", error=error)
@@ -0,0 +1,186 @@
+"""This module keeps rolling statistics of recent checks of every site in memory."""
+import math
+from array import array
+from typing import Any, Dict
+
+from monmon.custom_types.watch_list import Metrics
+
+# Latencies are counted in logarithmic buckets 10% wide starting at 1 µs,
+# so quantiles are accurate to 10% and cost the same for any window size.
+BUCKET_GROWTH = 1.1
+BUCKET_MIN_NS = 1000
+BUCKETS = 250
+NO_RESPONSE = 255
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def latency_bucket(response_time_ns: int) -> int:
+    """The histogram bucket of a latency"""
+    if response_time_ns <= BUCKET_MIN_NS:
+        return 0
+    bucket = int(math.log(response_time_ns / BUCKET_MIN_NS, BUCKET_GROWTH))
+    return min(bucket, BUCKETS - 1)
+
+
+def bucket_upper_ms(bucket: int) -> float:
+    """The upper bound of a histogram bucket in milliseconds"""
+    return BUCKET_MIN_NS * BUCKET_GROWTH ** (bucket + 1) / 1e6
+
+
+def counters_typecode(window: int) -> str:
+    """The smallest array typecode that counts up to `window` checks"""
+    for typecode in ("B", "H"):
+        if window < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    return "I"
+
+
+class Counters:
+    """
+    Counters of the checks in a window.
+
+    Attributes
+    ---------
+    checks:
+        how many checks are counted
+    up:
+        checks that got a response with a status code below 400
+    no_response:
+        checks that failed without a response: connection errors and timeouts
+    matched:
+        responses where the regexp found something
+    status_classes:
+        responses by the class of their status code
+    histogram:
+        responses by their latency bucket
+
+    Counters of a single site never count more than its window, so they are kept
+    in arrays of the smallest `typecode` that holds the window.
+    """
+
+    __slots__ = (
+        "checks",
+        "up",
+        "no_response",
+        "matched",
+        "status_classes",
+        "histogram",
+    )
+
+    def __init__(self, typecode: str = "I") -> None:
+        self.checks = 0
+        self.up = 0
+        self.no_response = 0
+        self.matched = 0
+        zero = array(typecode, [0])
+        self.status_classes = zero * len(STATUS_CLASSES)
+        self.histogram = zero * BUCKETS
+
+    def add(self, latency: int, status: int, matched: int, sign: int = 1) -> None:
+        """This method counts a check in (sign 1) or out (sign -1)."""
+        self.checks += sign
+        if latency == NO_RESPONSE:
+            self.no_response += sign
+            return
+        self.histogram[latency] += sign
+        self.status_classes[status - 1] += sign
+        self.up += sign * (status < 4)
+        self.matched += sign * matched
+
+    def subtract(self, other: "Counters") -> None:
+        """This method takes out all checks counted by other counters."""
+        self.checks -= other.checks
+        self.up -= other.up
+        self.no_response -= other.no_response
+        self.matched -= other.matched
+        for i, count in enumerate(other.status_classes):
+            self.status_classes[i] -= count
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] -= count
+
+    def summary(self) -> Dict[str, Any]:
+        """Uptime, error rate and the share of matched responses in percents,
+        counts of status classes and latency quantiles"""
+        responses = self.checks - self.no_response
+        return {
+            "checks": self.checks,
+            "uptime": _percent(self.up, self.checks),
+            "error_rate": _percent(self.no_response, self.checks),
+            "match_rate": _percent(self.matched, responses),
+            "status_codes": dict(zip(STATUS_CLASSES, self.status_classes)),
+            "latency_ms": self._quantiles(responses),
+        }
+
+    def _quantiles(self, responses: int) -> Dict[str, float | None]:
+        names = [f"p{round(quantile * 100)}" for quantile in QUANTILES]
+        latencies: Dict[str, float | None] = dict.fromkeys(names)
+        targets = [math.ceil(quantile * responses) for quantile in QUANTILES]
+        seen = 0
+        found = 0
+        for bucket, count in enumerate(self.histogram):
+            if not count:
+                continue
+            seen += count
+            while found < len(targets) and seen >= targets[found]:
+                latencies[names[found]] = round(bucket_upper_ms(bucket), 3)
+                found += 1
+            if found == len(targets):
+                break
+        return latencies
+
+
+class SiteStats:
+    """
+    The outcomes of the last `window` checks of a site kept in a ring buffer.
+    When a check falls out of the window, it is counted out of the site counters
+    and of the shared `totals`, so recording a check and reading a summary
+    take constant time.
+
+    Every check takes three bytes of the ring: its latency bucket, the class
+    of its status code and whether the regexp matched.
+    """
+
+    __slots__ = ("window", "counters", "totals", "_next", "_ring")
+
+    def __init__(self, window: int = 100, totals: Counters | None = None) -> None:
+        self.window = window
+        self.counters = Counters(counters_typecode(window))
+        self.totals = totals
+        self._next = 0
+        self._ring = array("B", bytes(3 * window))
+
+    def record(self, metrics: Metrics | None) -> None:
+        """This method adds a check, the metrics are None if the site didn't respond."""
+        ring = self._ring
+        offset = 3 * self._next
+        if self.counters.checks == self.window:
+            self._count(ring[offset], ring[offset + 1], ring[offset + 2], -1)
+
+        if metrics is None:
+            latency, status, matched = NO_RESPONSE, 0, 0
+        else:
+            latency = latency_bucket(metrics.response_time)
+            status = min(max(metrics.status_code // 100, 1), 5)
+            matched = 1 if metrics.content else 0
+        self._count(latency, status, matched, 1)
+
+        ring[offset] = latency
+        ring[offset + 1] = status
+        ring[offset + 2] = matched
+        self._next = (self._next + 1) % self.window
+
+    def summary(self) -> Dict[str, Any]:
+        """The summary of the window, see `Counters.summary`"""
+        return self.counters.summary()
+
+    def _count(self, latency: int, status: int, matched: int, sign: int) -> None:
+        self.counters.add(latency, status, matched, sign)
+        if self.totals is not None:
+            self.totals.add(latency, status, matched, sign)
+
+
+def _percent(part: int, total: int) -> float | None:
+    if not total:
+        return None
+    return round(100 * part / total, 2)
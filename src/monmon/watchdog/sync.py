@@ -0,0 +1,192 @@
+"""The module keeps the running sites equal to the watch list in the database"""
+import asyncio
+from typing import List, Set
+
+import structlog
+
+from monmon.db.db_connector import WATCH_LIST_CHANNEL, DbConnector
+from monmon.db.pg.exceptions import QueryException
+from monmon.db.pg.pg_connector import Listener
+from monmon.watchdog.watcher import Watcher
+
+
+class WatchListSync:
+    """
+    This class applies changes of the watch list to the watcher without a restart.
+
+    A full sync streams the watch list in batches of `batch_size` and diffs it
+    against the running sites: new sites are started, deleted ones are stopped,
+    sites with a new interval are rescheduled and sites with a new url or regexp
+    are updated, all other sites keep running untouched. It runs at start
+    and every `resync_sec`.
+
+    With `listen` the sync also subscribes to notifications that a trigger sends
+    on every change of the watch list, so changes made through any worker,
+    or straight in the database, are applied within `debounce_sec`.
+    A notification names the changed sites or, for a big change, the range of their
+    ids. Notifications that come while a sync runs are merged and applied together
+    after it, so syncs never overlap and a long import costs a few reads of
+    the imported range instead of a full sync per chunk.
+    Notifications are missed while the listening connection is down,
+    the periodic full sync catches up then.
+
+    Attributes
+    ---------
+    full_syncs:
+        how many full syncs were done
+    """
+
+    def __init__(
+        self,
+        db_conn: DbConnector,
+        watcher: Watcher,
+        *,
+        resync_sec: float = 60,
+        listen: bool = True,
+        debounce_sec: float = 0.2,
+        batch_size: int = 1000,
+    ) -> None:
+        self.db_conn = db_conn
+        self.watcher = watcher
+        self.resync_sec = resync_sec
+        self.listen = listen
+        self.debounce_sec = debounce_sec
+        self.batch_size = batch_size
+        self.full_syncs = 0
+        self.task: asyncio.Task | None = None
+        self.logger = structlog.getLogger("main_logger")
+        self._listener: Listener | None = None
+        self._changed: Set[int] = set()
+        self._changed_range: tuple[int, int] | None = None
+        self._changed_all = False
+        self._flush: asyncio.Task | None = None
+        self._syncing = asyncio.Lock()
+
+    async def start(self) -> None:
+        """This method starts the watched sites and keeps them up to date."""
+        await self._subscribe()
+        await self.full_sync()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """This method stops following changes, the running sites keep running."""
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+        for task in (self.task, self._flush):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.task = self._flush = None
+
+    async def full_sync(self) -> None:
+        """This method diffs the whole watch list against the running sites.
+        It raises `QueryException`, nothing is stopped then."""
+        await self.sync_range()
+        self.full_syncs += 1
+
+    async def sync_range(
+        self, first_id: int | None = None, last_id: int | None = None
+    ) -> None:
+        """This method diffs the sites with ids from `first_id` to `last_id`
+        against the running ones. It raises `QueryException`, nothing is stopped then.
+        """
+        async with self._syncing:
+            # Sites started while the list is streamed may be missing from its snapshot,
+            # so only sites that ran before the sync can be stopped.
+            running = [
+                site_id
+                for site_id in self.watcher.sites
+                if (first_id is None or site_id >= first_id)
+                and (last_id is None or site_id <= last_id)
+            ]
+            listed: Set[int] = set()
+            batches = self.db_conn.stream_watch_list(
+                self.batch_size, first_id=first_id, last_id=last_id
+            )
+            try:
+                async for batch in batches:
+                    listed.update(site[0] for site in batch)
+                    await self.watcher.add_to_monitoring(batch)
+            finally:
+                await batches.aclose()
+            self.watcher.remove_from_monitoring(
+                [
+                    site_id
+                    for site_id in running
+                    if site_id not in listed or not self.watcher.owns(site_id)
+                ]
+            )
+        self.logger.info(
+            "the watch list is synced",
+            first_id=first_id,
+            last_id=last_id,
+            sites=len(self.watcher.sites),
+            listed=len(listed),
+        )
+
+    async def sync_sites(self, site_ids: List[int]) -> None:
+        """This method applies changes of the given sites only.
+        It raises `QueryException`."""
+        async with self._syncing:
+            sites = await self.db_conn.get_sites(site_ids)
+            self.watcher.remove_from_monitoring(
+                [site_id for site_id in site_ids if site_id not in sites]
+            )
+            await self.watcher.add_to_monitoring(sites.values())
+
+    def notify(self, payload: str) -> None:
+        """This method collects sites changed in a database, they are synced
+        together after `debounce_sec`. The payload is a list of ids, e.g. `1,5`,
+        or a range of ids, e.g. `100-1099`, an empty payload asks for a full sync."""
+        if "-" in payload:
+            first, last = (int(site_id) for site_id in payload.split("-"))
+            if self._changed_range:
+                first = min(first, self._changed_range[0])
+                last = max(last, self._changed_range[1])
+            self._changed_range = (first, last)
+        elif payload:
+            self._changed.update(int(site_id) for site_id in payload.split(","))
+        else:
+            self._changed_all = True
+        if self._flush is None:
+            self._flush = asyncio.get_running_loop().create_task(self._apply())
+
+    async def _apply(self) -> None:
+        try:
+            while self._changed or self._changed_range or self._changed_all:
+                await asyncio.sleep(self.debounce_sec)
+                changed, self._changed = list(self._changed), set()
+                changed_range, self._changed_range = self._changed_range, None
+                changed_all, self._changed_all = self._changed_all, False
+                try:
+                    if changed_all:
+                        await self.full_sync()
+                        continue
+                    if changed_range:
+                        await self.sync_range(*changed_range)
+                    if changed:
+                        await self.sync_sites(changed)
+                except QueryException as error:
+                    # The periodic full sync applies the changes later.
+                    self.logger.error("cannot sync changed sites", error=error)
+        finally:
+            self._flush = None
+
+    async def _subscribe(self) -> None:
+        if not self.listen or (self._listener and self._listener.alive):
+            return
+        try:
+            self._listener = await self.db_conn.listen(WATCH_LIST_CHANNEL, self.notify)
+        except QueryException as error:
+            self.logger.error("cannot listen to changes of the watch list", error=error)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.resync_sec)
+            await self._subscribe()
+            try:
+                await self.full_sync()
+            except QueryException as error:
+                # The sites are kept as they are until the database is back.
+                self.logger.error("cannot sync the watch list", error=error)
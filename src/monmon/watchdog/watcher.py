@@ -1,50 +1,233 @@
 """The module monitors websites and records their metrics"""
-import asyncio
-import re
-from typing import Iterator
+import time
+from typing import Any, Callable, Dict, Iterable
 import structlog
 
-from monmon.db.db_connector import DbConnector
+from monmon.custom_types.watch_list import WatchListRow
+from monmon.db.metrics_sink import MetricsSink
+from monmon.instrumentation.prometheus import REGISTRY
+from monmon.matcher.regex_cache import InvalidRegexp, Matcher, RegexCache
 from monmon.requester.client import HttpClient
+from monmon.requester.site_state import SiteState
+from monmon.watchdog.adaptive import AdaptiveSchedule
+from monmon.watchdog.scheduler import Scheduler
+from monmon.watchdog.stats import Counters, SiteStats
+
+CHECKS_IN_FLIGHT = REGISTRY.gauge(
+    "monmon_checks_in_flight", "Checks of sites that are running right now"
+)
+CHECK_SECONDS = REGISTRY.histogram(
+    "monmon_check_seconds",
+    "Time of a whole check: the request, matching and queueing the metrics",
+)
+
+
+def _owns_all(_site_id: int) -> bool:
+    return True
+
+
+class MonitoredSite:
+    """
+    Everything a watcher keeps about a monitored site in a single slotted record,
+    a watcher keeps hundreds of thousands of them.
+
+    Attributes
+    ---------
+    url:
+        what is checked
+    matcher:
+        the compiled regexp of the site
+    state:
+        the result of the previous check, None without conditional requests
+    stats:
+        outcomes of recent checks
+    max_body_bytes:
+        the biggest body a check reads, the limit of the client if None
+    """
+
+    __slots__ = ("url", "matcher", "state", "stats", "max_body_bytes")
+
+    def __init__(
+        self,
+        url: str,
+        matcher: Matcher,
+        state: SiteState | None,
+        stats: SiteStats,
+        max_body_bytes: int | None = None,
+    ) -> None:
+        self.url = url
+        self.matcher = matcher
+        self.state = state
+        self.stats = stats
+        self.max_body_bytes = max_body_bytes
 
 
 class Watcher:
-    """This class allows you to add new websites for monitoring, tracking, and saving metrics to a database"""
+    """This class allows you to add new websites for monitoring, tracking, and saving metrics to a database
+
+    With `conditional_requests` the result of the previous check of every site is kept,
+    so unchanged pages are neither downloaded again (304) nor matched again.
+    With `dedup_content` the content of such checks is not stored again,
+    the metrics are only marked with `content_unchanged`.
 
-    def __init__(self, http_client: HttpClient, db_conn: DbConnector) -> None:
+    Only the sites that `owns` accepts are monitored, so workers
+    that share a watch list can each check their own shard.
+
+    Outcomes of the last `stats_window` checks of every site are kept in memory,
+    so the current health of sites is known without querying a database.
+
+    With an `adaptive` schedule failing and unchanged sites are checked less often
+    than their interval and sites that always time out are probed with a short timeout.
+    """
+
+    def __init__(
+        self,
+        http_client: HttpClient,
+        metrics_sink: MetricsSink,
+        *,
+        workers: int = 100,
+        jitter: float = 0.1,
+        conditional_requests: bool = True,
+        dedup_content: bool = False,
+        regex_cache: RegexCache | None = None,
+        stats_window: int = 100,
+        adaptive: AdaptiveSchedule | None = None,
+    ) -> None:
         self.http_client = http_client
-        self.db_conn = db_conn
+        self.metrics_sink = metrics_sink
+        self.conditional_requests = conditional_requests
+        self.dedup_content = dedup_content
+        self.regex_cache = regex_cache or RegexCache()
+        self.sites: Dict[int, MonitoredSite] = {}
+        self.stats_window = stats_window
+        self.totals = Counters()
+        self.adaptive = adaptive
+        self.owns: Callable[[int], bool] = _owns_all
+        self.scheduler = Scheduler(self._tick, workers=workers, jitter=jitter)
         self.logger = structlog.getLogger("main_logger")
 
-    async def add_to_monitoring(
-        self, watch_list: Iterator[tuple[int, str, str, int]]
-    ) -> None:
+    async def add_to_monitoring(self, watch_list: Iterable[WatchListRow]) -> None:
         """This method starts monitoring a specific list of URLs by periodically
         sending GET requests and storing the results in a database.
+        Sites that are monitored already are updated: a new interval only reschedules
+        the site, a new body limit applies from the next check, a new url or regexp
+        also resets the results of its previous checks, and unchanged sites aren't touched.
          watch_list:
-            site_id, url, regexp, check_interval_sec
+            site_id, url, regexp, check_interval_sec, max_body_bytes
         """
-        loop = asyncio.get_running_loop()
-        loop.create_task(self._ticker(watch_list))
+        self.scheduler.start()
+        added = updated = 0
+        for site_id, url, regexp, check_interval_sec, max_body_bytes in watch_list:
+            if not self.owns(site_id):
+                continue
+            current = self.sites.get(site_id)
+            if current and current.url == url and current.matcher.pattern == regexp:
+                current.max_body_bytes = max_body_bytes
+                if self.scheduler.interval(site_id) != check_interval_sec:
+                    self.reschedule(site_id, check_interval_sec)
+                continue
+            try:
+                compiled_regexp = self.regex_cache.get(regexp)
+            except InvalidRegexp as error:
+                self.logger.error(
+                    "cannot compile the regexp of the site",
+                    site_id=site_id,
+                    regexp=regexp,
+                    error=error,
+                )
+                continue
+            if current:
+                self._forget_checks(site_id, current)
+            self.sites[site_id] = MonitoredSite(
+                url,
+                compiled_regexp,
+                SiteState() if self.conditional_requests else None,
+                SiteStats(self.stats_window, self.totals),
+                max_body_bytes,
+            )
+            if current and self.scheduler.interval(site_id) != check_interval_sec:
+                self.scheduler.reschedule(site_id, check_interval_sec)
+            else:
+                self.scheduler.add(site_id, check_interval_sec)
+            if current:
+                updated += 1
+            else:
+                added += 1
+            # Sites come in thousands on start and on imports, so they are summed up.
+            self.logger.debug(
+                "the site updated" if current else "the site added to a monitoring",
+                site_id=site_id,
+                url=url,
+                time_interval=check_interval_sec,
+            )
+        if added or updated:
+            self.logger.info(
+                "sites added to a monitoring", added=added, updated=updated
+            )
 
-    async def _ticker(self, watch_list: Iterator[tuple[int, str, str, int]]) -> None:
-        started_tasks = [asyncio.create_task(self._tick(site)) for site in watch_list]
-        for task in started_tasks:
-            await task
-
-    async def _tick(self, site: tuple[int, str, str, int]) -> None:
-        """This method performs HTTP GET requests and stores data on performance metrics."""
-        site_id, url, regexp, check_interval_sec = site
-        compiled_regexp: re.Pattern = re.compile(regexp)
+    def remove_from_monitoring(self, site_ids: Iterable[int]) -> None:
+        """This method stops monitoring of the given sites."""
+        for site_id in site_ids:
+            self.scheduler.remove(site_id)
+            site = self.sites.pop(site_id, None)
+            if site:
+                self._forget_checks(site_id, site)
+                self.logger.info("the site removed from a monitoring", site_id=site_id)
 
+    def reschedule(self, site_id: int, check_interval_sec: int) -> None:
+        """This method changes how often the site is checked."""
+        self.scheduler.reschedule(site_id, check_interval_sec)
         self.logger.info(
-            "the site added to a monitoring",
-            site_id=site_id,
-            url=url,
-            time_interval=check_interval_sec,
+            "the site rescheduled", site_id=site_id, time_interval=check_interval_sec
         )
-        while True:
-            metrics = await self.http_client.get(site_id, url, compiled_regexp)
+
+    def site_stats(self, site_id: int) -> Dict[str, Any] | None:
+        """This method summarizes recent checks of a site, None if it isn't monitored."""
+        site = self.sites.get(site_id)
+        return site.stats.summary() if site else None
+
+    def all_stats(self) -> Dict[str, Any]:
+        """This method summarizes recent checks of all monitored sites."""
+        return {"sites": len(self.sites), **self.totals.summary()}
+
+    def _forget_checks(self, site_id: int, site: MonitoredSite) -> None:
+        """This method drops results of previous checks of a site from the totals
+        and from the adaptive schedule."""
+        self.totals.subtract(site.stats.counters)
+        if self.adaptive:
+            self.adaptive.forget(site_id)
+
+    async def _tick(self, site_id: int) -> float | None:
+        """This method performs HTTP GET requests and stores data on performance metrics.
+        It returns the delay until the next check if the schedule is adaptive."""
+        site = self.sites.get(site_id)
+        if site is None:
+            return None
+        CHECKS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            metrics = await self.http_client.get(
+                site_id,
+                site.url,
+                site.matcher,
+                site.state,
+                timeout_sec=self.adaptive.timeout_sec(site_id)
+                if self.adaptive
+                else None,
+                max_body_bytes=site.max_body_bytes,
+            )
+            # The site may have been removed or updated while it was checked.
+            current = self.sites.get(site_id)
+            if current:
+                current.stats.record(metrics)
             if metrics:
-                await self.db_conn.save_metrics(metrics)
-            await asyncio.sleep(check_interval_sec)
+                if self.dedup_content and metrics.content_unchanged:
+                    metrics.content = None
+                await self.metrics_sink.put(metrics)
+        finally:
+            CHECKS_IN_FLIGHT.dec()
+            CHECK_SECONDS.observe(time.perf_counter() - start)
+        interval_sec = self.scheduler.interval(site_id)
+        if self.adaptive is None or interval_sec is None:
+            return None
+        return self.adaptive.next_interval(site_id, interval_sec, metrics)
@@ -0,0 +1,202 @@
+"""This module imports long watch lists line by line and saves them chunk by chunk"""
+import csv
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Sequence,
+)
+
+from monmon.custom_types.watch_list import WatchList
+from monmon.db.pg.exceptions import QueryException
+from monmon.matcher.regex_cache import RegexCache
+from monmon.schemas.codec import loads
+from monmon.schemas.watch_list import site_error
+
+CSV_COLUMNS = ("url", "regexp", "check_interval_sec")
+# Longer lines can't hold valid settings of a site.
+MAX_LINE_BYTES = 1024
+# Only the first errors are listed in the report, the rest are only counted.
+MAX_REPORTED_ERRORS = 1000
+
+SaveChunk = Callable[[List[WatchList]], Awaitable[Sequence[Any]]]
+
+
+async def read_lines(
+    chunks: AsyncIterable[bytes], max_bytes: int = MAX_LINE_BYTES
+) -> AsyncGenerator[bytes, None]:
+    """Split a body into lines while it is received. Only the first `max_bytes + 1`
+    bytes of a longer line are kept, so such a line is rejected
+    without holding it in memory and the lines after it are still read."""
+    pending = b""
+    async for chunk in chunks:
+        *lines, pending = (pending + chunk).split(b"\n")
+        pending = pending[: max_bytes + 1]
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+class ImportReport:
+    """
+    The outcome of an import.
+
+    Attributes
+    ---------
+    imported:
+        sites that were saved and started
+    duplicates:
+        sites whose URL is monitored already or repeats in the import
+    failed:
+        lines that were rejected
+    errors:
+        line numbers of the first rejected lines, starting at 1, with the reasons
+    """
+
+    def __init__(self) -> None:
+        self.imported = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def reject(self, line: int, error: str) -> None:
+        """This method records a rejected line."""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    def summary(self) -> Dict[str, Any]:
+        """The report as a JSON object"""
+        return {
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+class BulkImport:
+    """
+    This class validates a watch list in NDJSON (an object per line) or CSV
+    (a header with `url,regexp,check_interval_sec`, optionally `max_body_bytes`,
+    and a site per line)
+    while it is received, and saves valid sites every `chunk_size` lines.
+    Every chunk is saved in its own transaction, so a long import neither keeps
+    the whole list in memory nor holds one giant transaction, and a chunk that
+    fails doesn't roll back the chunks saved before it.
+    URLs are deduplicated within the import and against monitored sites.
+    """
+
+    def __init__(
+        self,
+        save: SaveChunk,
+        csv_format: bool = False,
+        *,
+        regex_cache: RegexCache | None = None,
+        chunk_size: int = 1000,
+    ) -> None:
+        """
+        :param save: saves a chunk of valid sites, skipping known URLs,
+            and returns the saved ones
+        :param csv_format: lines are CSV instead of NDJSON
+        """
+        self.save = save
+        self.csv_format = csv_format
+        self.regex_cache = regex_cache
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+        self._header: List[str] | None = None
+        self._urls: set[str] = set()
+        self._chunk: List[WatchList] = []
+        self._chunk_lines: List[int] = []
+
+    async def run(self, lines: AsyncIterable[bytes]) -> ImportReport:
+        """This method imports all lines and returns the report."""
+        number = 0
+        async for raw_line in lines:
+            number += 1
+            if len(raw_line) > MAX_LINE_BYTES:
+                self.report.reject(
+                    number, f"a line must be at most {MAX_LINE_BYTES} bytes"
+                )
+                continue
+            try:
+                line = raw_line.decode().strip()
+            except UnicodeDecodeError:
+                self.report.reject(number, "a line must be UTF-8")
+                continue
+            if not line:
+                continue
+            if self.csv_format and self._header is None:
+                self._header = next(csv.reader([line]))
+                missing = set(CSV_COLUMNS) - set(self._header)
+                if missing:
+                    self.report.reject(
+                        number, f"the header must have {', '.join(CSV_COLUMNS)}"
+                    )
+                    return self.report
+                continue
+            self._add(number, line)
+            if len(self._chunk) >= self.chunk_size:
+                await self._flush()
+        await self._flush()
+        return self.report
+
+    def _add(self, number: int, line: str) -> None:
+        try:
+            site = self._parse(line)
+        except ValueError as error:
+            self.report.reject(number, str(error))
+            return
+        invalid = site_error(site, self.regex_cache)
+        if invalid:
+            self.report.reject(number, invalid)
+            return
+        if site["url"] in self._urls:
+            self.report.duplicates += 1
+            return
+        self._urls.add(site["url"])
+        self._chunk.append(site)
+        self._chunk_lines.append(number)
+
+    def _parse(self, line: str) -> Any:
+        if not self._header:
+            try:
+                return loads(line)
+            except ValueError as error:
+                raise ValueError(f"invalid JSON: {error}") from error
+        values = next(csv.reader([line]))
+        if len(values) != len(self._header):
+            raise ValueError(f"expected {len(self._header)} columns")
+        site: Dict[str, Any] = dict(zip(self._header, values))
+        try:
+            site["check_interval_sec"] = int(site["check_interval_sec"])
+        except ValueError as error:
+            raise ValueError("check_interval_sec must be an integer") from error
+        if "max_body_bytes" in site:
+            try:
+                site["max_body_bytes"] = (
+                    int(site["max_body_bytes"]) if site["max_body_bytes"] else None
+                )
+            except ValueError as error:
+                raise ValueError("max_body_bytes must be an integer") from error
+        return site
+
+    async def _flush(self) -> None:
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        lines, self._chunk_lines = self._chunk_lines, []
+        try:
+            saved = await self.save(chunk)
+        except QueryException:
+            for number in lines:
+                self.report.reject(number, "the site cannot be saved")
+            return
+        self.report.imported += len(saved)
+        self.report.duplicates += len(chunk) - len(saved)
@@ -1,15 +1,63 @@
 """This module provides a web server application."""
 import http
-from typing import List
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Tuple
 
 import structlog
 from aiohttp import web, ClientError
 
-from monmon.custom_types.watch_list import WatchList
-from monmon.db.db_connector import DbConnector
+from monmon.custom_types.watch_list import FieldError, WatchList
+from monmon.db.db_connector import ROLLUP_TABLES, DbConnector
 from monmon.db.pg.exceptions import QueryException
-from monmon.schemas.watch_list import is_watch_list_valid
+from monmon.db.storage import MetricsStorage
+from monmon.instrumentation.prometheus import REGISTRY, Registry
+from monmon.schemas.codec import dumps, loads
+from monmon.schemas.watch_list import body_error, parse_watch_list
 from monmon.watchdog.watcher import Watcher
+from monmon.web_server.bulk_import import BulkImport, read_lines
+
+WEB_REQUEST_SECONDS = REGISTRY.histogram(
+    "monmon_web_request_seconds",
+    "Time to handle a request to the API, by the route and the status code",
+    ("method", "route", "status"),
+)
+
+ROLLUP_FIELDS = (
+    "bucket",
+    "checks",
+    "up_checks",
+    "uptime",
+    "response_time_avg",
+    "response_time_p50",
+    "response_time_p95",
+    "response_time_p99",
+    "status_counts",
+)
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+@web.middleware
+async def instrumentation_middleware(
+    request: web.Request, handler: Handler
+) -> web.StreamResponse:
+    """Measure every request by its route, so paths with ids don't blow up labels"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as error:
+        status = error.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource else "unmatched"
+        WEB_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, (request.method, route, str(status))
+        )
 
 
 class WebServer:
@@ -18,27 +66,46 @@ class WebServer:
     """
 
     def __init__(
-        self, host: str, port: int, watcher: Watcher, db_conn: DbConnector
+        self,
+        host: str,
+        port: int,
+        watcher: Watcher,
+        db_conn: DbConnector,
+        registry: Registry | None = None,
+        *,
+        reuse_port: bool = False,
+        bulk_chunk_size: int = 1000,
+        max_body_bytes: int = 1024 * 1024,
+        metrics_storage: MetricsStorage | None = None,
     ) -> None:
+        """
+        :param registry: internal metrics of the service,
+            they are served at `/metrics` in the Prometheus format if it is given
+        :param reuse_port: let several worker processes on one host share the port
+        :param bulk_chunk_size: how many sites of an import are saved at a time
+        :param max_body_bytes: the longest body of a request that is read at once,
+            `POST /bulk` is read line by line and has no limit
+        :param metrics_storage: where metrics are read from, the database by default
+        """
         self.host = host
         self.port = port
         self.watcher = watcher
         self.db_conn = db_conn
+        self.metrics_storage: MetricsStorage = metrics_storage or db_conn
+        self.registry = registry
+        self.reuse_port = reuse_port
+        self.bulk_chunk_size = bulk_chunk_size
+        self.max_body_bytes = max_body_bytes
         self.logger = structlog.getLogger("main_logger")
 
-    async def add_to_monitoring_handler(self, request: web.BaseRequest) -> web.Response:
+    async def add_to_monitoring_handler(self, request: web.Request) -> web.Response:
         """This method will analyze the requests made by the user,
         store the associated URLs in the database,
-        and include them in the monitoring process."""
-        if not request.body_exists:
-            return web.Response(
-                status=http.HTTPStatus.BAD_REQUEST, text="empty body request"
-            )
-        req = await request.json()
-        msg, is_valid = await is_watch_list_valid(req)
-        if not is_valid:
-            return web.Response(status=http.HTTPStatus.BAD_REQUEST, text=msg)
-        watch_list: List[WatchList] = req
+        and include them in the monitoring process.
+        An invalid request gets a list of errors, one per invalid field."""
+        watch_list, errors = await self._read_watch_list(request)
+        if errors:
+            return _errors_response(errors)
         try:
             saved_wl = await self.db_conn.save_to_watch_list(watch_list)
             if saved_wl:
@@ -49,17 +116,272 @@ class WebServer:
             )
         return web.Response(text="the URL added to the monitoring")
 
-    async def start(self) -> None:
-        """This method is responsible for registering routes and initiating a web server."""
-        app = web.Application()
+    async def bulk_import_handler(self, request: web.Request) -> web.Response:
+        """This method imports a long watch list, NDJSON (`application/x-ndjson`)
+        or CSV (`text/csv`), and returns a report with the errors of every rejected line.
+        Valid sites are saved and started even if some lines are rejected."""
+        if request.content_type not in ("application/x-ndjson", "text/csv"):
+            return web.Response(
+                status=http.HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                text="the body must be application/x-ndjson or text/csv",
+            )
+
+        async def save(chunk: List[WatchList]) -> List[tuple]:
+            saved = list(
+                await self.db_conn.save_to_watch_list(chunk, skip_known_urls=True) or []
+            )
+            await self.watcher.add_to_monitoring(saved)
+            return saved
+
+        bulk_import = BulkImport(
+            save,
+            request.content_type == "text/csv",
+            regex_cache=self.watcher.regex_cache,
+            chunk_size=self.bulk_chunk_size,
+        )
+        report = await bulk_import.run(read_lines(request.content.iter_any()))
+        self.logger.info(
+            "the watch list imported",
+            imported=report.imported,
+            duplicates=report.duplicates,
+            failed=report.failed,
+        )
+        return web.json_response(report.summary())
+
+    async def update_site_handler(self, request: web.Request) -> web.Response:
+        """This method replaces the url, the regexp and the interval of a site
+        and applies them to the monitoring at once."""
+        try:
+            site_id = int(request.match_info["site_id"])
+        except ValueError:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST, text="site_id must be an integer"
+            )
+        watch_list, errors = await self._read_watch_list(request, single=True)
+        if errors:
+            return _errors_response(errors)
+        try:
+            saved = await self.db_conn.update_site(site_id, watch_list[0])
+            if saved:
+                await self.watcher.add_to_monitoring([saved])
+        except QueryException:
+            return web.Response(
+                status=http.HTTPStatus.INTERNAL_SERVER_ERROR,
+                text="the site cannot be updated",
+            )
+        if saved is None:
+            return web.Response(
+                status=http.HTTPStatus.NOT_FOUND, text="the site is not monitored"
+            )
+        return web.Response(text="the site updated")
+
+    async def delete_site_handler(self, request: web.Request) -> web.Response:
+        """This method stops monitoring of a site, its metrics are kept."""
+        try:
+            site_id = int(request.match_info["site_id"])
+        except ValueError:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST, text="site_id must be an integer"
+            )
+        try:
+            deleted = await self.db_conn.delete_site(site_id)
+        except QueryException:
+            return web.Response(
+                status=http.HTTPStatus.INTERNAL_SERVER_ERROR,
+                text="the site cannot be deleted",
+            )
+        if not deleted:
+            return web.Response(
+                status=http.HTTPStatus.NOT_FOUND, text="the site is not monitored"
+            )
+        self.watcher.remove_from_monitoring([site_id])
+        return web.Response(text="the site removed from the monitoring")
+
+    async def get_metrics_handler(self, request: web.Request) -> web.StreamResponse:
+        """This method streams metrics of a site as NDJSON, one metrics per line, oldest first.
+
+        Query params (all optional):
+            from, to: ISO 8601 bounds of the range, `to` is exclusive,
+                timestamps without a timezone are in UTC
+            after: the keyset cursor, pass the timestamp of the last received line
+                to get the next page
+            limit: the maximum number of lines
+        """
+        try:
+            site_id = int(request.match_info["site_id"])
+            since = _parse_time(request.query.get("from"))
+            until = _parse_time(request.query.get("to"))
+            after = _parse_time(request.query.get("after"))
+            limit = request.query.get("limit")
+            limit_rows = int(limit) if limit is not None else None
+        except ValueError:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST,
+                text="site_id and limit must be integers, from, to and after "
+                "must be ISO 8601 timestamps",
+            )
+        if limit_rows is not None and limit_rows < 1:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST, text="limit must be positive"
+            )
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "application/x-ndjson; charset=utf-8"}
+        )
+        batches = self.metrics_storage.stream_metrics(
+            site_id, since=since, until=until, after=after, limit=limit_rows
+        )
+        try:
+            async for batch in batches:
+                if not response.prepared:
+                    await response.prepare(request)
+                await response.write(
+                    b"".join(dumps(metrics) + b"\n" for metrics in batch)
+                )
+        except QueryException:
+            if response.prepared:
+                # The status is already sent, so the client sees a truncated stream.
+                self.logger.error("metrics stream interrupted", site_id=site_id)
+                return response
+            return web.Response(
+                status=http.HTTPStatus.INTERNAL_SERVER_ERROR,
+                text="metrics cannot be read",
+            )
+        finally:
+            await batches.aclose()
+        if not response.prepared:
+            await response.prepare(request)
+        await response.write_eof()
+        return response
+
+    async def get_rollups_handler(self, request: web.Request) -> web.Response:
+        """This method returns aggregates of a site per bucket, oldest first:
+        checks, uptime, average and p50/p95/p99 response time and status codes.
+
+        Query params (all optional):
+            resolution: `minute` or `hour`, the default
+            from, to: ISO 8601 bounds of the buckets, `to` is exclusive,
+                the last day by default
+        """
+        resolution = request.query.get("resolution", "hour")
+        if resolution not in ROLLUP_TABLES:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST,
+                text=f"resolution must be one of {', '.join(ROLLUP_TABLES)}",
+            )
+        try:
+            site_id = int(request.match_info["site_id"])
+            until = _parse_time(request.query.get("to")) or datetime.now(timezone.utc)
+            since = _parse_time(request.query.get("from")) or until - timedelta(days=1)
+        except ValueError:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST,
+                text="site_id must be an integer, from and to must be ISO 8601 "
+                "timestamps",
+            )
+        rollups = await self.metrics_storage.get_rollups(
+            site_id, resolution, since, until
+        )
+        if rollups is None:
+            return web.Response(
+                status=http.HTTPStatus.INTERNAL_SERVER_ERROR,
+                text="rollups cannot be read",
+            )
+        return web.json_response(
+            [
+                dict(zip(ROLLUP_FIELDS, (bucket.isoformat(), *aggregates)))
+                for bucket, *aggregates in rollups
+            ]
+        )
+
+    async def get_site_stats_handler(self, request: web.Request) -> web.Response:
+        """This method returns the health of a site over its recent checks:
+        uptime, error rate and match rate in percents, status classes
+        and p50/p95/p99 latency in milliseconds."""
+        try:
+            site_id = int(request.match_info["site_id"])
+        except ValueError:
+            return web.Response(
+                status=http.HTTPStatus.BAD_REQUEST, text="site_id must be an integer"
+            )
+        stats = self.watcher.site_stats(site_id)
+        if stats is None:
+            return web.Response(
+                status=http.HTTPStatus.NOT_FOUND, text="the site is not monitored"
+            )
+        return web.json_response({"site_id": site_id, **stats})
+
+    async def get_stats_handler(self, _request: web.Request) -> web.Response:
+        """This method returns the health of all monitored sites together."""
+        return web.json_response(self.watcher.all_stats())
+
+    async def get_internal_metrics_handler(self, _request: web.Request) -> web.Response:
+        """This method exposes internal metrics of the service for Prometheus."""
+        if self.registry is None:
+            return web.Response(status=http.HTTPStatus.NOT_FOUND)
+        return web.Response(
+            text=self.registry.expose(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def _read_watch_list(
+        self, request: web.Request, single: bool = False
+    ) -> Tuple[List[WatchList], List[FieldError]]:
+        """Decode and validate a JSON body, a list of sites or a `single` site.
+        A body longer than `max_body_bytes` is rejected by aiohttp with 413."""
+        body = await request.read()
+        if not body:
+            return [], [body_error("empty body request")]
+        try:
+            data = loads(body)
+        except ValueError as error:
+            return [], [body_error(f"invalid JSON: {error}")]
+        return parse_watch_list([data] if single else data, self.watcher.regex_cache)
+
+    def make_app(self) -> web.Application:
+        """This method creates the application with all routes registered."""
+        app = web.Application(
+            middlewares=[instrumentation_middleware] if self.registry else [],
+            client_max_size=self.max_body_bytes,
+        )
+        if self.registry:
+            app.add_routes([web.get("/metrics", self.get_internal_metrics_handler)])
         app.add_routes(
             [
                 web.post("/", self.add_to_monitoring_handler),
+                web.post("/bulk", self.bulk_import_handler),
+                web.put("/sites/{site_id}", self.update_site_handler),
+                web.delete("/sites/{site_id}", self.delete_site_handler),
+                web.get("/sites/{site_id}/metrics", self.get_metrics_handler),
+                web.get("/sites/{site_id}/rollups", self.get_rollups_handler),
+                web.get("/sites/{site_id}/stats", self.get_site_stats_handler),
+                web.get("/stats", self.get_stats_handler),
             ]
         )
+        return app
+
+    async def start(self) -> None:
+        """This method is responsible for registering routes and initiating a web server."""
+        app = self.make_app()
 
         runner = web.AppRunner(app)
         await runner.setup()
-        site = web.TCPSite(runner, host=self.host, port=self.port)
+        site = web.TCPSite(
+            runner, host=self.host, port=self.port, reuse_port=self.reuse_port or None
+        )
         await site.start()
         self.logger.info("the web server started", host=self.host, port=self.port)
+
+
+def _errors_response(errors: List[FieldError]) -> web.Response:
+    return web.json_response({"errors": errors}, status=http.HTTPStatus.BAD_REQUEST)
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    """Parse an ISO 8601 timestamp, a timestamp without a timezone is in UTC"""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
@@ -0,0 +1,25 @@
+"""Helpers shared by the tests"""
+from datetime import datetime, timedelta, timezone
+
+from monmon.custom_types.watch_list import Metrics
+
+START = datetime(2023, 5, 1, tzinfo=timezone.utc)
+
+
+def make_metrics(
+    site_id: int = 1,
+    seconds: int = 0,
+    status_code: int = 200,
+    response_time: int = 1,
+    content: str | None = "found",
+    **options,
+) -> Metrics:
+    """Build metrics of a check of a site some seconds after `START`"""
+    return Metrics(
+        site_id,
+        status_code,
+        Metrics.timestamp_ns_of(START + timedelta(seconds=seconds)),
+        response_time,
+        content,
+        **options,
+    )
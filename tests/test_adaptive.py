@@ -0,0 +1,71 @@
+"""Tests for the `adaptive` module"""
+import unittest
+
+from monmon.watchdog.adaptive import AdaptiveSchedule
+from tests.helpers import make_metrics
+
+
+class TestAdaptiveSchedule(unittest.TestCase):
+    """Test cases for adaptive intervals"""
+
+    def test_backoff(self) -> None:
+        """A failing site is backed off up to the cap and recovers at once"""
+        schedule = AdaptiveSchedule(backoff_factor=2, max_backoff_sec=300)
+        delays = [
+            schedule.next_interval(1, 60, make_metrics(status_code=503))
+            for _ in range(4)
+        ]
+        self.assertEqual(delays, [120, 240, 300, 300])
+        self.assertEqual(schedule.backed_off(), 1)
+
+        self.assertEqual(schedule.next_interval(1, 60, make_metrics()), 60)
+        self.assertEqual(schedule.backed_off(), 0)
+        self.assertEqual(schedule.backoffs, {})
+
+    def test_long_outage(self) -> None:
+        """A site that fails for a long time stays at the cap"""
+        schedule = AdaptiveSchedule(backoff_factor=2.0, max_backoff_sec=300)
+        delays = {schedule.next_interval(1, 60, None) for _ in range(2000)}
+        self.assertEqual(delays, {120, 240, 300})
+        self.assertEqual(schedule.backoffs[1].failures, 2000)
+
+        schedule.backoffs[1].failures = 10**6
+        self.assertEqual(
+            schedule.next_interval(1, 60, make_metrics(status_code=503)), 300
+        )
+        self.assertEqual(
+            schedule.next_interval(2, 600, make_metrics(status_code=503)), 600
+        )
+        self.assertEqual(schedule.next_interval(1, 60, make_metrics()), 60)
+
+    def test_stable_site(self) -> None:
+        """A site with the same content is stretched within max_stretch"""
+        schedule = AdaptiveSchedule(stable_after=2, stable_factor=2, max_stretch=3)
+        delays = [
+            schedule.next_interval(1, 10, make_metrics(content_unchanged=True))
+            for _ in range(4)
+        ]
+        self.assertEqual(delays, [10, 20, 30, 30])
+
+        self.assertEqual(schedule.next_interval(1, 10, make_metrics()), 10)
+        self.assertEqual(
+            schedule.next_interval(1, 10, make_metrics(content_unchanged=True)), 10
+        )
+
+    def test_circuit_breaker(self) -> None:
+        """A site without responses is probed with a short timeout until it responds"""
+        schedule = AdaptiveSchedule(breaker_failures=2, probe_timeout_sec=3)
+        schedule.next_interval(1, 60, None)
+        self.assertIsNone(schedule.timeout_sec(1))
+        schedule.next_interval(1, 60, None)
+        self.assertEqual(schedule.timeout_sec(1), 3)
+        self.assertEqual(schedule.open_circuits(), 1)
+
+        # An error status is a response, so the circuit closes but the backoff goes on.
+        self.assertEqual(
+            schedule.next_interval(1, 60, make_metrics(status_code=500)), 480
+        )
+        self.assertIsNone(schedule.timeout_sec(1))
+
+        schedule.forget(1)
+        self.assertEqual(schedule.next_interval(1, 60, None), 120)
@@ -1,10 +1,14 @@
 """Tests for requester module"""
+import asyncio
+import time
 import unittest
 import re
 
 from aiohttp import web
 
 from monmon.requester.client import HttpClient
+from monmon.requester.site_state import SiteState
+from monmon.requester.stream_matcher import StreamMatcher
 
 
 async def mock_server(_resp):
@@ -26,6 +30,24 @@ async def mock_server(_resp):
     )
 
 
+async def mock_etag_server(request: web.Request) -> web.Response:
+    """This method simulates a site that supports conditional requests"""
+    if request.headers.get("If-None-Match") == '"v1"':
+        return web.Response(status=304, headers={"ETag": '"v1"'})
+    return web.Response(text="<p>find me</p>", headers={"ETag": '"v1"'})
+
+
+async def mock_big_server(_request: web.Request) -> web.Response:
+    """This method simulates a site with a big page"""
+    return web.Response(text="<p>find me</p>" * 1000)
+
+
+async def mock_slow_server(_request: web.Request) -> web.Response:
+    """This method simulates a site that responds too late"""
+    await asyncio.sleep(2)
+    return web.Response(text="late")
+
+
 class TestClient(unittest.IsolatedAsyncioTestCase):
     """Test cases for client"""
 
@@ -33,6 +55,9 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
         # Setup server stuff here
         self.app = web.Application()
         self.app.router.add_get("/", mock_server)
+        self.app.router.add_get("/etag", mock_etag_server)
+        self.app.router.add_get("/slow", mock_slow_server)
+        self.app.router.add_get("/big", mock_big_server)
         runner = web.AppRunner(self.app)
         await runner.setup()
         self.site = web.TCPSite(runner, port=8000)
@@ -78,7 +103,7 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
             response = await self.http_client.get(
                 site["site_id"], site["url"], site["regexp"]
             )
-            self.assertEqual(response["content"], site["expected"])
+            self.assertEqual(response.content, site["expected"])
 
     async def test_responses(self) -> None:
         """This is a test to check the correctness of returned http status codes"""
@@ -100,7 +125,7 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
             response = await self.http_client.get(
                 site["site_id"], site["url"], site["regexp"]
             )
-            self.assertEqual(response["status_code"], site["expected"])
+            self.assertEqual(response.status_code, site["expected"])
 
     async def test_none_return(self) -> None:
         """Testing that None is returned when problems occur."""
@@ -117,3 +142,124 @@ class TestClient(unittest.IsolatedAsyncioTestCase):
                 site["site_id"], site["url"], site["regexp"]
             )
             self.assertEqual(response, site["expected"])
+
+    async def test_stream_regex_matching(self) -> None:
+        """The stream mode finds the same content as reading the whole body"""
+        stream_client = HttpClient(
+            timeout_sec=7, stream_body=True, chunk_size=16, match_overlap=32
+        )
+        for regexp in ["find me", "1[0-9]*", "<p>.*</p>", "no match", ""]:
+            expected = await self.http_client.get(
+                1, "http://localhost:8000/", re.compile(regexp)
+            )
+            response = await stream_client.get(
+                1, "http://localhost:8000/", re.compile(regexp)
+            )
+            self.assertEqual(response.content, expected.content)
+        await stream_client.close_session()
+
+    async def test_stream_two_groups(self) -> None:
+        """A regexp with several groups finds the same content in both modes"""
+        stream_client = HttpClient(
+            timeout_sec=7, stream_body=True, chunk_size=16, match_overlap=32
+        )
+        regexp = re.compile("<(p)>([0-9]+)</p>")
+        expected = await self.http_client.get(1, "http://localhost:8000/", regexp)
+        response = await stream_client.get(1, "http://localhost:8000/", regexp)
+        await stream_client.close_session()
+
+        self.assertEqual(expected.content, "p\t123\np\t12")
+        self.assertEqual(response.content, expected.content)
+
+    async def test_body_limit(self) -> None:
+        """A body beyond the limit fails the check in both modes"""
+        stream_client = HttpClient(timeout_sec=7, stream_body=True, chunk_size=1024)
+        small_client = HttpClient(timeout_sec=7, max_body_bytes=1024)
+        url = "http://localhost:8000/big"
+        for client in (self.http_client, stream_client):
+            self.assertIsNone(
+                await client.get(1, url, re.compile("find me"), max_body_bytes=4096)
+            )
+            response = await client.get(1, url, re.compile("find"))
+            self.assertTrue(response.content.startswith("find\nfind"))
+        self.assertIsNone(await small_client.get(1, url, re.compile("find me")))
+        response = await small_client.get(
+            1, url, re.compile("find me"), max_body_bytes=16384
+        )
+        self.assertEqual(response.status_code, 200)
+        await stream_client.close_session()
+        await small_client.close_session()
+
+    async def test_timings(self) -> None:
+        """Requests are split into phases and kept-alive connections are reused"""
+        first = await self.http_client.get(
+            1, "http://localhost:8000/", re.compile("find me")
+        )
+        second = await self.http_client.get(
+            1, "http://localhost:8000/", re.compile("find me")
+        )
+
+        self.assertIsNotNone(first.connect_time)
+        self.assertIsNotNone(first.ttfb)
+        self.assertIsNotNone(first.body_time)
+        self.assertIsNone(second.connect_time)
+        self.assertIsNotNone(second.ttfb)
+
+    async def test_conditional_requests(self) -> None:
+        """Unchanged pages reuse the content of the previous check"""
+        testcases = [
+            {"url": "http://localhost:8000/etag", "expected": [200, 304]},
+            {"url": "http://localhost:8000/", "expected": [200, 200]},
+        ]
+        for site in testcases:
+            state = SiteState()
+            first = await self.http_client.get(
+                1, site["url"], re.compile("find me"), state
+            )
+            second = await self.http_client.get(
+                1, site["url"], re.compile("find me"), state
+            )
+
+            self.assertEqual([first.status_code, second.status_code], site["expected"])
+            self.assertFalse(first.content_unchanged)
+            self.assertTrue(second.content_unchanged)
+            self.assertEqual(second.content, first.content)
+
+    async def test_probe_timeout(self) -> None:
+        """A probe gives up after its own timeout instead of the one of the client"""
+        start = time.perf_counter()
+        response = await self.http_client.get(
+            1, "http://localhost:8000/slow", re.compile("late"), timeout_sec=0.2
+        )
+        self.assertIsNone(response)
+        self.assertLess(time.perf_counter() - start, 1.5)
+
+
+class TestStreamMatcher(unittest.TestCase):
+    """Test cases for matching a regexp chunk by chunk"""
+
+    def test_match_across_chunks(self) -> None:
+        """A match split between chunks is found once"""
+        matcher = StreamMatcher(re.compile("find me"), overlap=10)
+        for chunk in ["xx fi", "nd me yy find", " me"]:
+            matcher.feed(chunk)
+        matcher.feed("", final=True)
+
+        self.assertEqual(matcher.content, "find me\nfind me")
+
+    def test_groups(self) -> None:
+        """A regexp with a group collects the group like `findall`"""
+        matcher = StreamMatcher(re.compile("id=([0-9]+);"), overlap=10)
+        for chunk in ["id=1", "2;id=", "3;"]:
+            matcher.feed(chunk)
+        matcher.feed("", final=True)
+
+        self.assertEqual(matcher.content, "12\n3")
+
+    def test_limit(self) -> None:
+        """The matcher is done once it collected enough content"""
+        matcher = StreamMatcher(re.compile("a+"), overlap=4, limit=5)
+        matcher.feed("a b a b a b a b")
+
+        self.assertTrue(matcher.done)
+        self.assertEqual(matcher.content, "a\na\na")
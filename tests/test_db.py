@@ -1,12 +1,15 @@
 """Tests for the `db_connector` module"""
+import asyncio
 import configparser
 import random
+import time
 import unittest
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import List
 
-from monmon.custom_types.watch_list import WatchListMetrics, WatchList
+from monmon.custom_types.watch_list import Metrics, WatchList
 from monmon.db.db_connector import DbConnector
+from monmon.db.maintenance import MetricsMaintenance
 
 
 class TestDB(unittest.IsolatedAsyncioTestCase):
@@ -35,15 +38,18 @@ class TestDB(unittest.IsolatedAsyncioTestCase):
                 "url": "https://req-west.dev/users/3",
                 "check_interval_sec": random.randint(5, 301),
                 "regexp": "abc",
+                "max_body_bytes": 4096,
             },
         ]
 
         saved_wl = await self.db_conn.save_to_watch_list(watch_list)
         if not saved_wl:
             self.fail("failed to save watch list")
+        saved_wl = list(saved_wl)
         get_wl = await self.db_conn.get_watch_list()
 
         self.assertCountEqual(saved_wl, get_wl)
+        self.assertCountEqual([site[4] for site in saved_wl], [None, 4096])
 
     async def test_metrics(self):
         """Testing insert and select a metrics"""
@@ -59,26 +65,176 @@ class TestDB(unittest.IsolatedAsyncioTestCase):
         if not saved_wl:
             self.fail("failed to save watch list")
 
-        site_id, _, _, _ = next(saved_wl)
+        site_id, *_ = next(saved_wl)
 
-        metrics: WatchListMetrics = {
-            "site_id": site_id,
-            "status_code": 200,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "response_time": random.randint(30000000, 90000001),
-            "content": "test content",
-        }
+        metrics = Metrics(
+            site_id,
+            200,
+            time.time_ns(),
+            random.randint(30000000, 90000001),
+            "test content",
+        )
         await self.db_conn.save_metrics(metrics)
         saved_metrics = await self.db_conn.get_metrics(site_id)
         if not saved_metrics:
             self.fail("metrics not saved to database")
 
-        site_id, status_code, timestamp, response_time, content = next(saved_metrics)
-        result: WatchListMetrics = {
-            "site_id": site_id,
-            "status_code": status_code,
-            "timestamp": timestamp.isoformat(),
-            "response_time": response_time,
-            "content": content,
-        }
-        self.assertEqual(metrics, result)
+        self.assertEqual(next(saved_metrics), metrics.row()[:5])
+
+    async def _save_site(self) -> int:
+        watch_list: List[WatchList] = [
+            {
+                "url": "https://example.com/users/1",
+                "check_interval_sec": 5,
+                "regexp": "[a-z][A-Z]",
+            },
+        ]
+        saved_wl = await self.db_conn.save_to_watch_list(watch_list)
+        if not saved_wl:
+            self.fail("failed to save watch list")
+        site_id, *_ = next(saved_wl)
+        return site_id
+
+    async def test_stream_metrics(self):
+        """Testing reading metrics by pages and in a stream"""
+        site_id = await self._save_site()
+        start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+        for minute in range(5):
+            await self.db_conn.save_metrics(
+                Metrics(
+                    site_id,
+                    200,
+                    Metrics.timestamp_ns_of(start + timedelta(minutes=minute)),
+                    minute,
+                    "",
+                )
+            )
+        # A replayed batch isn't saved twice, so a page boundary can't split duplicates.
+        await self.db_conn.save_metrics_batch(
+            [
+                Metrics(
+                    site_id,
+                    200,
+                    Metrics.timestamp_ns_of(start + timedelta(minutes=minute)),
+                    minute,
+                    "",
+                )
+                for minute in range(2)
+            ]
+        )
+
+        batches = [
+            batch async for batch in self.db_conn.stream_metrics(site_id, batch_size=2)
+        ]
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            [metrics["response_time"] for batch in batches for metrics in batch],
+            [0, 1, 2, 3, 4],
+        )
+        limited = [
+            batch
+            async for batch in self.db_conn.stream_metrics(
+                site_id, limit=3, batch_size=2
+            )
+        ]
+        self.assertEqual([len(batch) for batch in limited], [2, 1])
+
+        # A paused stream, e.g. of a slow client, doesn't hold the only connection.
+        small_pool = DbConnector(
+            self.db_conn.dsn, "src/monmon/db/migrations", pool_max_size=1
+        )
+        paused = small_pool.stream_metrics(site_id, batch_size=2)
+        await anext(paused)
+        page = await asyncio.wait_for(small_pool.get_metrics(site_id, limit=1), 5)
+        self.assertEqual(len(list(page or [])), 1)
+        await paused.aclose()
+
+        page = list(
+            await self.db_conn.get_metrics(
+                site_id, since=start + timedelta(minutes=1), limit=2
+            )
+        )
+        self.assertEqual([row[3] for row in page], [1, 2])
+        next_page = list(
+            await self.db_conn.get_metrics(site_id, after=page[-1][2], limit=2)
+        )
+        self.assertEqual([row[3] for row in next_page], [3, 4])
+
+        batches = [
+            batch
+            async for batch in self.db_conn.stream_metrics(
+                site_id, until=start + timedelta(minutes=4), limit=3
+            )
+        ]
+        self.assertEqual(
+            [metrics["response_time"] for metrics in batches[0]], [0, 1, 2]
+        )
+
+    async def test_metrics_partitions(self):
+        """Testing that partitions are created ahead and expired ones are dropped"""
+        site_id = await self._save_site()
+        today = datetime.now(timezone.utc).date()
+        old_day = today - timedelta(days=20)
+        # A row of a day without a partition lands in the default partition
+        # and is moved into the partition of its day once it is created.
+        await self.db_conn.save_metrics(
+            Metrics(
+                site_id,
+                200,
+                Metrics.timestamp_ns_of(
+                    datetime.now(timezone.utc) + timedelta(days=10)
+                ),
+                1,
+                "",
+            )
+        )
+        await self.db_conn.create_metrics_partition(today + timedelta(days=10))
+        await self.db_conn.create_metrics_partition(old_day)
+
+        maintenance = MetricsMaintenance(
+            self.db_conn, premake_days=5, retention_days=14
+        )
+        await maintenance.partitions()
+
+        days = await self.db_conn.get_metrics_partitions()
+        self.assertNotIn(old_day, days)
+        for offset in range(6):
+            self.assertIn(today + timedelta(days=offset), days)
+        self.assertEqual(len(list(await self.db_conn.get_metrics(site_id))), 1)
+
+    async def test_rollups(self):
+        """Testing per-minute rollups of raw metrics"""
+        site_id = await self._save_site()
+        bucket = datetime.now(timezone.utc).replace(
+            second=0, microsecond=0
+        ) - timedelta(minutes=1)
+        for second, status_code, response_time in [
+            (1, 200, 100),
+            (2, 200, 200),
+            (3, 503, 300),
+            (4, 200, 400),
+        ]:
+            await self.db_conn.save_metrics(
+                Metrics(
+                    site_id,
+                    status_code,
+                    Metrics.timestamp_ns_of(bucket.replace(second=second)),
+                    response_time,
+                    "",
+                )
+            )
+
+        maintenance = MetricsMaintenance(self.db_conn)
+        await maintenance.rollup("minute")
+        # Rolling up again must not count the same rows twice.
+        await maintenance.rollup("minute")
+
+        rollups = await self.db_conn.get_rollups(
+            site_id, "minute", bucket, bucket + timedelta(minutes=1)
+        )
+        if not rollups:
+            self.fail("metrics not rolled up")
+        self.assertEqual(
+            list(rollups),
+            [(bucket, 4, 3, 0.75, 250, 200, 400, 400, {"200": 3, "503": 1})],
+        )
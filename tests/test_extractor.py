@@ -0,0 +1,34 @@
+"""Tests for the `extractor` module"""
+import re
+import unittest
+
+from monmon.matcher.extractor import Extractor
+from monmon.matcher.regex_cache import RegexCache
+
+
+class TestExtractor(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the extraction executor"""
+
+    async def test_modes(self) -> None:
+        """Every mode extracts the same content"""
+        text = "<p>find me</p>\n" * 1000
+        regexps = [re.compile("find (me)"), RegexCache(engine="re").get("<p>")]
+        for mode in ["inline", "thread", "process"]:
+            extractor = Extractor(mode, workers=2, offload_threshold=1024)
+            for regexp in regexps:
+                content = await extractor.extract(regexp, text)
+                self.assertEqual(content, "\n".join(regexp.findall(text))[:256])
+            extractor.close()
+
+            self.assertEqual(extractor.queue_depth, 0)
+            self.assertEqual(
+                extractor.offloaded, 0 if mode == "inline" else len(regexps)
+            )
+
+    async def test_threshold(self) -> None:
+        """Short texts are matched inline"""
+        extractor = Extractor("thread", workers=1, offload_threshold=1024)
+        await extractor.extract(re.compile("a"), "a" * 100)
+        extractor.close()
+
+        self.assertEqual(extractor.offloaded, 0)
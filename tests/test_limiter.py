@@ -0,0 +1,64 @@
+"""Tests for the `limiter` module"""
+import asyncio
+import time
+import unittest
+from collections import Counter
+
+from monmon.requester.limiter import RequestLimiter
+
+
+class TestRequestLimiter(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the request limiter"""
+
+    async def asyncSetUp(self) -> None:
+        self.running: Counter = Counter()
+        self.max_running: Counter = Counter()
+
+    async def request(self, limiter: RequestLimiter, host: str) -> None:
+        """Hold a slot for a while and record the concurrency"""
+        async with limiter.slot(host):
+            self.running[host] += 1
+            self.running["total"] += 1
+            self.max_running[host] = max(self.max_running[host], self.running[host])
+            self.max_running["total"] = max(
+                self.max_running["total"], self.running["total"]
+            )
+            await asyncio.sleep(0.01)
+            self.running[host] -= 1
+            self.running["total"] -= 1
+
+    async def test_per_host_limit(self) -> None:
+        """No more requests run to one host than allowed"""
+        limiter = RequestLimiter(max_in_flight=0, max_per_host=2)
+        await asyncio.gather(*[self.request(limiter, host) for host in ["a", "b"] * 5])
+
+        self.assertEqual(self.max_running["a"], 2)
+        self.assertEqual(self.max_running["b"], 2)
+        self.assertEqual(limiter.stats.acquired, 10)
+        self.assertGreater(limiter.stats.wait_sec_max, 0)
+
+    async def test_global_limit(self) -> None:
+        """No more requests run in total than allowed"""
+        limiter = RequestLimiter(max_in_flight=3)
+        await asyncio.gather(*[self.request(limiter, str(host)) for host in range(9)])
+
+        self.assertEqual(self.max_running["total"], 3)
+        self.assertEqual(limiter.stats.in_flight, 0)
+        self.assertEqual(limiter.stats.waiting, 0)
+
+    async def test_per_host_rate(self) -> None:
+        """Requests to one host are spread according to the rate"""
+        limiter = RequestLimiter(per_host_rate=50, per_host_burst=1)
+        start = time.monotonic()
+        for _ in range(4):
+            async with limiter.slot("a"):
+                pass
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    async def test_idle_hosts_are_forgotten(self) -> None:
+        """The limits of a host are dropped once nobody uses them"""
+        limiter = RequestLimiter(max_per_host=1)
+        await self.request(limiter, "a")
+
+        self.assertEqual(limiter._hosts, {})  # pylint: disable=protected-access
@@ -0,0 +1,97 @@
+"""Tests for the `log_pipeline` module"""
+import io
+import json
+import unittest
+from unittest import mock
+
+import structlog
+
+from monmon.instrumentation.log_pipeline import (
+    LogWriter,
+    RepeatLimiter,
+    configure_logging,
+)
+
+
+class TestLogWriter(unittest.TestCase):
+    """Test cases for writing log lines in the background"""
+
+    def test_write(self) -> None:
+        """Queued lines are written in order, the rest are written on close"""
+        stream = io.BytesIO()
+        writer = LogWriter(stream, batch_size=3)
+        writer.start()
+        for index in range(10):
+            writer.put(str(index).encode())
+        writer.close()
+        self.assertEqual(
+            stream.getvalue().split(), [str(i).encode() for i in range(10)]
+        )
+        self.assertEqual((writer.written, writer.dropped), (10, 0))
+
+    def test_full_queue(self) -> None:
+        """Lines that don't fit into the queue are dropped without waiting"""
+        stream = io.BytesIO()
+        writer = LogWriter(stream, queue_size=2)
+        for index in range(3):
+            writer.put(str(index).encode())
+        writer.start()
+        writer.close()
+        self.assertEqual(stream.getvalue(), b"0\n1\n")
+        self.assertEqual((writer.written, writer.dropped), (2, 1))
+
+    def test_put_after_close(self) -> None:
+        """Lines logged after the writer is closed are written by the caller"""
+        stream = io.BytesIO()
+        writer = LogWriter(stream)
+        writer.start()
+        writer.put(b"0")
+        writer.close()
+        writer.put(b"1")
+        self.assertEqual(stream.getvalue(), b"0\n1\n")
+        self.assertEqual(writer.written, 2)
+
+
+class TestRepeatLimiter(unittest.TestCase):
+    """Test cases for limiting repeated messages"""
+
+    def test_limit(self) -> None:
+        """Repeats of a site are dropped until the window ends"""
+        limiter = RepeatLimiter(2, 60)
+        with mock.patch("time.monotonic", return_value=0):
+            for _ in range(2):
+                limiter(None, "info", {"event": "down", "site_id": 1})
+            with self.assertRaises(structlog.DropEvent):
+                limiter(None, "info", {"event": "down", "site_id": 1})
+            limiter(None, "info", {"event": "down", "site_id": 2})
+            limiter(None, "error", {"event": "down", "site_id": 1})
+        with mock.patch("time.monotonic", return_value=60):
+            event = limiter(None, "info", {"event": "down", "site_id": 1})
+        self.assertEqual(event["suppressed"], 1)
+        self.assertEqual(limiter.suppressed, 1)
+
+
+class TestConfigureLogging(unittest.TestCase):
+    """Test cases for the whole pipeline"""
+
+    def tearDown(self) -> None:
+        structlog.reset_defaults()
+
+    def test_pipeline(self) -> None:
+        """Messages above the level are rendered as JSON lines"""
+        stream = io.BytesIO()
+        writer = configure_logging("info", stream=stream, repeat_limit=1)
+        logger = structlog.getLogger("main_logger")
+        logger.debug("got this response while monitoring the site", site_id=1)
+        for _ in range(2):
+            logger.info("the site is down", site_id=1, error=ValueError("x"))
+        writer.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["event"], "the site is down")
+        self.assertEqual(
+            (lines[0]["level"], lines[0]["error"]), ("info", "ValueError('x')")
+        )
+        self.assertIn("timestamp", lines[0])
+        self.assertEqual(writer.repeat_limiter.suppressed, 1)  # type: ignore[union-attr]
@@ -0,0 +1,52 @@
+"""Tests for the `loop_lag` and `event_loop` modules"""
+import asyncio
+import time
+import unittest
+
+from structlog.testing import capture_logs
+
+from monmon.instrumentation import event_loop
+from monmon.instrumentation.loop_lag import SlowCallbackDetector
+
+
+async def block(seconds: float) -> None:
+    """Hold the event loop"""
+    time.sleep(seconds)
+
+
+class TestSlowCallbackDetector(unittest.IsolatedAsyncioTestCase):
+    """Test cases for finding callbacks that block the event loop"""
+
+    async def test_slow_callback(self) -> None:
+        """A blocking task is logged with its coroutine and stack"""
+        detector = SlowCallbackDetector(0.05)
+        with capture_logs() as logs:
+            detector.start()
+            await asyncio.sleep(0.1)
+            await asyncio.create_task(block(0.3), name="blocker")
+            await asyncio.sleep(0.1)
+            detector.close()
+
+        self.assertEqual(detector.slow_callbacks, 1)
+        self.assertEqual(logs[0]["task"], "blocker")
+        self.assertEqual(logs[0]["coroutine"], "block")
+        self.assertTrue(logs[0]["stack"][-1].endswith(" block"))
+        self.assertGreaterEqual(logs[0]["blocked_ms"], 200)
+
+
+class TestEventLoop(unittest.TestCase):
+    """Test cases for creating the event loop"""
+
+    def test_policies(self) -> None:
+        """asyncio is always there, uvloop only when installed"""
+        loop = event_loop.new_event_loop("asyncio")
+        self.assertIsInstance(loop, asyncio.BaseEventLoop)
+        loop.close()
+        with self.assertRaises(ValueError):
+            event_loop.new_event_loop("trio")
+        if event_loop.uvloop is None:
+            with self.assertRaises(ValueError):
+                event_loop.new_event_loop("uvloop")
+            loop = event_loop.new_event_loop("auto")
+            self.assertIsInstance(loop, asyncio.BaseEventLoop)
+            loop.close()
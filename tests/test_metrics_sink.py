@@ -0,0 +1,153 @@
+"""Tests for the `metrics_sink` module"""
+import asyncio
+import tempfile
+import unittest
+from typing import List
+
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.metrics_sink import MetricsSink
+from monmon.db.pg.exceptions import QueryException
+from monmon.db.spool import MetricsSpool
+from tests.helpers import make_metrics
+
+
+class FakeDbConnector:
+    """Records every batch instead of writing it to a database"""
+
+    def __init__(self, fail: bool = False, delay_sec: float = 0) -> None:
+        self.batches: List[List[Metrics]] = []
+        self.fail = fail
+        self.delay_sec = delay_sec
+
+    async def save_metrics_batch(self, batch: List[Metrics]) -> None:
+        """Save the batch in memory"""
+        await asyncio.sleep(self.delay_sec)
+        if self.fail:
+            raise QueryException("database is down")
+        self.batches.append(batch)
+
+
+class TestMetricsSink(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the metrics sink"""
+
+    async def test_flush_by_size(self) -> None:
+        """A full batch is flushed without waiting for the interval"""
+        db_conn = FakeDbConnector()
+        sink = MetricsSink(db_conn, batch_size=3, flush_interval_sec=60)  # type: ignore[arg-type]
+        sink.start()
+        for site_id in range(3):
+            await sink.put(make_metrics(site_id))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(db_conn.batches), 1)
+        self.assertEqual([m.site_id for m in db_conn.batches[0]], [0, 1, 2])
+        self.assertEqual(sink.flushed_rows, 3)
+        await sink.close()
+
+    async def test_flush_by_size_while_waiting(self) -> None:
+        """A batch that fills up while the writer holds its first row is flushed at once"""
+        db_conn = FakeDbConnector()
+        sink = MetricsSink(db_conn, batch_size=3, flush_interval_sec=60)  # type: ignore[arg-type]
+        sink.start()
+        await sink.put(make_metrics(0))
+        await asyncio.sleep(0.01)
+        for site_id in (1, 2):
+            await sink.put(make_metrics(site_id))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(len(db_conn.batches), 1)
+        self.assertEqual([m.site_id for m in db_conn.batches[0]], [0, 1, 2])
+        await sink.close()
+
+    async def test_flush_by_interval(self) -> None:
+        """A partial batch is flushed once the interval passes"""
+        db_conn = FakeDbConnector()
+        sink = MetricsSink(db_conn, batch_size=100, flush_interval_sec=0.05)  # type: ignore[arg-type]
+        sink.start()
+        await sink.put(make_metrics(1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(db_conn.batches, [])
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(db_conn.batches), 1)
+        await sink.close()
+
+    async def test_drop_when_full(self) -> None:
+        """Rows are dropped when the queue stays full"""
+        db_conn = FakeDbConnector()
+        sink = MetricsSink(db_conn, queue_size=2, put_timeout_sec=0.01)  # type: ignore[arg-type]
+        for site_id in range(3):
+            await sink.put(make_metrics(site_id))
+
+        self.assertEqual(sink.dropped_rows, 1)
+        await sink.close()
+        self.assertEqual(sink.flushed_rows, 2)
+
+    async def test_close_flushes_queue(self) -> None:
+        """Closing the sink writes everything that is queued and rejects new rows"""
+        db_conn = FakeDbConnector()
+        sink = MetricsSink(db_conn, batch_size=2, flush_interval_sec=60)  # type: ignore[arg-type]
+        sink.start()
+        await sink.put(make_metrics(1))
+        await sink.close()
+        await sink.put(make_metrics(2))
+
+        self.assertEqual(sink.flushed_rows, 1)
+        self.assertEqual(sink.dropped_rows, 1)
+
+    async def test_shutdown_spares_write_in_flight(self) -> None:
+        """Cancelling every task except the ones of the sink keeps the batch being written"""
+        db_conn = FakeDbConnector(delay_sec=0.05)
+        sink = MetricsSink(db_conn, batch_size=1)  # type: ignore[arg-type]
+        sink.start()
+        await sink.put(make_metrics(1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(sink.tasks), 2)
+
+        spared = {asyncio.current_task(), *sink.tasks}
+        for task in asyncio.all_tasks() - spared:
+            task.cancel()
+        await sink.close()
+
+        self.assertEqual(sink.flushed_rows, 1)
+        self.assertEqual(len(db_conn.batches), 1)
+
+    async def test_failed_write(self) -> None:
+        """Rows of a failed write are counted"""
+        sink = MetricsSink(FakeDbConnector(fail=True))  # type: ignore[arg-type]
+        await sink.put(make_metrics(1))
+        await sink.close()
+
+        self.assertEqual(sink.failed_rows, 1)
+        self.assertEqual(sink.flushed_rows, 0)
+
+    async def test_spool_during_outage(self) -> None:
+        """Rows of failed writes are spooled and replayed once the database is back"""
+        with tempfile.TemporaryDirectory() as directory:
+            spool = MetricsSpool(directory, fsync=False)
+            spool.open()
+            db_conn = FakeDbConnector(fail=True)
+            sink = MetricsSink(
+                db_conn,  # type: ignore[arg-type]
+                batch_size=2,
+                flush_interval_sec=0.01,
+                spool=spool,
+                replay_interval_sec=0.02,
+            )
+            sink.start()
+            for site_id in range(4):
+                await sink.put(make_metrics(site_id))
+            await asyncio.sleep(0.05)
+            self.assertEqual(spool.depth_rows, 4)
+            self.assertEqual(sink.failed_rows, 0)
+
+            db_conn.fail = False
+            await asyncio.sleep(0.1)
+            await sink.close()
+
+            self.assertEqual(spool.depth_rows, 0)
+            self.assertEqual(spool.replayed_rows, 4)
+            self.assertEqual(
+                sorted(m.site_id for batch in db_conn.batches for m in batch),
+                [0, 1, 2, 3],
+            )
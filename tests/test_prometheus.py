@@ -0,0 +1,59 @@
+"""Tests for the `prometheus` module"""
+import unittest
+
+from monmon.instrumentation.prometheus import Registry
+
+
+class TestRegistry(unittest.TestCase):
+    """Test cases for the Prometheus text format"""
+
+    def test_expose(self) -> None:
+        """Every kind of metric is rendered in the text format"""
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests", ("outcome",))
+        in_flight = registry.gauge("in_flight", "Requests in flight")
+        latency = registry.histogram(
+            "latency_seconds", "Latency", ("phase",), buckets=(0.1, 1.0)
+        )
+        registry.collected("queue_size", "Queue size", lambda: [((), 7)])
+
+        requests.inc(("2xx",))
+        requests.inc(("2xx",))
+        requests.inc(('say "hi"\n',))
+        in_flight.inc()
+        in_flight.inc()
+        in_flight.dec()
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value, ("ttfb",))
+
+        self.assertEqual(
+            registry.expose(),
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{outcome="2xx"} 2\n'
+            'requests_total{outcome="say \\"hi\\"\\n"} 1\n'
+            "# HELP in_flight Requests in flight\n"
+            "# TYPE in_flight gauge\n"
+            "in_flight 1\n"
+            "# HELP latency_seconds Latency\n"
+            "# TYPE latency_seconds histogram\n"
+            'latency_seconds_bucket{phase="ttfb",le="0.1"} 2\n'
+            'latency_seconds_bucket{phase="ttfb",le="1"} 3\n'
+            'latency_seconds_bucket{phase="ttfb",le="+Inf"} 4\n'
+            'latency_seconds_sum{phase="ttfb"} 3.65\n'
+            'latency_seconds_count{phase="ttfb"} 4\n'
+            "# HELP queue_size Queue size\n"
+            "# TYPE queue_size gauge\n"
+            "queue_size 7\n",
+        )
+
+    def test_quantile(self) -> None:
+        """Quantiles are estimated by the upper bounds of buckets"""
+        latency = Registry().histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        self.assertIsNone(latency.quantile(0.5))
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value)
+
+        self.assertEqual(latency.quantile(0.5), 0.1)
+        self.assertEqual(latency.quantile(0.75), 1.0)
+        self.assertIsNone(latency.quantile(0.99))
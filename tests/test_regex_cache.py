@@ -0,0 +1,65 @@
+"""Tests for the `regex_cache` module"""
+import unittest
+
+from monmon.matcher.regex_cache import InvalidRegexp, RegexCache
+
+
+class TestRegexCache(unittest.TestCase):
+    """Test cases for the regexp cache"""
+
+    def test_shared_patterns(self) -> None:
+        """Sites with the same regexp share one compiled object"""
+        cache = RegexCache()
+        first = cache.get("find me")
+        second = cache.get("find me")
+
+        self.assertIs(first, second)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_bounded(self) -> None:
+        """The least recently used regexp is evicted"""
+        cache = RegexCache(max_size=2)
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        cache.get("c")
+
+        self.assertEqual(len(cache), 2)
+        cache.get("a")
+        self.assertEqual(cache.misses, 3)
+
+    def test_invalid(self) -> None:
+        """A regexp that can't be compiled raises `InvalidRegexp`"""
+        for engine in ["re", "regex", "re2"]:
+            try:
+                cache = RegexCache(engine=engine)
+            except ValueError:
+                continue
+            with self.assertRaises(InvalidRegexp):
+                cache.get("[a-z")
+
+    def test_engines(self) -> None:
+        """Every engine finds the same matches"""
+        for engine in ["re", "regex", "re2"]:
+            try:
+                cache = RegexCache(engine=engine)
+            except ValueError:
+                continue
+            self.assertEqual(cache.get("f(in)d").findall("find me, find"), ["in"] * 2)
+            self.assertEqual(
+                [m.group(0) for m in cache.get("fi").finditer("find find")], ["fi"] * 2
+            )
+
+    def test_nested_repeats(self) -> None:
+        """The `re` engine rejects regexps that may backtrack catastrophically"""
+        cache = RegexCache(engine="re")
+        for pattern in ["(a+)+$", r"(\w+\s?)*", "(?=(a+)+)"]:
+            with self.assertRaises(InvalidRegexp):
+                cache.get(pattern)
+        for pattern in ["a+b+", "(ab)+", "(?:a{2}){3}", "(a|b)*c"]:
+            cache.get(pattern)
+
+    def test_auto_engine(self) -> None:
+        """The `auto` engine is resolved to an installed one"""
+        self.assertIn(RegexCache().engine, ["re", "regex", "re2"])
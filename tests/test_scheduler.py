@@ -0,0 +1,132 @@
+"""Tests for the `scheduler` module"""
+import asyncio
+import unittest
+from collections import Counter
+
+from monmon.watchdog.scheduler import Scheduler
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the scheduler"""
+
+    async def asyncSetUp(self) -> None:
+        self.checks: Counter = Counter()
+        self.running = 0
+        self.max_running = 0
+
+    async def job(self, site_id: int) -> None:
+        """Record the check and pretend that it takes some time"""
+        self.checks[site_id] += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+
+    async def test_periodic_checks(self) -> None:
+        """Every site is checked again and again"""
+        scheduler = Scheduler(self.job, workers=4, jitter=0)
+        scheduler.start()
+        for site_id in range(3):
+            scheduler.add(site_id, 0.05)
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+
+        for site_id in range(3):
+            self.assertGreaterEqual(self.checks[site_id], 3)
+
+    async def test_bounded_workers(self) -> None:
+        """No more checks run at the same time than there are workers"""
+        scheduler = Scheduler(self.job, workers=2, jitter=0)
+        scheduler.start()
+        for site_id in range(10):
+            scheduler.add(site_id, 0.01)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+
+        self.assertEqual(self.max_running, 2)
+
+    async def test_remove(self) -> None:
+        """A removed site is not checked anymore"""
+        scheduler = Scheduler(self.job, workers=2, jitter=0)
+        scheduler.start()
+        scheduler.add(1, 0.02)
+        scheduler.add(2, 0.02)
+        await asyncio.sleep(0.1)
+        scheduler.remove(1)
+        checks = self.checks[1]
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+        self.assertNotIn(1, scheduler)
+        self.assertLessEqual(self.checks[1], checks + 1)
+        self.assertGreater(self.checks[2], checks)
+
+    async def test_reschedule(self) -> None:
+        """A rescheduled site is checked with the new interval"""
+        scheduler = Scheduler(self.job, workers=2, jitter=0)
+        scheduler.start()
+        scheduler.add(1, 10)
+        scheduler.reschedule(1, 0.02, delay_sec=0)
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+
+        self.assertGreaterEqual(self.checks[1], 3)
+
+    async def test_added_again_while_running(self) -> None:
+        """A site added again while its check runs waits for that check, which doesn't
+        re-arm it a second time"""
+        gates = [asyncio.Event(), asyncio.Event()]
+
+        async def blocking_job(site_id: int) -> None:
+            call = self.checks[site_id]
+            self.checks[site_id] += 1
+            if call < len(gates):
+                await gates[call].wait()
+
+        scheduler = Scheduler(blocking_job, workers=4, jitter=0)
+        scheduler.start()
+        scheduler.add(1, 0.02)
+        await asyncio.sleep(0.05)
+        scheduler.remove(1)
+        scheduler.add(1, 0.02)
+        await asyncio.sleep(0.05)
+        # The new generation doesn't start while the old check runs.
+        self.assertEqual(self.checks[1], 1)
+        gates[0].set()
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.checks[1], 2)
+        gates[1].set()
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+
+        self.assertGreaterEqual(self.checks[1], 3)
+
+    async def test_failing_job(self) -> None:
+        """A failed check doesn't stop the next ones"""
+
+        async def failing_job(site_id: int) -> None:
+            self.checks[site_id] += 1
+            raise RuntimeError("boom")
+
+        scheduler = Scheduler(failing_job, workers=1, jitter=0)
+        scheduler.start()
+        scheduler.add(1, 0.02)
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+
+        self.assertGreaterEqual(self.checks[1], 3)
+
+    async def test_delay_from_job(self) -> None:
+        """The delay returned by a check replaces the interval for the next one"""
+
+        async def backing_off_job(site_id: int) -> float:
+            self.checks[site_id] += 1
+            return 10
+
+        scheduler = Scheduler(backing_off_job, workers=1, jitter=0)
+        scheduler.start()
+        scheduler.add(1, 0.02)
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+
+        self.assertEqual(self.checks[1], 1)
@@ -0,0 +1,310 @@
+"""Tests for the `server` module"""
+# pylint: disable=duplicate-code
+import configparser
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.db_connector import DbConnector
+from monmon.db.maintenance import MetricsMaintenance
+from monmon.instrumentation.prometheus import REGISTRY
+from monmon.requester.client import HttpClient
+from monmon.watchdog.watcher import Watcher
+from monmon.web_server.server import WebServer
+
+
+class TestWebServer(unittest.IsolatedAsyncioTestCase):
+    """Test cases for web server handlers"""
+
+    async def asyncSetUp(self) -> None:
+        cfg = configparser.ConfigParser()
+        cfg.read("src/monmon/config.ini")
+        db_dsn = cfg["database"].get("test_pg_dsn")
+        migrations_dir = "src/monmon/db/migrations"
+        self.db_conn = DbConnector(db_dsn, migrations_dir)
+        await self.db_conn.apply_migrations()
+        self.http_client = HttpClient(timeout_sec=7)
+        self.watcher = Watcher(self.http_client, None)
+        server = WebServer("localhost", 0, self.watcher, self.db_conn, REGISTRY)
+        self.client = TestClient(TestServer(server.make_app()))
+        await self.client.start_server()
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.http_client.close_session()
+        await self.db_conn.rollback_migrations()
+
+    async def test_get_metrics(self):
+        """Testing streaming metrics of a site as NDJSON"""
+        saved_wl = await self.db_conn.save_to_watch_list(
+            [
+                {
+                    "url": "https://example.com/users/1",
+                    "check_interval_sec": 5,
+                    "regexp": "[a-z][A-Z]",
+                }
+            ]
+        )
+        site_id, *_ = next(saved_wl)
+        start = datetime(2023, 5, 1, tzinfo=timezone.utc)
+        for minute in range(3):
+            await self.db_conn.save_metrics(
+                Metrics(
+                    site_id,
+                    200,
+                    Metrics.timestamp_ns_of(start + timedelta(minutes=minute)),
+                    minute,
+                    "found",
+                )
+            )
+
+        resp = await self.client.get(
+            f"/sites/{site_id}/metrics", params={"from": "2023-05-01T00:01:00"}
+        )
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.content_type, "application/x-ndjson")
+        lines = [json.loads(line) for line in (await resp.text()).splitlines()]
+        self.assertEqual([line["response_time"] for line in lines], [1, 2])
+        self.assertEqual(lines[0]["content"], "found")
+
+        resp = await self.client.get(
+            f"/sites/{site_id}/metrics",
+            params={"after": lines[0]["timestamp"], "limit": "5"},
+        )
+        lines = [json.loads(line) for line in (await resp.text()).splitlines()]
+        self.assertEqual([line["response_time"] for line in lines], [2])
+
+        resp = await self.client.get(f"/sites/{site_id}/metrics?from=yesterday")
+        self.assertEqual(resp.status, 400)
+
+    async def test_get_rollups(self):
+        """Testing aggregates of a site per minute and hour"""
+        saved_wl = await self.db_conn.save_to_watch_list(
+            [
+                {
+                    "url": "https://example.com/users/1",
+                    "check_interval_sec": 5,
+                    "regexp": "[a-z][A-Z]",
+                }
+            ]
+        )
+        site_id, *_ = next(saved_wl)
+        bucket = datetime.now(timezone.utc).replace(
+            second=0, microsecond=0
+        ) - timedelta(minutes=1)
+        for second, status_code in [(1, 200), (2, 503)]:
+            await self.db_conn.save_metrics(
+                Metrics(
+                    site_id,
+                    status_code,
+                    Metrics.timestamp_ns_of(bucket.replace(second=second)),
+                    100,
+                    "",
+                )
+            )
+        await MetricsMaintenance(self.db_conn).rollup("minute")
+
+        resp = await self.client.get(
+            f"/sites/{site_id}/rollups",
+            params={"resolution": "minute", "from": bucket.isoformat()},
+        )
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(
+            await resp.json(),
+            [
+                {
+                    "bucket": bucket.isoformat(),
+                    "checks": 2,
+                    "up_checks": 1,
+                    "uptime": 0.5,
+                    "response_time_avg": 100,
+                    "response_time_p50": 100,
+                    "response_time_p95": 100,
+                    "response_time_p99": 100,
+                    "status_counts": {"200": 1, "503": 1},
+                }
+            ],
+        )
+        resp = await self.client.get(f"/sites/{site_id}/rollups")
+        self.assertEqual(await resp.json(), [])
+
+        resp = await self.client.get(f"/sites/{site_id}/rollups?resolution=day")
+        self.assertEqual(resp.status, 400)
+
+    async def test_stats(self):
+        """Testing health of sites served from memory"""
+        await self.watcher.add_to_monitoring(
+            iter(
+                [
+                    (1, "https://example.com", "abc", 300, None),
+                    (2, "https://x.dev", "x", 300, None),
+                ]
+            )
+        )
+        await self.watcher.scheduler.stop()
+        for site_id, status_code in [(1, 200), (1, 500), (2, 200), (2, 200)]:
+            self.watcher.sites[site_id].stats.record(
+                Metrics(site_id, status_code, 0, 20_000_000, "abc")
+            )
+
+        resp = await self.client.get("/sites/1/stats")
+        self.assertEqual(resp.status, 200)
+        stats = await resp.json()
+        self.assertEqual(stats["site_id"], 1)
+        self.assertEqual(stats["uptime"], 50.0)
+        self.assertEqual(stats["status_codes"]["5xx"], 1)
+
+        resp = await self.client.get("/stats")
+        stats = await resp.json()
+        self.assertEqual(stats["sites"], 2)
+        self.assertEqual(stats["checks"], 4)
+        self.assertEqual(stats["uptime"], 75.0)
+
+        self.watcher.remove_from_monitoring([1])
+        resp = await self.client.get("/sites/1/stats")
+        self.assertEqual(resp.status, 404)
+        stats = await (await self.client.get("/stats")).json()
+        self.assertEqual(stats["uptime"], 100.0)
+
+    async def test_add_to_monitoring(self):
+        """Testing validation of a watch list with an error per invalid field"""
+        site = {
+            "url": "https://example.com",
+            "regexp": "abc",
+            "check_interval_sec": 300,
+        }
+        resp = await self.client.post("/", json=[site])
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(len(self.watcher.sites), 1)
+
+        resp = await self.client.post(
+            "/", json=[site, {**site, "url": "example", "check_interval_sec": 1}]
+        )
+        self.assertEqual(resp.status, 400)
+        errors = (await resp.json())["errors"]
+        self.assertEqual(
+            [(error["index"], error["field"]) for error in errors],
+            [(1, "url"), (1, "check_interval_sec")],
+        )
+
+        for body in (b"[{", b"{}", b"42", b""):
+            resp = await self.client.post(
+                "/", data=body, headers={"Content-Type": "application/json"}
+            )
+            self.assertEqual(resp.status, 400)
+            errors = (await resp.json())["errors"]
+            self.assertEqual(errors[0]["index"], None)
+
+        resp = await self.client.post("/", data=b"[" + b" " * 2 * 1024 * 1024 + b"]")
+        self.assertEqual(resp.status, 413)
+        self.assertEqual(len(self.watcher.sites), 1)
+
+    async def test_update_and_delete_site(self):
+        """Testing changes of a site applied to the monitoring without a restart"""
+        saved_wl = await self.db_conn.save_to_watch_list(
+            [{"url": "https://example.com/a", "check_interval_sec": 300, "regexp": "a"}]
+        )
+        await self.watcher.add_to_monitoring(saved_wl)
+        await self.watcher.scheduler.stop()
+        site_id = next(iter(self.watcher.sites))
+
+        resp = await self.client.put(
+            f"/sites/{site_id}",
+            json={
+                "url": "https://example.com/b",
+                "check_interval_sec": 60,
+                "regexp": "b",
+            },
+        )
+        self.assertEqual(resp.status, 200)
+        site = self.watcher.sites[site_id]
+        self.assertEqual(
+            (site.url, site.matcher.pattern), ("https://example.com/b", "b")
+        )
+        self.assertEqual(self.watcher.scheduler.interval(site_id), 60)
+        resp = await self.client.put(
+            f"/sites/{site_id}",
+            json={
+                "url": "https://example.com/b",
+                "check_interval_sec": 1,
+                "regexp": "b",
+            },
+        )
+        self.assertEqual(resp.status, 400)
+
+        resp = await self.client.delete(f"/sites/{site_id}")
+        self.assertEqual(resp.status, 200)
+        self.assertNotIn(site_id, self.watcher.sites)
+        self.assertEqual(list(await self.db_conn.get_watch_list()), [])
+        resp = await self.client.delete(f"/sites/{site_id}")
+        self.assertEqual(resp.status, 404)
+        resp = await self.client.put(
+            f"/sites/{site_id}",
+            json={
+                "url": "https://example.com/c",
+                "check_interval_sec": 60,
+                "regexp": "c",
+            },
+        )
+        self.assertEqual(resp.status, 404)
+
+    async def test_bulk_import(self):
+        """Testing an import that reports rejected lines and skips known URLs"""
+        lines = [
+            json.dumps(
+                {
+                    "url": f"https://example.com/{i}",
+                    "regexp": "it's",
+                    "check_interval_sec": 300,
+                }
+            )
+            for i in range(5)
+        ]
+        lines[1] = lines[0]
+        lines[3] = '{"url": "not a url", "regexp": "a", "check_interval_sec": 300}'
+        lines.insert(4, "{")
+        lines.insert(5, "x" * 200_000)
+        resp = await self.client.post(
+            "/bulk",
+            data="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        self.assertEqual(resp.status, 200)
+        report = await resp.json()
+        self.assertEqual(report["imported"], 3)
+        self.assertEqual(report["duplicates"], 1)
+        self.assertEqual([error["line"] for error in report["errors"]], [4, 5, 6])
+        self.assertEqual(len(self.watcher.sites), 3)
+
+        csv_lines = "check_interval_sec,url,regexp\n300,https://example.com/0,x\n"
+        csv_lines += '60,https://example.com/new,"a,b"\nfive,https://x.dev,a\n'
+        resp = await self.client.post(
+            "/bulk", data=csv_lines, headers={"Content-Type": "text/csv"}
+        )
+        report = await resp.json()
+        self.assertEqual(report["imported"], 1)
+        self.assertEqual(report["duplicates"], 1)
+        self.assertEqual(report["errors"][0]["line"], 4)
+        await self.watcher.scheduler.stop()
+
+        resp = await self.client.post(
+            "/bulk", data="{}", headers={"Content-Type": "text/plain"}
+        )
+        self.assertEqual(resp.status, 415)
+
+    async def test_internal_metrics(self):
+        """Testing internal metrics exposed for Prometheus"""
+        await self.client.get("/stats")
+        resp = await self.client.get("/metrics")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(resp.content_type, "text/plain")
+        text = await resp.text()
+        self.assertIn("# TYPE monmon_web_request_seconds histogram", text)
+        self.assertIn(
+            'monmon_web_request_seconds_count{method="GET",route="/stats",status="200"}',
+            text,
+        )
+        self.assertIn("# TYPE monmon_db_query_seconds histogram", text)
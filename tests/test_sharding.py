@@ -0,0 +1,112 @@
+"""Tests for the `sharding` module"""
+# pylint: disable=duplicate-code
+import configparser
+import unittest
+from collections import Counter
+from typing import Callable, Dict, Iterable
+
+from monmon.db.db_connector import DbConnector
+from monmon.watchdog.sharding import HashRing, ShardCoordinator
+from monmon.watchdog.sync import WatchListSync
+
+
+class TestHashRing(unittest.TestCase):
+    """Test cases for consistent hashing"""
+
+    def test_balance(self) -> None:
+        """Every worker gets a fair share of sites"""
+        ring = HashRing(["a", "b", "c", "d"])
+        shares = Counter(ring.owner(site_id) for site_id in range(10000))
+        self.assertEqual(set(shares), {"a", "b", "c", "d"})
+        for share in shares.values():
+            self.assertGreater(share, 1500)
+            self.assertLess(share, 3500)
+
+    def test_join(self) -> None:
+        """Only sites of the new worker move when it joins"""
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b", "c", "d"])
+        moved = [
+            site_id
+            for site_id in range(10000)
+            if before.owner(site_id) != after.owner(site_id)
+        ]
+        self.assertLess(len(moved), 3500)
+        self.assertEqual({after.owner(site_id) for site_id in moved}, {"d"})
+
+    def test_empty(self) -> None:
+        """Nobody owns sites when there are no workers"""
+        self.assertIsNone(HashRing([]).owner(1))
+
+
+class FakeWatcher:
+    """Keeps the sites it was asked to monitor"""
+
+    def __init__(self) -> None:
+        self.sites: Dict[int, str] = {}
+        self.owns: Callable[[int], bool] = lambda _site_id: True
+
+    async def add_to_monitoring(self, watch_list: Iterable[tuple]) -> None:
+        """Remember the sites"""
+        for site_id, url, *_ in watch_list:
+            if self.owns(site_id):
+                self.sites[site_id] = url
+
+    def remove_from_monitoring(self, site_ids: Iterable[int]) -> None:
+        """Forget the sites"""
+        for site_id in site_ids:
+            self.sites.pop(site_id, None)
+
+
+class TestShardCoordinator(unittest.IsolatedAsyncioTestCase):
+    """Test cases for workers sharing a watch list"""
+
+    async def asyncSetUp(self) -> None:
+        cfg = configparser.ConfigParser()
+        cfg.read("src/monmon/config.ini")
+        db_dsn = cfg["database"].get("test_pg_dsn")
+        migrations_dir = "src/monmon/db/migrations"
+        self.db_conn = DbConnector(db_dsn, migrations_dir)
+        await self.db_conn.apply_migrations()
+
+    async def asyncTearDown(self) -> None:
+        await self.db_conn.rollback_migrations()
+
+    async def test_rebalance(self):
+        """Workers split sites without overlaps and take over sites of a gone worker"""
+        await self.db_conn.save_to_watch_list(
+            [
+                {
+                    "url": f"https://example.com/{i}",
+                    "regexp": "abc",
+                    "check_interval_sec": 30,
+                }
+                for i in range(100)
+            ]
+        )
+        first, second = FakeWatcher(), FakeWatcher()
+        first_sync = WatchListSync(self.db_conn, first, listen=False)
+        second_sync = WatchListSync(self.db_conn, second, listen=False)
+        first_coordinator = ShardCoordinator(
+            self.db_conn, first_sync, "first", heartbeat_sec=60
+        )
+        second_coordinator = ShardCoordinator(
+            self.db_conn, second_sync, "second", heartbeat_sec=60
+        )
+        await first_coordinator.start()
+        await first_sync.full_sync()
+        self.assertEqual(len(first.sites), 100)
+        self.assertTrue(first_coordinator.is_leader())
+
+        await second_coordinator.start()
+        await second_sync.full_sync()
+        await first_coordinator.heartbeat()
+        self.assertFalse(set(first.sites) & set(second.sites))
+        self.assertEqual(len(first.sites) + len(second.sites), 100)
+        self.assertGreater(len(second.sites), 0)
+        self.assertFalse(second_coordinator.is_leader())
+
+        await second_coordinator.close()
+        await first_coordinator.heartbeat()
+        self.assertEqual(len(first.sites), 100)
+        await first_coordinator.close()
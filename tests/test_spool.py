@@ -0,0 +1,95 @@
+"""Tests for the `spool` module"""
+import os
+import tempfile
+import unittest
+
+from monmon.custom_types.watch_list import Metrics
+from monmon.db.spool import MetricsSpool, decode, encode, FRAME
+from tests.helpers import make_metrics
+
+
+def site_ids(batch) -> list:
+    """Ids of the sites of a batch"""
+    return [metrics.site_id for metrics in batch]
+
+
+class TestMetricsSpool(unittest.TestCase):
+    """Test cases for the on-disk spool of metrics"""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def open_spool(self, **options) -> MetricsSpool:
+        """A spool in the temporary directory"""
+        spool = MetricsSpool(self.directory, fsync=False, **options)
+        spool.open()
+        return spool
+
+    def segments(self) -> list:
+        """Segment files in the spool directory"""
+        return sorted(name for name in os.listdir(self.directory) if ".seg" in name)
+
+    def test_encode(self) -> None:
+        """Every field survives a round trip"""
+        metrics = Metrics(
+            1, 503, 123, 456, None, ttfb=7, body_time=0, content_unchanged=True
+        )
+        record = encode(metrics)
+        decoded = decode(record[FRAME.size :])
+        self.assertEqual(decoded.row(), metrics.row())
+        self.assertEqual(
+            decode(encode(make_metrics(2, content="ü"))[FRAME.size :]).content, "ü"
+        )
+
+    def test_replay(self) -> None:
+        """Rows are read back in order across segments, replayed segments are deleted"""
+        spool = self.open_spool(segment_bytes=200)
+        for site_id in range(0, 9, 3):
+            spool.append([make_metrics(site_id + i) for i in range(3)])
+        self.assertEqual(spool.depth_rows, 9)
+        self.assertEqual(len(self.segments()), 3)
+
+        batch, cursor = spool.read(4)
+        self.assertEqual(site_ids(batch), [0, 1, 2, 3])
+        spool.commit(cursor, len(batch))
+        self.assertEqual(len(self.segments()), 2)
+        batch, cursor = spool.read(10)
+        self.assertEqual(site_ids(batch), [4, 5, 6, 7, 8])
+        spool.commit(cursor, len(batch))
+
+        self.assertEqual((spool.depth_rows, spool.depth_bytes), (0, 0))
+        self.assertEqual(self.segments(), [])
+        spool.append([make_metrics(9)])
+        self.assertEqual(site_ids(spool.read(10)[0]), [9])
+        spool.close()
+
+    def test_recovery(self) -> None:
+        """A reopened spool continues after the cursor and cuts a torn record off"""
+        spool = self.open_spool()
+        spool.append([make_metrics(site_id) for site_id in range(5)])
+        batch, cursor = spool.read(2)
+        spool.commit(cursor, len(batch))
+        spool.close()
+        path = os.path.join(self.directory, self.segments()[0])
+        size = os.path.getsize(path)
+        with open(path, "ab") as file:
+            file.write(encode(make_metrics(5))[:-3])
+
+        spool = self.open_spool()
+        self.assertEqual(spool.depth_rows, 3)
+        self.assertEqual(os.path.getsize(path), size)
+        spool.append([make_metrics(6)])
+        self.assertEqual(site_ids(spool.read(10)[0]), [2, 3, 4, 6])
+        spool.close()
+
+    def test_size_limit(self) -> None:
+        """Rows that don't fit into the spool are dropped"""
+        record = len(encode(make_metrics(0)))
+        spool = self.open_spool(max_bytes=record * 3)
+        self.assertEqual(spool.append([make_metrics(i) for i in range(2)]), 2)
+        self.assertEqual(spool.append([make_metrics(i) for i in range(2, 4)]), 1)
+        self.assertEqual((spool.spooled_rows, spool.dropped_rows), (3, 1))
+        self.assertEqual(site_ids(spool.read(10)[0]), [0, 1, 2])
+        spool.close()
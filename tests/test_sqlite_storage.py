@@ -0,0 +1,96 @@
+"""Tests for the `sqlite_storage` module"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from monmon.db.sqlite.sqlite_storage import SqliteStorage
+from tests.helpers import START, make_metrics
+
+
+class TestSqliteStorage(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the embedded metrics backend"""
+
+    async def asyncSetUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "metrics.sqlite3")
+        self.storage = SqliteStorage(self.path)
+
+    async def asyncTearDown(self) -> None:
+        await self.storage.close()
+
+    async def read(self, site_id: int, **options) -> list:
+        """All metrics of a stream"""
+        return [
+            metrics
+            async for batch in self.storage.stream_metrics(site_id, **options)
+            for metrics in batch
+        ]
+
+    async def test_stream_metrics(self) -> None:
+        """Metrics are read by site and time range in keyset pages"""
+        await self.storage.save_metrics_batch(
+            [
+                make_metrics(site_id, minute * 60, ttfb=5)
+                for minute in range(5)
+                for site_id in (1, 2)
+            ]
+        )
+        # A replayed batch is saved once.
+        await self.storage.save_metrics_batch([make_metrics(1)])
+
+        rows = await self.read(1, batch_size=2)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["timestamp"], START.isoformat())
+        self.assertEqual((rows[0]["ttfb"], rows[0]["dns_time"]), (5, None))
+        self.assertIs(rows[0]["content_unchanged"], False)
+
+        rows = await self.read(
+            1,
+            since=START + timedelta(minutes=1),
+            until=START + timedelta(minutes=4),
+            after=datetime.fromisoformat(rows[1]["timestamp"]),
+            limit=5,
+        )
+        self.assertEqual(
+            [row["timestamp"] for row in rows],
+            [(START + timedelta(minutes=minute)).isoformat() for minute in (2, 3)],
+        )
+        self.assertEqual(len(await self.read(1, limit=3, batch_size=2)), 3)
+
+    async def test_rollups(self) -> None:
+        """Buckets are aggregated the same way as the rollups of Postgres"""
+        await self.storage.save_metrics_batch(
+            [
+                make_metrics(1, 1, 200, 100),
+                make_metrics(1, 2, 200, 200),
+                make_metrics(1, 3, 503, 300),
+                make_metrics(1, 4, 200, 400),
+                make_metrics(1, 61, 200, 3),
+                make_metrics(2, 5, 200, 1),
+            ]
+        )
+        rollups = await self.storage.get_rollups(
+            1, "minute", START, START + timedelta(minutes=2)
+        )
+        self.assertEqual(
+            list(rollups or []),
+            [
+                (START, 4, 3, 0.75, 250, 200, 400, 400, {"200": 3, "503": 1}),
+                (START + timedelta(minutes=1), 1, 1, 1.0, 3, 3, 3, 3, {"200": 1}),
+            ],
+        )
+        rollups = await self.storage.get_rollups(
+            1, "hour", START, START + timedelta(hours=1)
+        )
+        self.assertEqual(
+            [rollup[:5] for rollup in rollups or []], [(START, 5, 4, 0.8, 201)]
+        )
+
+    async def test_reopen(self) -> None:
+        """Saved metrics outlive the storage"""
+        await self.storage.save_metrics_batch([make_metrics(1)])
+        await self.storage.close()
+        self.storage = SqliteStorage(self.path)
+        self.assertEqual(len(await self.read(1)), 1)
@@ -0,0 +1,74 @@
+"""Tests for the `stats` module"""
+import unittest
+
+from monmon.custom_types.watch_list import Metrics
+from monmon.watchdog.stats import Counters, SiteStats, counters_typecode
+
+
+def metrics(response_time_ms: float, status_code: int = 200, content: str = "ok"):
+    """Metrics of a check that took the given time"""
+    return Metrics(1, status_code, 0, int(response_time_ms * 1e6), content)
+
+
+class TestSiteStats(unittest.TestCase):
+    """Test cases for rolling statistics"""
+
+    def test_summary(self) -> None:
+        """Uptime, error rate, match rate and quantiles of a window"""
+        stats = SiteStats(window=10)
+        for response_time_ms in range(1, 9):
+            stats.record(metrics(response_time_ms * 10))
+        stats.record(metrics(50, status_code=503, content=""))
+        stats.record(None)
+
+        summary = stats.summary()
+        self.assertEqual(summary["checks"], 10)
+        self.assertEqual(summary["uptime"], 80.0)
+        self.assertEqual(summary["error_rate"], 10.0)
+        self.assertAlmostEqual(summary["match_rate"], 88.89)
+        self.assertEqual(summary["status_codes"]["2xx"], 8)
+        self.assertEqual(summary["status_codes"]["5xx"], 1)
+        # Quantiles are accurate to the 10% width of a histogram bucket.
+        self.assertLessEqual(abs(summary["latency_ms"]["p50"] - 50) / 50, 0.1)
+        self.assertLessEqual(abs(summary["latency_ms"]["p99"] - 80) / 80, 0.1)
+
+    def test_window(self) -> None:
+        """Old checks fall out of the window and out of the totals"""
+        totals = Counters()
+        stats = SiteStats(window=3, totals=totals)
+        other = SiteStats(window=3, totals=totals)
+        stats.record(None)
+        stats.record(metrics(1000, status_code=500))
+        for _ in range(3):
+            stats.record(metrics(10))
+        other.record(metrics(10))
+
+        self.assertEqual(stats.summary()["uptime"], 100.0)
+        self.assertEqual(stats.summary()["error_rate"], 0.0)
+        self.assertLessEqual(stats.summary()["latency_ms"]["p99"], 11)
+        self.assertEqual(totals.checks, 4)
+        self.assertEqual(totals.summary()["status_codes"]["2xx"], 4)
+
+        totals.subtract(other.counters)
+        self.assertEqual(totals.summary(), stats.summary())
+
+    def test_empty(self) -> None:
+        """An empty window has no rates and no quantiles"""
+        summary = SiteStats().summary()
+        self.assertIsNone(summary["uptime"])
+        self.assertIsNone(summary["latency_ms"]["p50"])
+
+    def test_compact_counters(self) -> None:
+        """Counters of a site are as small as its window allows"""
+        self.assertEqual(counters_typecode(255), "B")
+        self.assertEqual(counters_typecode(256), "H")
+        self.assertEqual(counters_typecode(70000), "I")
+
+        totals = Counters()
+        stats = SiteStats(window=300, totals=totals)
+        for _ in range(600):
+            stats.record(metrics(10))
+        self.assertEqual(stats.counters.histogram.typecode, "H")
+        self.assertEqual(stats.summary()["checks"], 300)
+        self.assertEqual(stats.summary()["status_codes"]["2xx"], 300)
+        self.assertEqual(totals.summary(), stats.summary())
@@ -0,0 +1,147 @@
+"""Tests for the `sync` module"""
+# pylint: disable=duplicate-code
+import asyncio
+import configparser
+import unittest
+
+from monmon.db.db_connector import DbConnector
+from monmon.requester.client import HttpClient
+from monmon.watchdog.sync import WatchListSync
+from monmon.watchdog.watcher import Watcher
+
+
+class TestWatchListSync(unittest.IsolatedAsyncioTestCase):
+    """Test cases for applying changes of the watch list to the running sites"""
+
+    async def asyncSetUp(self) -> None:
+        cfg = configparser.ConfigParser()
+        cfg.read("src/monmon/config.ini")
+        db_dsn = cfg["database"].get("test_pg_dsn")
+        migrations_dir = "src/monmon/db/migrations"
+        self.db_conn = DbConnector(db_dsn, migrations_dir)
+        await self.db_conn.apply_migrations()
+        self.http_client = HttpClient(timeout_sec=7)
+        self.watcher = Watcher(self.http_client, None)
+
+    async def asyncTearDown(self) -> None:
+        await self.watcher.scheduler.stop()
+        await self.http_client.close_session()
+        await self.db_conn.rollback_migrations()
+
+    async def save_sites(self, count: int) -> list:
+        """Save sites that are checked rarely"""
+        saved_wl = await self.db_conn.save_to_watch_list(
+            [
+                {
+                    "url": f"http://localhost:1/{i}",
+                    "regexp": "abc",
+                    "check_interval_sec": 300,
+                }
+                for i in range(count)
+            ]
+        )
+        return [site[0] for site in saved_wl or []]
+
+    async def test_watcher_diff(self):
+        """Unchanged sites aren't touched, changed ones are updated in place"""
+        await self.watcher.add_to_monitoring(
+            [(1, "http://localhost:1/", "a", 300, None)]
+        )
+        stats = self.watcher.sites[1].stats
+        await self.watcher.add_to_monitoring(
+            [(1, "http://localhost:1/", "a", 300, None)]
+        )
+        self.assertIs(self.watcher.sites[1].stats, stats)
+
+        await self.watcher.add_to_monitoring(
+            [(1, "http://localhost:1/", "a", 60, None)]
+        )
+        self.assertIs(self.watcher.sites[1].stats, stats)
+        self.assertEqual(self.watcher.scheduler.interval(1), 60)
+
+        await self.watcher.add_to_monitoring(
+            [(1, "http://localhost:1/", "b", 60, None)]
+        )
+        self.assertIsNot(self.watcher.sites[1].stats, stats)
+        self.assertEqual(self.watcher.sites[1].matcher.pattern, "b")
+        self.assertEqual(len(self.watcher.scheduler), 1)
+
+    async def test_full_sync(self):
+        """A full sync streams the list in batches and applies only the difference"""
+        site_ids = await self.save_sites(25)
+        sync = WatchListSync(self.db_conn, self.watcher, listen=False, batch_size=10)
+        await sync.full_sync()
+        self.assertEqual(set(self.watcher.sites), set(site_ids))
+
+        untouched = self.watcher.sites[site_ids[1]].stats
+        await self.db_conn.delete_site(site_ids[0])
+        await self.db_conn.update_site(
+            site_ids[2],
+            {"url": "http://localhost:1/new", "regexp": "abc", "check_interval_sec": 5},
+        )
+        await sync.full_sync()
+        self.assertNotIn(site_ids[0], self.watcher.sites)
+        self.assertEqual(self.watcher.sites[site_ids[2]].url, "http://localhost:1/new")
+        self.assertEqual(self.watcher.scheduler.interval(site_ids[2]), 5)
+        self.assertIs(self.watcher.sites[site_ids[1]].stats, untouched)
+
+        self.watcher.owns = lambda site_id: site_id != site_ids[1]
+        await sync.full_sync()
+        self.assertEqual(len(self.watcher.sites), 23)
+        self.assertEqual(sync.full_syncs, 3)
+
+    async def test_notifications(self):
+        """Changes made in a database are applied without waiting for a full sync"""
+        sync = WatchListSync(
+            self.db_conn, self.watcher, resync_sec=3600, debounce_sec=0.01
+        )
+        await sync.start()
+        try:
+            site_ids = await self.save_sites(3)
+            await self.wait_for(lambda: len(self.watcher.sites) == 3)
+
+            await self.db_conn.update_site(
+                site_ids[0],
+                {"url": "http://localhost:1/x", "regexp": "x", "check_interval_sec": 5},
+            )
+            await self.wait_for(
+                lambda: self.watcher.sites[site_ids[0]].matcher.pattern == "x"
+            )
+
+            await self.db_conn.delete_site(site_ids[1])
+            await self.wait_for(lambda: site_ids[1] not in self.watcher.sites)
+
+            # A big insert is announced as a range of ids.
+            await self.save_sites(600)
+            await self.wait_for(lambda: len(self.watcher.sites) == 602)
+            self.assertEqual(sync.full_syncs, 1)
+        finally:
+            await sync.close()
+
+    async def test_lost_listener(self):
+        """A listener whose connection is lost can still be closed"""
+        errors: list = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda _, context: errors.append(context)
+        )
+        sync = WatchListSync(self.db_conn, self.watcher, resync_sec=3600)
+        await sync.start()
+        try:
+            listener = sync._listener  # pylint: disable=protected-access
+            assert listener is not None
+            await self.db_conn.query(
+                "select pg_terminate_backend(%s);",
+                (listener.conn.get_backend_pid(),),
+            )
+            await self.wait_for(lambda: not listener.alive)
+        finally:
+            await sync.close()
+        self.assertEqual(errors, [])
+
+    async def wait_for(self, condition) -> None:
+        """Wait until a notification is applied"""
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("the change wasn't applied")
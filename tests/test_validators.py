@@ -1,7 +1,7 @@
 """Tests for schemas validations"""
 import unittest
 
-from monmon.schemas.watch_list import is_watch_list_valid
+from monmon.schemas.watch_list import is_watch_list_valid, parse_watch_list
 
 
 class TestValidators(unittest.IsolatedAsyncioTestCase):
@@ -68,8 +68,64 @@ class TestValidators(unittest.IsolatedAsyncioTestCase):
                     "check_interval_sec": 301,
                 }
             ],
+            [
+                {
+                    "url": "https://example.com/brrr.html",
+                    "regexp": "[a-z",
+                    "check_interval_sec": 30,
+                }
+            ],
+            [
+                {
+                    "url": "https://example.com/brrr.html",
+                    "regexp": "[a-z]" * 7,
+                    "check_interval_sec": 30,
+                }
+            ],
             [],
         ]
         for req in testcases:
             _, is_valid = await is_watch_list_valid(req)
             self.assertEqual(is_valid, False)
+
+    async def test_field_errors(self) -> None:
+        """Every invalid field is reported, valid sites are returned without extra fields"""
+        watch_list, errors = parse_watch_list(
+            [
+                {"url": "https://example.com", "regexp": "a", "check_interval_sec": 5},
+                {"url": "ftp://example.com", "check_interval_sec": "5"},
+                "https://example.com",
+            ]
+        )
+        self.assertEqual(watch_list, [])
+        self.assertEqual(
+            errors,
+            [
+                {"index": 1, "field": "url", "error": "invalid url"},
+                {"index": 1, "field": "regexp", "error": "regexp is required"},
+                {
+                    "index": 1,
+                    "field": "check_interval_sec",
+                    "error": "check_interval_sec must be an integer",
+                },
+                {"index": 2, "field": None, "error": "a site must be an object"},
+            ],
+        )
+
+        site = {"url": "https://example.com", "regexp": "a", "check_interval_sec": 5}
+        watch_list, errors = parse_watch_list([{**site, "extra": True}])
+        self.assertEqual((watch_list, errors), ([{**site, "max_body_bytes": None}], []))
+        _, errors = parse_watch_list({"url": "https://example.com"})
+        self.assertEqual(errors[0]["index"], None)
+
+    async def test_body_limit(self) -> None:
+        """The body limit of a site is optional and bounded"""
+        site = {"url": "https://example.com", "regexp": "a", "check_interval_sec": 5}
+        watch_list, _ = parse_watch_list([{**site, "max_body_bytes": 4096}])
+        self.assertEqual(watch_list[0]["max_body_bytes"], 4096)
+        for value, error in [
+            (10, "max_body_bytes must be between 1024 and 1073741824"),
+            ("4096", "max_body_bytes must be an integer"),
+        ]:
+            _, errors = parse_watch_list([{**site, "max_body_bytes": value}])
+            self.assertEqual(errors[0]["error"], error)